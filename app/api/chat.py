@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, validator
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -6,17 +6,21 @@ from sqlalchemy import select
 from pyrate_limiter import Duration, Limiter, Rate
 from fastapi_limiter.depends import RateLimiter
 from app.auth.api_key import require_tenant_api_key
+from app.auth.key_cache import api_key_digest, verified_key_cache
+from app.auth.tenant_context import TenantContext, tenant_context_cache
 from app.db.session import get_db
 from app.db.models import KnowledgeBaseChunk, KnowledgeBaseEmbedding, Conversation, Message, LLMUsage, AnalyticsEvent
 from app.core.llm import get_embedding, get_chat_completion
 from app.core.plan_limits import get_plan_limits, PlanLimits
+from app.core.deadline import Deadline
 from app.usage.throttler import enforce_plan_limits
 from app.prompt.builder import PromptBuilder
-from app.tasks.background import persist_chat_response
+from app.services.chat_stream import schedule_chat_persistence
 from typing import Tuple
+import dataclasses
 import uuid
 
-from app.services.chat_service import chat_service
+from app.services.chat_service import chat_service, EmbeddingPrefetch
 from app.db.models import Tenant, ApiKey
 
 router = APIRouter()
@@ -42,25 +46,120 @@ class ChatResponse(BaseModel):
     session_id: str | None = None
 
 
+def get_request_deadline() -> Deadline:
+    """
+    Dependency that starts the request's time budget. Declared before the
+    auth/usage dependencies so their time counts against it too.
+    """
+    return Deadline.from_settings()
+
+
+async def prefetch_query_embedding(
+    request: Request,
+    deadline: Deadline = Depends(get_request_deadline),
+):
+    """
+    Dependency that starts the query embedding (cache lookup or OpenAI call)
+    speculatively, so it overlaps with the auth/plan/credit gate instead of
+    running after it. Declare it before `check_usage`.
+
+    The body has already been read by FastAPI at this point, so peeking at
+    it is free. If the gate (or body validation) rejects the request, the
+    prefetch is discarded.
+
+    The auth gate has not run yet, so only requests whose ASST-API-KEY is
+    already known to be valid (in the tenant-context or verified-key cache)
+    are prefetched. Anything else waits for the gate: unauthenticated
+    traffic never spends upstream quota.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    query = (body.get("query") or body.get("message")) if isinstance(body, dict) else None
+
+    # Cheap sanity checks so obviously invalid bodies don't cost an upstream call
+    if not isinstance(query, str) or not query.strip() or len(query) > 4000:
+        yield None
+        return
+    if not await _is_verified_key(request.headers.get("ASST-API-KEY")):
+        yield None
+        return
+
+    prefetch = chat_service.prefetch_embedding(query.strip(), deadline)
+    try:
+        yield prefetch
+    except BaseException:
+        prefetch.discard()
+        raise
+
+
+async def _is_verified_key(asst_api_key: str | None) -> bool:
+    """Whether the presented key already passed the auth gate recently (cache lookups only)."""
+    key_digest = api_key_digest(asst_api_key) if asst_api_key else None
+    if not key_digest:
+        return False
+    if await tenant_context_cache.get(key_digest) is not None:
+        return True
+    cached_key = await verified_key_cache.get(key_digest)
+    return bool(cached_key and cached_key.get("is_active"))
+
+
+async def _usage_gate(
+    request: Request,
+    tenant_data: Tuple[Tenant, ApiKey],
+    db: AsyncSession,
+    reserve: bool,
+) -> Tuple[Tenant, ApiKey, PlanLimits]:
+    tenant, api_key = tenant_data
+
+    # Load plan limits (for feature-level constraints: model, tokens, chunks)
+    context = getattr(request.state, "tenant_context", None)
+    if isinstance(context, TenantContext) and context.plan_limits is not None:
+        plan_limits = context.plan_limits
+    else:
+        plan_limits = await get_plan_limits(
+            tenant, db, version=context.version if isinstance(context, TenantContext) else None
+        )
+        if isinstance(context, TenantContext):
+            await tenant_context_cache.put(dataclasses.replace(context, plan_limits=plan_limits))
+
+    # Enforce all usage gates (now includes credit checks)
+    request.state.credit_hold_id = await enforce_plan_limits(
+        tenant, plan_limits, db,
+        credit_balance=getattr(request.state, "credit_balance", None),
+        reserve=reserve,
+    )
+
+    return tenant, api_key, plan_limits
+
+
 async def check_usage(
+    request: Request,
     tenant_data: Tuple[Tenant, ApiKey] = Depends(require_tenant_api_key),
     db: AsyncSession = Depends(get_db),
 ) -> Tuple[Tenant, ApiKey, PlanLimits]:
     """
     Dependency that:
     1. Loads plan limits from Plan.features for this tenant
-    2. Enforces usage gates (trial expiry, credits) via throttler
+       (from the cached TenantContext when the auth gate left one)
+    2. Enforces usage gates (trial expiry, credits) via throttler, leaving
+       the credit hold id on request.state for persistence to settle
     3. Returns (tenant, api_key, plan_limits) for downstream use
     """
-    tenant, api_key = tenant_data
+    return await _usage_gate(request, tenant_data, db, reserve=True)
 
-    # Load plan limits (for feature-level constraints: model, tokens, chunks)
-    plan_limits = await get_plan_limits(tenant, db)
 
-    # Enforce all usage gates (now includes credit checks)
-    await enforce_plan_limits(tenant, plan_limits, db)
-
-    return tenant, api_key, plan_limits
+async def check_access(
+    request: Request,
+    tenant_data: Tuple[Tenant, ApiKey] = Depends(require_tenant_api_key),
+    db: AsyncSession = Depends(get_db),
+) -> Tuple[Tenant, ApiKey, PlanLimits]:
+    """
+    Same gates as check_usage without holding credits, for requests that
+    are never charged (e.g. the widget config fetch).
+    """
+    return await _usage_gate(request, tenant_data, db, reserve=False)
 
 # Apply rate limiting: 10 requests per 60 seconds
 @router.post(
@@ -70,13 +169,19 @@ async def check_usage(
 )
 async def chat(
     payload: ChatRequest,
+    request: Request,
     response: Response,
+    deadline: Deadline = Depends(get_request_deadline),
+    embedding_prefetch: EmbeddingPrefetch | None = Depends(prefetch_query_embedding),
     tenant_data: Tuple[Tenant, ApiKey, PlanLimits] = Depends(check_usage),
     db: AsyncSession = Depends(get_db),
 ):
     tenant, api_key, plan_limits = tenant_data
 
     if payload.stream:
+        # Clients asking for SSE get status/sources/done events around the
+        # tokens; everyone else keeps the plain-text token stream.
+        event_stream = "text/event-stream" in request.headers.get("accept", "")
         return StreamingResponse(
             chat_service.get_streaming_response(
                 db=db,
@@ -84,8 +189,16 @@ async def chat(
                 query=payload.query,
                 session_id=payload.session_id,
                 plan_limits=plan_limits,
+                # Lets the generator cancel the upstream stream on tab close
+                is_disconnected=request.is_disconnected,
+                event_stream=event_stream,
+                deadline=deadline,
+                embedding_prefetch=embedding_prefetch,
+                credit_hold_id=getattr(request.state, "credit_hold_id", None),
             ),
-            media_type="text/plain",
+            media_type="text/event-stream" if event_stream else "text/plain",
+            # Stop reverse proxies from buffering the early events
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
 
     answer, session_id, persistence_data = await chat_service.get_response(
@@ -94,14 +207,13 @@ async def chat(
         query=payload.query,
         session_id=payload.session_id,
         plan_limits=plan_limits,
+        deadline=deadline,
+        embedding_prefetch=embedding_prefetch,
     )
 
-    # Schedule persistence in the background via Celery
-    persist_chat_response.delay(
-        tenant_id_str=str(tenant.id),
-        session_id=session_id,
-        data=persistence_data,
-    )
+    # Schedule persistence in the background (Celery or the turn stream)
+    persistence_data["credit_hold_id"] = getattr(request.state, "credit_hold_id", None)
+    schedule_chat_persistence(tenant.id, session_id, persistence_data)
 
     # Expose cost to logging middleware
     response.headers["X-Total-Cost"] = "{:.6f}".format(persistence_data.get("cost_usd", 0.0))
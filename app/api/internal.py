@@ -1,5 +1,17 @@
-from fastapi import APIRouter, HTTPException, Query, Header, status
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.widget_service import widget_service
+from app.auth.key_cache import verified_key_cache
+from app.auth.tenant_context import tenant_context_cache
+from app.core.security import api_key_verifier
+from app.tasks.publisher import task_publisher
+from app.core.plan_limits import plan_limits_cache
+from app.db.models import ApiKey, Tenant
+from app.db.session import get_db, pool_stats
+from app.db.replica import read_replica
 from app.core.logging import logger
 from app.core.config import settings
 
@@ -7,7 +19,7 @@ router = APIRouter()
 
 @router.post("/cache-invalidate")
 async def invalidate_widget_cache(
-    tenant_id: str = Query(..., description="The UUID of the tenant whose cache should be invalidated"),
+    tenant_id: uuid.UUID = Query(..., description="The UUID of the tenant whose cache should be invalidated"),
     internal_cache_header: str = Header(..., alias="INTERNAL_CACHE_HEADER")
 ):
     """
@@ -21,9 +33,121 @@ async def invalidate_widget_cache(
             detail="Unauthorized"
         )
     try:
-        await widget_service.invalidate_cache(tenant_id)
+        await widget_service.invalidate_cache(str(tenant_id))
+        # Domain whitelist lives in the same settings
+        await tenant_context_cache.invalidate(str(tenant_id))
         logger.info(f"Internal cache invalidation triggered for tenant {tenant_id}")
         return {"status": "success", "message": f"Cache invalidated for tenant {tenant_id}"}
     except Exception as e:
         logger.error(f"Failed to invalidate cache for tenant {tenant_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error during cache invalidation")
+
+
+@router.post("/api-key-revoke")
+async def revoke_api_key(
+    key_id: uuid.UUID = Query(..., description="The UUID of the API key that was revoked or rotated"),
+    internal_cache_header: str = Header(..., alias="INTERNAL_CACHE_HEADER"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Internal endpoint to evict a revoked API key from the verified-key cache.
+    The management server must call this whenever a key is deactivated.
+    The owning tenant is looked up in the database, so its auth snapshots
+    are invalidated even after the key's cache entries have expired.
+    """
+    if not settings.INTERNAL_CACHE_HEADER or internal_cache_header != settings.INTERNAL_CACHE_HEADER:
+        logger.warning(f"Unauthorized API key revocation attempt for key {key_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized"
+        )
+    try:
+        cached_tenant_id = await verified_key_cache.evict_key(str(key_id))
+        tenant_id = (await db.execute(
+            select(ApiKey.tenant_id).where(ApiKey.id == key_id)
+        )).scalar_one_or_none() or cached_tenant_id
+        if tenant_id:
+            await tenant_context_cache.invalidate(str(tenant_id))
+        else:
+            logger.warning(f"Revoked API key {key_id} not found; no tenant context to invalidate")
+        logger.info(f"Internal API key revocation triggered for key {key_id}")
+        return {"status": "success", "message": f"Cache evicted for key {key_id}"}
+    except Exception as e:
+        logger.error(f"Failed to evict API key {key_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error during key revocation")
+
+
+@router.post("/tenant-context-invalidate")
+async def invalidate_tenant_context(
+    tenant_id: uuid.UUID = Query(..., description="The UUID of the tenant whose auth snapshot should be invalidated"),
+    internal_cache_header: str = Header(..., alias="INTERNAL_CACHE_HEADER")
+):
+    """
+    Internal endpoint to invalidate the cached tenant security context.
+    This should be called by the management server when a tenant's keys,
+    plan, limits override, trial state or domains change.
+    """
+    if not settings.INTERNAL_CACHE_HEADER or internal_cache_header != settings.INTERNAL_CACHE_HEADER:
+        logger.warning(f"Unauthorized tenant context invalidation attempt for tenant {tenant_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized"
+        )
+    try:
+        await tenant_context_cache.invalidate(str(tenant_id))
+        return {"status": "success", "message": f"Tenant context invalidated for tenant {tenant_id}"}
+    except Exception as e:
+        logger.error(f"Failed to invalidate tenant context for tenant {tenant_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error during tenant context invalidation")
+
+
+@router.post("/plan-limits-invalidate")
+async def invalidate_plan_limits(
+    plan_id: uuid.UUID = Query(..., description="The UUID of the plan whose features changed"),
+    internal_cache_header: str = Header(..., alias="INTERNAL_CACHE_HEADER"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Internal endpoint to signal a plan change. Bumps the plan version so
+    every worker re-parses its limits, and invalidates the auth snapshots
+    of tenants on that plan.
+    """
+    if not settings.INTERNAL_CACHE_HEADER or internal_cache_header != settings.INTERNAL_CACHE_HEADER:
+        logger.warning(f"Unauthorized plan limits invalidation attempt for plan {plan_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized"
+        )
+    try:
+        await plan_limits_cache.invalidate_plan(str(plan_id))
+        tenant_ids = (await db.execute(
+            select(Tenant.id).where(Tenant.plan_id == plan_id)
+        )).scalars().all()
+        for tenant_id in tenant_ids:
+            await tenant_context_cache.invalidate(str(tenant_id))
+        logger.info(f"Internal plan limits invalidation for plan {plan_id} ({len(tenant_ids)} tenants)")
+        return {"status": "success", "message": f"Plan limits invalidated for plan {plan_id}"}
+    except Exception as e:
+        logger.error(f"Failed to invalidate plan limits for plan {plan_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error during plan limits invalidation")
+
+
+@router.get("/metrics")
+async def internal_metrics(
+    internal_cache_header: str = Header(..., alias="INTERNAL_CACHE_HEADER")
+):
+    """
+    Internal endpoint exposing in-process hot-path counters for this worker.
+    """
+    if not settings.INTERNAL_CACHE_HEADER or internal_cache_header != settings.INTERNAL_CACHE_HEADER:
+        logger.warning("Unauthorized metrics access attempt")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized"
+        )
+    return {
+        "api_key_verifier": api_key_verifier.stats(),
+        "task_publisher": task_publisher.stats(),
+        "db_pool": pool_stats(),
+        "db_replica": read_replica.stats(),
+    }
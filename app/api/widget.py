@@ -2,19 +2,28 @@ from fastapi import APIRouter, Depends, Request, Response
 from pyrate_limiter import Duration, Limiter, Rate
 from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.api.chat import check_usage
+from app.api.chat import check_access, check_usage, get_request_deadline, prefetch_query_embedding
+from app.core.deadline import Deadline
 from app.db.session import get_db
 from app.schemas.widget import WidgetConfigResponse, WidgetChatRequest, WidgetChatResponse
-from app.services.chat_service import chat_service
+from app.services.chat_service import chat_service, EmbeddingPrefetch
 from app.services.widget_service import widget_service
 from app.middleware.anti_abuse import validate_domain_whitelist
+from app.auth.domain_matcher import DomainMatcher
 from app.db.models import Tenant, ApiKey
-from app.tasks.background import persist_chat_response
+from app.services.chat_stream import schedule_chat_persistence
 from app.core.plan_limits import PlanLimits
-from typing import Tuple
+from typing import Optional, Tuple
 
 router = APIRouter()
 
+
+def _tenant_domain_matcher(request: Request) -> Optional[DomainMatcher]:
+    """The compiled matcher the auth gate validated against (None for portal requests)."""
+    context = getattr(request.state, "tenant_context", None)
+    return getattr(context, "domain_matcher", None)
+
+
 @router.get(
     "/config",
     response_model=WidgetConfigResponse,
@@ -22,7 +31,7 @@ router = APIRouter()
 )
 async def get_widget_config(
     request: Request,
-    auth_data: Tuple[Tenant, ApiKey, PlanLimits] = Depends(check_usage),
+    auth_data: Tuple[Tenant, ApiKey, PlanLimits] = Depends(check_access),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -41,8 +50,7 @@ async def get_widget_config(
         domain = urlparse(target_url).netloc
 
     # Domain whitelist check
-    whitelisted_domains = getattr(tenant, "whitelisted_domains", None)
-    await validate_domain_whitelist(request, whitelisted_domains)
+    await validate_domain_whitelist(request, _tenant_domain_matcher(request))
 
     config = await widget_service.get_config(db=db, tenant=tenant, domain=domain)
     return config
@@ -57,6 +65,8 @@ async def widget_chat(
     request: Request,
     response: Response,
     chat_req: WidgetChatRequest,
+    deadline: Deadline = Depends(get_request_deadline),
+    embedding_prefetch: Optional[EmbeddingPrefetch] = Depends(prefetch_query_embedding),
     tenant_data: Tuple[Tenant, ApiKey, PlanLimits] = Depends(check_usage),
     db: AsyncSession = Depends(get_db),
 ):
@@ -67,8 +77,7 @@ async def widget_chat(
     tenant, api_key, plan_limits = tenant_data
 
     # 1. Domain whitelist check
-    whitelisted_domains = getattr(tenant, "whitelisted_domains", None)
-    await validate_domain_whitelist(request, whitelisted_domains)
+    await validate_domain_whitelist(request, _tenant_domain_matcher(request))
 
     # 2. Use the shared ChatService for communication (plan limits applied)
     answer, session_id, persistence_data = await chat_service.get_response(
@@ -77,14 +86,13 @@ async def widget_chat(
         query=chat_req.message,
         session_id=chat_req.session_id,
         plan_limits=plan_limits,
+        deadline=deadline,
+        embedding_prefetch=embedding_prefetch,
     )
 
-    # 3. Schedule persistence in the background via Celery
-    persist_chat_response.delay(
-        tenant_id_str=str(tenant.id),
-        session_id=session_id,
-        data=persistence_data,
-    )
+    # 3. Schedule persistence in the background (Celery or the turn stream)
+    persistence_data["credit_hold_id"] = getattr(request.state, "credit_hold_id", None)
+    schedule_chat_persistence(tenant.id, session_id, persistence_data)
 
     # 4. Expose cost to logging middleware
     response.headers["X-Total-Cost"] = "{:.6f}".format(persistence_data["cost_usd"])
@@ -1,9 +1,20 @@
+import dataclasses
+import uuid
+from datetime import datetime, timezone
 from fastapi import Header, HTTPException, Depends, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
+from sqlalchemy.orm.attributes import set_committed_value
 from app.db.session import get_db
 from app.db.models import ApiKey, Tenant, TenantConfig
-from app.core.security import verify_api_key
+from app.core.security import verify_api_key, api_key_verifier, VerifierSaturated
+from app.auth.key_cache import api_key_digest, verified_key_cache
+from app.auth.tenant_context import TenantContext, tenant_context_cache
+from app.auth.domain_matcher import DomainMatcher
+from app.auth.gate_query import GateRow, load_tenant_gate
+from app.auth.key_usage import key_usage_buffer, mark_installed_once
+from app.core.plan_limits import resolve_plan_limits
+from app.services.credit_service import summarize_credit_balance
 from urllib.parse import urlparse
 from app.schema import TenantOut
 from app.core.config import settings
@@ -16,6 +27,9 @@ async def require_tenant_api_key(
     """
     Validate tenant API key and return (Tenant, ApiKey).
     Also tracks first-time usage and updates last_used_at.
+
+    Steady state is served from the cached TenantContext (no Postgres);
+    the snapshot is left on request.state.tenant_context for check_usage.
     """
     if not asst_api_key:
         raise HTTPException(
@@ -24,48 +38,92 @@ async def require_tenant_api_key(
             headers={"X-Auth-Error": "AUTH_01"}
         )
     
-    # Extract key prefix for efficient lookup (first 12 chars, e.g., "sk_live_abc1")
-    # This allows us to use an indexed column instead of fetching all keys
-    key_prefix = asst_api_key[:12] if len(asst_api_key) >= 12 else asst_api_key
-    
-    # Lookup API Keys by prefix (much more efficient than fetching all)
-    result = await db.execute(
-        select(ApiKey).where(
-            ApiKey.key_prefix == key_prefix,
-            ApiKey.is_active == True
+    key_digest = api_key_digest(asst_api_key)
+    context = await tenant_context_cache.get(key_digest)
+    if context and not context.is_installed:
+        # First-call tracking still needs the real rows
+        context = None
+    context_version = None
+    loaded_plan_limits = None
+
+    gate_row = None
+    if context:
+        tenant, api_key_record = context.tenant(), context.api_key()
+    elif settings.TENANT_GATE_LOADER == "single":
+        tenant, api_key_record, gate_row, context_version = await _authenticate_single_query(
+            db, asst_api_key, key_digest
         )
-    )
-    api_keys = result.scalars().all()
-    
-    # Verify hash for matching prefix keys
-    api_key_record = None
-    for key in api_keys:
-        if verify_api_key(asst_api_key, key.api_key_hash):
-            api_key_record = key
-            break
-    
-    # Generic error message to prevent enumeration (FINDING-010)
-    if not api_key_record:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authentication failed",
-            headers={"X-Auth-Error": "AUTH_02"}
+        loaded_plan_limits = await resolve_plan_limits(
+            gate_row.tenant_id, gate_row.plan_id, gate_row.plan_updated_at,
+            gate_row.override_updated_at, gate_row.plan_inputs,
         )
+        request.state.credit_balance = summarize_credit_balance(*gate_row.credit_balance)
+    else:
+        # Verified-key cache: a recently verified key skips argon2 entirely
+        api_key_record = None
+        cached_key = await verified_key_cache.get(key_digest)
+        if cached_key and cached_key.get("is_active"):
+            result = await db.execute(
+                select(ApiKey).where(
+                    ApiKey.id == uuid.UUID(cached_key["key_id"]),
+                    ApiKey.is_active == True
+                )
+            )
+            api_key_record = result.scalars().first()
+            if not api_key_record:
+                # Deactivated since it was cached
+                await verified_key_cache.evict(key_digest)
+
+        if not api_key_record:
+            # Extract key prefix for efficient lookup (first 12 chars, e.g., "sk_live_abc1")
+            # This allows us to use an indexed column instead of fetching all keys
+            key_prefix = asst_api_key[:12] if len(asst_api_key) >= 12 else asst_api_key
+        
+            # Lookup API Keys by prefix (much more efficient than fetching all)
+            result = await db.execute(
+                select(ApiKey).where(
+                    ApiKey.key_prefix == key_prefix,
+                    ApiKey.is_active == True
+                )
+            )
+            api_keys = result.scalars().all()
         
-    # Get the Tenant (with eager loading to avoid N+1)
-    tenant_result = await db.execute(
-        select(Tenant).where(Tenant.id == api_key_record.tenant_id)
-    )
-    tenant = tenant_result.scalars().first()
+            # Verify hash for matching prefix keys (cold miss: argon2 on the bounded pool)
+            for key in api_keys:
+                if await _verify_candidate(asst_api_key, key.api_key_hash, key_prefix):
+                    api_key_record = key
+                    break
+
+            if api_key_record:
+                await verified_key_cache.set(key_digest, api_key_record.id, api_key_record.tenant_id)
     
-    if not tenant or not api_key_record.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authentication failed",
-            headers={"X-Auth-Error": "AUTH_03"}
+        # Generic error message to prevent enumeration (FINDING-010)
+        if not api_key_record:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authentication failed",
+                headers={"X-Auth-Error": "AUTH_02"}
+            )
+
+        # Read the version stamp before the tenant row so a concurrent
+        # invalidation can never be masked by the snapshot built below
+        context_version = await tenant_context_cache.current_version(api_key_record.tenant_id)
+        
+        # Get the Tenant (with eager loading to avoid N+1)
+        tenant_result = await db.execute(
+            select(Tenant).where(Tenant.id == api_key_record.tenant_id)
         )
+        tenant = tenant_result.scalars().first()
+    
+        if not tenant or not api_key_record.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authentication failed",
+                headers={"X-Auth-Error": "AUTH_03"}
+            )
 
     # --- Domain Validation ---
+    loaded_domains = None
     request_origin = request.headers.get("origin") or request.headers.get("referer")
     
     # Internal portal domains that bypass tenant-specific domain validation
@@ -113,41 +171,34 @@ async def require_tenant_api_key(
              # In a production environment with high abuse, we might block this:
              # raise HTTPException(status_code=403, detail="Access denied for non-browser clients")
 
-        # Fetch configured domains for this tenant
-        config_result = await db.execute(
-            select(TenantConfig).where(
-                TenantConfig.tenant_id == tenant.id,
-                TenantConfig.domain != None
+        if context and context.domain_matcher is not None:
+            domain_matcher = context.domain_matcher
+        elif gate_row is not None:
+            domain_matcher = DomainMatcher.compile(gate_row.domains)
+            loaded_domains = domain_matcher.patterns
+        else:
+            # Fetch configured domains for this tenant
+            config_result = await db.execute(
+                select(TenantConfig).where(
+                    TenantConfig.tenant_id == tenant.id,
+                    TenantConfig.domain != None
+                )
             )
-        )
-        tenant_configs = config_result.scalars().all()
-        configured_domains = [tc.domain.lower() for tc in tenant_configs if tc.domain]
-        
-        # Normalize configured domains (strip 'www.' if present)
-        normalized_configured_domains = []
-        for d in configured_domains:
-            d_parsed = urlparse(d if "://" in d else f"https://{d}")
-            d_hostname = d_parsed.hostname or d
-            if d_hostname.startswith("www."):
-                d_hostname = d_hostname[4:]
-            normalized_configured_domains.append(d_hostname)
+            tenant_configs = config_result.scalars().all()
+            # Normalized once into exact hosts + a wildcard trie
+            domain_matcher = DomainMatcher.compile(tc.domain for tc in tenant_configs if tc.domain)
+            loaded_domains = domain_matcher.patterns
         
         # If no domains are configured, the user specified "allow request only to those ... which has domain"
-        if not normalized_configured_domains:
+        if not domain_matcher:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Authentication failed",
                 headers={"X-Auth-Error": "AUTH_04"}
             )
 
-        # Check for match (case-insensitive)
-        is_domain_allowed = False
-        if request_domain:
-            request_domain = request_domain.lower()
-            if request_domain in normalized_configured_domains:
-                is_domain_allowed = True
-                
-        if not is_domain_allowed:
+        # Exact host or "*.domain" wildcard, O(labels)
+        if not domain_matcher.matches(request_domain):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Authentication failed",
@@ -155,19 +206,97 @@ async def require_tenant_api_key(
             )
     # --- End Domain Validation ---
 
+    if context:
+        # Warm path: the snapshot is already stored; only fill in domains
+        # the first time a non-portal request needs them.
+        if loaded_domains is not None:
+            context = dataclasses.replace(context, domains=loaded_domains)
+            await tenant_context_cache.put(context)
+        request.state.tenant_context = context
+        key_usage_buffer.touch(api_key_record.id)
+        return tenant, api_key_record
+
     # Tracking Logic
-    # 1. Update last_used_at for the API Key
-    api_key_record.last_used_at = func.now()
+    # 1. last_used_at is written behind in batches; only reflect it in memory
+    set_committed_value(api_key_record, "last_used_at", key_usage_buffer.touch(api_key_record.id))
 
-    # 2. Track first-time usage for the Tenant
+    # 2. Track first-time usage for the Tenant (once-only conditional UPDATE)
     if not tenant.is_installed:
-        tenant.is_installed = True
-        tenant.first_api_call_at = func.now()
         # Capture the URL where the API/Widget was first called
-        tenant.installation_url = request_origin
-    
-    # Use flush so the updates are sent to the DB but not committed yet.
-    # The route handler (which uses this dependency) will handle the commit.
-    await db.flush()
+        await mark_installed_once(db, tenant.id, request_origin)
+        set_committed_value(tenant, "is_installed", True)
+        set_committed_value(tenant, "first_api_call_at", datetime.now(timezone.utc))
+        set_committed_value(tenant, "installation_url", request_origin)
+
+    # Snapshot for subsequent requests (only cached when invalidations can reach us)
+    if key_digest:
+        context = TenantContext.build(
+            key_digest, tenant, api_key_record, context_version,
+            domains=loaded_domains, plan_limits=loaded_plan_limits,
+        )
+        await tenant_context_cache.put(context)
+        request.state.tenant_context = context
 
     return tenant, api_key_record
+
+
+async def _verify_candidate(asst_api_key: str, api_key_hash: str, key_prefix: str) -> bool:
+    """argon2 check on the bounded pool; 503 when the pool is saturated."""
+    try:
+        return await api_key_verifier.run(verify_api_key, asst_api_key, api_key_hash)
+    except VerifierSaturated:
+        from app.core.logging import logger
+        logger.warning("api_key_verifier_saturated", key_prefix=key_prefix)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+
+async def _authenticate_single_query(
+    db: AsyncSession,
+    asst_api_key: str,
+    key_digest: str | None,
+) -> tuple[Tenant, ApiKey, GateRow, int | None]:
+    """
+    Cold path with TENANT_GATE_LOADER="single": key candidates, tenant,
+    domains, plan and credit balance in one round trip.
+    Returns (tenant, api_key, gate_row, context_version).
+    """
+    key_prefix = asst_api_key[:12] if len(asst_api_key) >= 12 else asst_api_key
+    context_version = None
+
+    cached_key = await verified_key_cache.get(key_digest)
+    if cached_key and cached_key.get("is_active"):
+        # Tenant is known up front, so the version stamp can be read before
+        # the rows it will describe
+        context_version = await tenant_context_cache.current_version(cached_key["tenant_id"])
+        rows = await load_tenant_gate(db, key_id=uuid.UUID(cached_key["key_id"]))
+        gate_row = rows[0] if rows else None
+        if not gate_row:
+            await verified_key_cache.evict(key_digest)
+            context_version = None
+    else:
+        gate_row = None
+
+    if not gate_row:
+        # First sight of this key: the tenant is only known after the query,
+        # so no version stamp can be trusted and the snapshot is not cached.
+        for row in await load_tenant_gate(db, key_prefix=key_prefix):
+            if await _verify_candidate(asst_api_key, row.api_key_hash, key_prefix):
+                gate_row = row
+                break
+        if gate_row:
+            await verified_key_cache.set(key_digest, gate_row.key_id, gate_row.tenant_id)
+
+    # Generic error message to prevent enumeration (FINDING-010)
+    if not gate_row:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication failed",
+            headers={"X-Auth-Error": "AUTH_02"}
+        )
+
+    tenant, api_key_record = gate_row.attach(db)
+    return tenant, api_key_record, gate_row, context_version
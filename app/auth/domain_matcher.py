@@ -0,0 +1,88 @@
+"""
+app/auth/domain_matcher.py
+
+Compiled per-tenant domain whitelist.
+
+Configured domains are normalised once into:
+  - a hash set of exact hosts ("example.com")
+  - a reversed-label trie for wildcard patterns ("*.example.com" is stored
+    as com -> example -> *), matching any subdomain depth but not the apex
+
+so checking a request host costs O(labels) no matter how many domains a
+tenant has. The matcher is built with the TenantContext snapshot, so it is
+recompiled only when the tenant's config version changes.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+_WILDCARD = "*"
+
+
+def normalize_host(value: str) -> str:
+    """Bare lowercase hostname: no scheme, port, path, trailing dot or 'www.'."""
+    value = value.strip().lower()
+    if not value:
+        return ""
+    parsed = urlparse(value if "://" in value else f"https://{value}")
+    host = (parsed.hostname or value).rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+class DomainMatcher:
+    __slots__ = ("patterns", "_exact", "_trie")
+
+    def __init__(self, patterns: Tuple[str, ...], exact: FrozenSet[str], trie: Dict):
+        self.patterns = patterns
+        self._exact = exact
+        self._trie = trie
+
+    @classmethod
+    def compile(cls, domains: Iterable[str], include_subdomains: bool = False) -> "DomainMatcher":
+        """
+        Build a matcher from configured domains. With `include_subdomains`,
+        every plain entry also admits its subdomains (legacy whitelist rule).
+        """
+        patterns = []
+        exact = set()
+        trie: Dict = {}
+        for domain in domains:
+            if not domain:
+                continue
+            wildcard = domain.strip().startswith("*.")
+            host = normalize_host(domain.strip()[2:] if wildcard else domain)
+            if not host:
+                continue
+            patterns.append(f"*.{host}" if wildcard else host)
+            if not wildcard:
+                exact.add(host)
+            if wildcard or include_subdomains:
+                node = trie
+                for label in reversed(host.split(".")):
+                    node = node.setdefault(label, {})
+                node[_WILDCARD] = True
+        return cls(tuple(dict.fromkeys(patterns)), frozenset(exact), trie)
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def matches(self, host: Optional[str]) -> bool:
+        if not host:
+            return False
+        host = normalize_host(host)
+        if host in self._exact:
+            return True
+        node = self._trie
+        labels = host.split(".")
+        for remaining in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[remaining])
+            if node is None:
+                return False
+            # A wildcard here admits the host if at least one label is left over
+            if remaining > 0 and node.get(_WILDCARD):
+                return True
+        return False
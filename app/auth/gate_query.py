@@ -0,0 +1,157 @@
+"""
+app/auth/gate_query.py
+
+Single round-trip loader for the auth + throttle gate.
+
+On a tenant-context cache miss the sequential path issues one query each
+for the key candidates, the tenant, its domains, the plan (and limit
+overrides) and the credit balance. load_tenant_gate() returns all of them in one statement, one row
+per candidate key, so a cold request costs a single Postgres round trip.
+
+Selected with TENANT_GATE_LOADER = "single" (see scripts/bench_tenant_gate.py
+for a comparison against the sequential path).
+
+The query always runs on the primary, even with a read replica configured.
+It decides whether the key is active and the tenant exists, so a lagging
+replica would keep accepting keys deactivated within DB_REPLICA_MAX_LAG_S
+and reject newly created ones.
+"""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.db.models import ApiKey, Tenant
+
+_GATE_SQL = """
+SELECT
+    k.id              AS key_id,
+    k.api_key_hash    AS api_key_hash,
+    t.id              AS tenant_id,
+    t.name            AS tenant_name,
+    t.plan_id         AS plan_id,
+    t.is_trial        AS is_trial,
+    t.trial_ends_at   AS trial_ends_at,
+    t.is_installed    AS is_installed,
+    d.domains         AS domains,
+    p.features        AS plan_features,
+    p.updated_at      AS plan_updated_at,
+    o.updated_at      AS override_updated_at,
+    to_jsonb(o)       AS limits_override,
+    c.credits_total   AS credits_total,
+    c.credits_used    AS credits_used
+FROM tenant_api_keys k
+JOIN tenants t ON t.id = k.tenant_id
+LEFT JOIN plans p ON p.id = t.plan_id
+LEFT JOIN tenant_limits_overrides o ON o.tenant_id = t.id
+LEFT JOIN LATERAL (
+    SELECT COALESCE(array_agg(lower(tc.domain)), '{{}}') AS domains
+    FROM tenant_configs tc
+    WHERE tc.tenant_id = t.id AND tc.domain IS NOT NULL
+) d ON true
+LEFT JOIN LATERAL (
+    SELECT COALESCE(SUM(cl.credits_total), 0) AS credits_total,
+           COALESCE(SUM(cl.credits_used), 0)  AS credits_used
+    FROM credit_ledger cl
+    WHERE cl.tenant_id = t.id AND (cl.valid_to IS NULL OR cl.valid_to > now())
+) c ON true
+WHERE k.is_active = true AND {key_filter}
+"""
+
+# Two statements rather than one with optional parameters, so each keeps
+# an index-friendly plan once asyncpg switches to generic plans.
+GATE_BY_PREFIX = text(_GATE_SQL.format(key_filter="k.key_prefix = :key_prefix"))
+GATE_BY_KEY_ID = text(_GATE_SQL.format(key_filter="k.id = :key_id"))
+
+
+@dataclass(frozen=True, slots=True)
+class GateRow:
+    key_id: uuid.UUID
+    api_key_hash: str
+    tenant_id: uuid.UUID
+    tenant_name: str
+    plan_id: Optional[uuid.UUID]
+    is_trial: bool
+    trial_ends_at: Optional[datetime]
+    is_installed: bool
+    domains: Tuple[str, ...]
+    plan_features: Optional[dict]
+    plan_updated_at: Optional[datetime]
+    override_updated_at: Optional[datetime]
+    # TenantLimitsOverride columns as a mapping (None = no override row)
+    limits_override: Optional[dict]
+    credits_total: int
+    credits_used: int
+
+    @property
+    def credit_balance(self) -> Tuple[int, int]:
+        """(credits_total, credits_used) across valid ledger rows."""
+        return self.credits_total, self.credits_used
+
+    async def plan_inputs(self) -> Tuple[Optional[dict], Optional[dict]]:
+        """(plan features, override) loader for resolve_plan_limits — already in the row."""
+        return self.plan_features, self.limits_override
+
+    def attach(self, db: AsyncSession) -> Tuple[Tenant, ApiKey]:
+        """
+        Tenant and ApiKey objects attached to `db` without loading them, so
+        the first-call tracking updates still flush as plain UPDATEs.
+        """
+        tenant = Tenant(
+            id=self.tenant_id,
+            name=self.tenant_name,
+            plan_id=self.plan_id,
+            is_trial=self.is_trial,
+            trial_ends_at=self.trial_ends_at,
+            is_installed=self.is_installed,
+        )
+        api_key = ApiKey(
+            id=self.key_id,
+            tenant_id=self.tenant_id,
+            api_key_hash=self.api_key_hash,
+            is_active=True,
+        )
+        for obj in (tenant, api_key):
+            make_transient_to_detached(obj)
+            db.add(obj)
+        return tenant, api_key
+
+
+async def load_tenant_gate(
+    db: AsyncSession,
+    key_prefix: Optional[str] = None,
+    key_id: Optional[uuid.UUID] = None,
+) -> List[GateRow]:
+    """One row per active candidate key (by id when known, else by prefix)."""
+    if key_id is not None:
+        result = await db.execute(GATE_BY_KEY_ID, {"key_id": key_id})
+    else:
+        result = await db.execute(GATE_BY_PREFIX, {"key_prefix": key_prefix})
+
+    return [
+        GateRow(
+            key_id=row["key_id"],
+            api_key_hash=row["api_key_hash"],
+            tenant_id=row["tenant_id"],
+            tenant_name=row["tenant_name"],
+            plan_id=row["plan_id"],
+            is_trial=bool(row["is_trial"]),
+            trial_ends_at=row["trial_ends_at"],
+            is_installed=bool(row["is_installed"]),
+            domains=tuple(row["domains"] or ()),
+            plan_features=row["plan_features"],
+            plan_updated_at=row["plan_updated_at"],
+            override_updated_at=row["override_updated_at"],
+            limits_override=row["limits_override"],
+            credits_total=int(row["credits_total"]),
+            credits_used=int(row["credits_used"]),
+        )
+        for row in result.mappings().all()
+    ]
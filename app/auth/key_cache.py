@@ -0,0 +1,93 @@
+"""
+app/auth/key_cache.py
+
+Verified-API-key cache.
+
+argon2 verification is deliberately slow, so once a presented key has been
+verified we remember the result for a short TTL:
+
+    auth:key:{hmac}     -> {"key_id", "tenant_id", "is_active"}
+    auth:keyid:{key_id} -> {hmac}   (reverse index for revocation)
+
+Entries are keyed by a keyed HMAC-SHA256 of the presented key; the raw key
+is never written to Redis. Revoking a key through the internal API evicts
+its entry (and its tenant context snapshot) immediately.
+"""
+
+import hashlib
+import hmac
+import uuid
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+KEY_PREFIX = "auth:key:"
+KEY_ID_PREFIX = "auth:keyid:"
+
+
+def api_key_digest(api_key: str) -> Optional[str]:
+    """
+    Keyed HMAC-SHA256 of a presented API key, or None when no secret is
+    configured (caching is then disabled).
+    """
+    secret = settings.API_KEY_CACHE_SECRET or settings.INTERNAL_CACHE_HEADER
+    if not secret:
+        return None
+    return hmac.new(secret.encode(), api_key.encode(), hashlib.sha256).hexdigest()
+
+
+class VerifiedKeyCache:
+    async def get(self, digest: Optional[str]) -> Optional[dict]:
+        """Return the cached verification result for a key digest, if any."""
+        if not digest:
+            return None
+        from app.utils.redis_client import redis_client
+        return await redis_client.get_cache(f"{KEY_PREFIX}{digest}")
+
+    async def set(
+        self,
+        digest: Optional[str],
+        key_id: uuid.UUID,
+        tenant_id: uuid.UUID,
+        is_active: bool = True,
+    ) -> None:
+        """Remember a successful argon2 verification for API_KEY_CACHE_TTL_S."""
+        if not digest:
+            return
+        from app.utils.redis_client import redis_client
+        ttl = settings.API_KEY_CACHE_TTL_S
+        await redis_client.set_cache(
+            f"{KEY_PREFIX}{digest}",
+            {"key_id": str(key_id), "tenant_id": str(tenant_id), "is_active": is_active},
+            ttl=ttl,
+        )
+        await redis_client.set_str(f"{KEY_ID_PREFIX}{key_id}", digest, ttl=ttl)
+
+    async def evict(self, digest: Optional[str]) -> None:
+        if not digest:
+            return
+        from app.utils.redis_client import redis_client
+        await redis_client.delete(f"{KEY_PREFIX}{digest}")
+
+    async def evict_key(self, key_id: str) -> Optional[str]:
+        """
+        Drop the cached verification and tenant context snapshot for a
+        revoked (or rotated) key. Returns the owning tenant id when the key
+        was cached.
+        """
+        from app.auth.tenant_context import CONTEXT_PREFIX
+        from app.utils.redis_client import redis_client
+        digest = await redis_client.get_str(f"{KEY_ID_PREFIX}{key_id}")
+        keys = [f"{KEY_ID_PREFIX}{key_id}"]
+        tenant_id = None
+        if digest:
+            keys += [f"{KEY_PREFIX}{digest}", f"{CONTEXT_PREFIX}{digest}"]
+            cached = await redis_client.get_cache(f"{KEY_PREFIX}{digest}")
+            tenant_id = cached.get("tenant_id") if cached else None
+        await redis_client.delete(*keys)
+        logger.info(f"Evicted verified-key cache for key {key_id}")
+        return tenant_id
+
+
+verified_key_cache = VerifiedKeyCache()
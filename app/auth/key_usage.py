@@ -0,0 +1,121 @@
+"""
+app/auth/key_usage.py
+
+Write-behind tracking for API key usage.
+
+Writing `last_used_at` on every request turned each chat message into an
+UPDATE on the key's row, and hot keys contended on that row lock.
+Requests now only record the latest timestamp per key in memory; a
+background task flushes them every API_KEY_USAGE_FLUSH_S in one batched
+UPDATE. A worker that dies loses at most one interval of timestamps,
+which is acceptable for a "last seen" column.
+
+The first-install transition is a separate once-only path: a conditional
+UPDATE that only matches while `is_installed` is still false.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.models import Tenant
+
+_FLUSH_SQL = text(
+    """
+    UPDATE tenant_api_keys AS k
+    SET last_used_at = v.used_at
+    FROM unnest(CAST(:key_ids AS uuid[]), CAST(:used_at AS timestamptz[])) AS v(id, used_at)
+    WHERE k.id = v.id
+      AND (k.last_used_at IS NULL OR k.last_used_at < v.used_at)
+    """
+)
+
+
+class KeyUsageBuffer:
+    def __init__(self):
+        self._pending: Dict[uuid.UUID, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, key_id: uuid.UUID, used_at: Optional[datetime] = None) -> datetime:
+        """Record a use of `key_id`; only the latest timestamp is kept."""
+        used_at = used_at or datetime.now(timezone.utc)
+        previous = self._pending.get(key_id)
+        if previous is None or previous < used_at:
+            self._pending[key_id] = used_at
+        return used_at
+
+    async def flush(self) -> int:
+        """Write all buffered timestamps in one UPDATE. Returns keys written."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+
+        from app.db.session import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    _FLUSH_SQL,
+                    {"key_ids": list(pending.keys()), "used_at": list(pending.values())},
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to flush API key usage for {len(pending)} keys: {e}")
+            # Put them back for the next round, keeping anything newer
+            for key_id, used_at in pending.items():
+                self.touch(key_id, used_at)
+            return 0
+        return len(pending)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.API_KEY_USAGE_FLUSH_S)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+async def mark_installed_once(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    installation_url: Optional[str],
+) -> bool:
+    """
+    Record the tenant's first API call. The UPDATE only matches while
+    `is_installed` is false, so concurrent first calls cannot overwrite the
+    installation URL. Committed straight away: the request session is
+    otherwise read-only and is never committed by the route.
+    Returns True if this call performed the transition.
+    """
+    result = await db.execute(
+        update(Tenant)
+        .where(Tenant.id == tenant_id, Tenant.is_installed == False)  # noqa: E712
+        .values(
+            is_installed=True,
+            first_api_call_at=datetime.now(timezone.utc),
+            installation_url=installation_url,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+key_usage_buffer = KeyUsageBuffer()
@@ -0,0 +1,224 @@
+"""
+app/auth/tenant_context.py
+
+Cached tenant security context.
+
+Everything the auth gate needs for a given API key — key id, tenant flags,
+allowed domains (with their compiled matcher) and parsed plan limits — is captured in one immutable
+TenantContext snapshot, keyed by the key's HMAC digest (see key_cache.py):
+
+    tenantctx:{hmac}           -> TenantContext (JSON)
+    tenantctx:ver:{tenant_id}  -> version stamp (INCR on invalidation)
+
+Each worker keeps an in-process copy (an LRU of TENANT_CONTEXT_LOCAL_SIZE
+snapshots) that is trusted for TENANT_CONTEXT_LOCAL_TTL_S and then
+revalidated against the version stamp with a single Redis GET. After
+TENANT_CONTEXT_LOCAL_MAX_AGE_S the copy is dropped and reloaded from Redis,
+so a snapshot that has expired or been deleted there stops authenticating
+on every worker. The management server bumps the stamp through the
+internal API whenever keys, plan, limits override, trial state or domains
+change, so stale snapshots are rejected everywhere without a Postgres
+round-trip.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.auth.domain_matcher import DomainMatcher
+from app.core.plan_limits import PlanLimits
+from app.db.models import ApiKey, Tenant
+
+CONTEXT_PREFIX = "tenantctx:"
+VERSION_PREFIX = "tenantctx:ver:"
+
+
+@dataclass(frozen=True, slots=True)
+class TenantContext:
+    key_digest: str
+    key_id: uuid.UUID
+    tenant_id: uuid.UUID
+    # None = Redis was unavailable when built; used for this request only
+    version: Optional[int]
+    tenant_name: str
+    plan_id: Optional[uuid.UUID]
+    is_trial: bool
+    trial_ends_at: Optional[datetime]
+    is_installed: bool
+    # None = not loaded yet (portal requests never need them)
+    domains: Optional[Tuple[str, ...]] = None
+    # None = not loaded yet (filled in by check_usage)
+    plan_limits: Optional[PlanLimits] = None
+    # Compiled from `domains` once per snapshot (never serialized)
+    domain_matcher: Optional[DomainMatcher] = field(default=None, init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.domains is not None:
+            object.__setattr__(self, "domain_matcher", DomainMatcher.compile(self.domains))
+
+    @classmethod
+    def build(
+        cls,
+        key_digest: str,
+        tenant: Tenant,
+        api_key: ApiKey,
+        version: Optional[int],
+        domains: Optional[Tuple[str, ...]] = None,
+        plan_limits: Optional[PlanLimits] = None,
+    ) -> "TenantContext":
+        return cls(
+            key_digest=key_digest,
+            key_id=api_key.id,
+            tenant_id=tenant.id,
+            version=version,
+            tenant_name=tenant.name,
+            plan_id=tenant.plan_id,
+            is_trial=bool(tenant.is_trial),
+            trial_ends_at=tenant.trial_ends_at,
+            is_installed=bool(tenant.is_installed),
+            domains=domains,
+            plan_limits=plan_limits,
+        )
+
+    def tenant(self) -> Tenant:
+        """Detached Tenant carrying the fields the request path reads."""
+        return Tenant(
+            id=self.tenant_id,
+            name=self.tenant_name,
+            plan_id=self.plan_id,
+            is_trial=self.is_trial,
+            trial_ends_at=self.trial_ends_at,
+            is_installed=self.is_installed,
+        )
+
+    def api_key(self) -> ApiKey:
+        """Detached ApiKey (never carries the hash)."""
+        return ApiKey(id=self.key_id, tenant_id=self.tenant_id, is_active=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "key_digest": self.key_digest,
+            "key_id": str(self.key_id),
+            "tenant_id": str(self.tenant_id),
+            "version": self.version,
+            "tenant_name": self.tenant_name,
+            "plan_id": str(self.plan_id) if self.plan_id else None,
+            "is_trial": self.is_trial,
+            "trial_ends_at": self.trial_ends_at.isoformat() if self.trial_ends_at else None,
+            "is_installed": self.is_installed,
+            "domains": list(self.domains) if self.domains is not None else None,
+            # asdict() has the same shape as Plan.features
+            "plan_limits": dataclasses.asdict(self.plan_limits) if self.plan_limits else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TenantContext":
+        return cls(
+            key_digest=data["key_digest"],
+            key_id=uuid.UUID(data["key_id"]),
+            tenant_id=uuid.UUID(data["tenant_id"]),
+            version=int(data["version"]),
+            tenant_name=data["tenant_name"],
+            plan_id=uuid.UUID(data["plan_id"]) if data.get("plan_id") else None,
+            is_trial=bool(data["is_trial"]),
+            trial_ends_at=datetime.fromisoformat(data["trial_ends_at"]) if data.get("trial_ends_at") else None,
+            is_installed=bool(data["is_installed"]),
+            domains=tuple(data["domains"]) if data.get("domains") is not None else None,
+            plan_limits=PlanLimits.from_features(data["plan_limits"]) if data.get("plan_limits") else None,
+        )
+
+
+class TenantContextCache:
+    def __init__(self):
+        # digest -> (context, monotonic time it was last validated, time it was loaded)
+        self._local: "OrderedDict[str, Tuple[TenantContext, float, float]]" = OrderedDict()
+
+    async def current_version(self, tenant_id: uuid.UUID) -> Optional[int]:
+        """
+        Current version stamp for a tenant, or None when Redis is unavailable
+        (invalidations could not reach us, so nothing may be cached).
+        """
+        from app.utils.redis_client import redis_client
+        client = await redis_client.get_client()
+        if client is None:
+            return None
+        try:
+            value = await client.get(f"{VERSION_PREFIX}{tenant_id}")
+        except Exception as e:
+            logger.error(f"Error reading tenant context version for tenant {tenant_id}: {e}")
+            return None
+        return int(value or 0)
+
+    async def get(self, digest: Optional[str]) -> Optional[TenantContext]:
+        if not digest:
+            return None
+
+        local = self._local.get(digest)
+        if local:
+            context, validated_at, loaded_at = local
+            now = time.monotonic()
+            if now - loaded_at < settings.TENANT_CONTEXT_LOCAL_MAX_AGE_S:
+                if now - validated_at < settings.TENANT_CONTEXT_LOCAL_TTL_S:
+                    self._local.move_to_end(digest)
+                    return context
+                if await self.current_version(context.tenant_id) == context.version:
+                    self._remember(digest, context, now, loaded_at)
+                    return context
+            self._local.pop(digest, None)
+
+        from app.utils.redis_client import redis_client
+        data = await redis_client.get_cache(f"{CONTEXT_PREFIX}{digest}")
+        if not data:
+            return None
+        try:
+            context = TenantContext.from_dict(data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Discarding malformed tenant context: {e}")
+            return None
+        version = await self.current_version(context.tenant_id)
+        if version is None or version != context.version:
+            return None
+        now = time.monotonic()
+        self._remember(digest, context, now, now)
+        return context
+
+    async def put(self, context: TenantContext) -> None:
+        if context.version is None:
+            return
+        from app.utils.redis_client import redis_client
+        now = time.monotonic()
+        self._remember(context.key_digest, context, now, now)
+        await redis_client.set_cache(
+            f"{CONTEXT_PREFIX}{context.key_digest}",
+            context.to_dict(),
+            ttl=settings.TENANT_CONTEXT_TTL_S,
+        )
+
+    def _remember(self, digest: str, context: TenantContext, validated_at: float, loaded_at: float) -> None:
+        self._local[digest] = (context, validated_at, loaded_at)
+        self._local.move_to_end(digest)
+        while len(self._local) > settings.TENANT_CONTEXT_LOCAL_SIZE:
+            self._local.popitem(last=False)
+
+    async def invalidate(self, tenant_id: str) -> None:
+        """Bump the tenant's version stamp so every cached snapshot goes stale."""
+        from app.utils.redis_client import redis_client
+        await redis_client.incr(f"{VERSION_PREFIX}{tenant_id}")
+        for digest, (context, _, _) in list(self._local.items()):
+            if str(context.tenant_id) == str(tenant_id):
+                self._local.pop(digest, None)
+        logger.info(f"Invalidated tenant context for tenant {tenant_id}")
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+
+tenant_context_cache = TenantContextCache()
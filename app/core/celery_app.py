@@ -1,4 +1,9 @@
+import json
+from typing import Any, Dict
+
 from celery import Celery
+from celery.signals import celeryd_init
+from kombu import Queue
 from app.core.config import settings
 
 celery_app = Celery(
@@ -7,6 +12,16 @@ celery_app = Celery(
     backend=settings.CELERY_RESULT_BACKEND
 )
 
+# Named queues, each served by its own worker(s) (`-Q persistence`, ...) so
+# a backlog of one kind of work cannot starve the others. "celery" stays as
+# the default queue for anything not routed below.
+QUEUE_CONCURRENCY = {
+    "persistence": settings.CELERY_PERSISTENCE_CONCURRENCY,
+    "analytics": settings.CELERY_ANALYTICS_CONCURRENCY,
+    "maintenance": settings.CELERY_MAINTENANCE_CONCURRENCY,
+    "celery": settings.CELERY_DEFAULT_CONCURRENCY,
+}
+
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
@@ -14,10 +29,64 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
+    # Write-only tasks set ignore_result; whatever is still stored expires
+    result_expires=settings.CELERY_RESULT_EXPIRES_S,
     # Force tasks to be acknowledged only after they succeed or fail
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    task_queues=[Queue(name) for name in QUEUE_CONCURRENCY],
+    task_default_queue="celery",
+    task_routes={
+        "persist_chat_response": {"queue": "persistence"},
+        "flush_chat_turns": {"queue": "persistence"},
+        "flush_credit_charges": {"queue": "persistence"},
+        "flush_analytics_rollups": {"queue": "analytics"},
+        "reconcile_credit_counters": {"queue": "maintenance"},
+        "maintain_history_partitions": {"queue": "maintenance"},
+    },
+    # Periodic jobs (run the worker with -B, or a separate `celery beat`)
+    beat_schedule={
+        "reconcile-credit-counters": {
+            "task": "reconcile_credit_counters",
+            "schedule": float(settings.CREDIT_RECONCILE_INTERVAL_S),
+        },
+        # The flushes still run with batching disabled, to drain anything left queued
+        "flush-credit-charges": {
+            "task": "flush_credit_charges",
+            "schedule": float(settings.CREDIT_CHARGE_FLUSH_S or 60),
+        },
+        "flush-chat-turns": {
+            "task": "flush_chat_turns",
+            "schedule": float(settings.CHAT_PERSIST_FLUSH_S or 60),
+        },
+        "flush-analytics-rollups": {
+            "task": "flush_analytics_rollups",
+            "schedule": float(settings.ANALYTICS_ROLLUP_FLUSH_S),
+        },
+        "maintain-history-partitions": {
+            "task": "maintain_history_partitions",
+            "schedule": float(settings.HISTORY_PARTITION_MAINTENANCE_S),
+        },
+    },
 )
 
+
+def publish_options(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Extra apply_async/send_task options for a call: compress large payloads."""
+    threshold = settings.CELERY_COMPRESS_MIN_BYTES
+    if threshold > 0 and len(json.dumps(kwargs, default=str)) >= threshold:
+        return {"compression": "gzip"}
+    return {}
+
+
+@celeryd_init.connect
+def _configure_concurrency(conf=None, options=None, **kwargs):
+    # Without -c, a worker runs as many processes as its queues' settings add up to
+    if options.get("concurrency"):
+        return
+    queues = options.get("queues") or list(QUEUE_CONCURRENCY)
+    conf.worker_concurrency = sum(QUEUE_CONCURRENCY.get(queue, 1) for queue in queues)
+
+
 # Auto-discover tasks in the app/tasks directory
 celery_app.autodiscover_tasks(["app.tasks"])
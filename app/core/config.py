@@ -38,9 +38,67 @@ class Settings(BaseSettings):
     # Map OPEN_AI_KEY from .env to OPENAI_API_KEY
     OPENAI_API_KEY: Optional[str] = Field(None, validation_alias="OPEN_AI_KEY")
 
+    # Chat pipeline time budget (seconds). Must stay well below gunicorn --timeout.
+    CHAT_REQUEST_TIMEOUT_S: float = 25.0
+
+    # Database connections: "null" (a new connection per session) or "pooled"
+    # (per-process pool sized below, pre-ping, recycle; metrics on
+    # /v1/internal/metrics). DB_EXTERNAL_POOLER turns off asyncpg's prepared
+    # statement caches so either mode works behind a transaction-mode
+    # pgbouncer / Supavisor.
+    DB_POOL_MODE: str = "null"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT_S: float = 10.0
+    DB_POOL_RECYCLE_S: int = 1800
+    DB_EXTERNAL_POOLER: bool = False
+    # Optional read replica for retrieval and plan-limits reads (app/db/replica.py),
+    # used only while its replication lag stays within DB_REPLICA_MAX_LAG_S
+    # (measured every DB_REPLICA_CHECK_S); otherwise reads go to the primary
+    DATABASE_REPLICA_URL: Optional[str] = None
+    DB_REPLICA_MAX_LAG_S: float = 5.0
+    DB_REPLICA_CHECK_S: float = 5.0
+
     # Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/1"
+    # How tasks run their async code: "per_task" (asyncio.run + NullPool per
+    # task) or "persistent" (one loop and pooled engine per worker process)
+    CELERY_TASK_LOOP: str = "per_task"
+    WORKER_DB_POOL_SIZE: int = 2
+    WORKER_DB_MAX_OVERFLOW: int = 2
+    WORKER_DB_POOL_RECYCLE_S: int = 1800
+    # Task enqueue from request handlers: "direct" (task.delay() inline) or
+    # "async" (bounded in-process queue + background publisher, see
+    # app/tasks/publisher.py) with its batch size and disk spill-over
+    TASK_ENQUEUE_MODE: str = "direct"
+    TASK_PUBLISH_QUEUE_SIZE: int = 10000
+    TASK_PUBLISH_BATCH_SIZE: int = 100
+    TASK_SPILL_DIR: str = "logs/task-spill"
+    TASK_SPILL_REPLAY_S: float = 30.0
+    # A spill file claimed for replay longer than this is assumed abandoned
+    TASK_SPILL_CLAIM_TIMEOUT_S: float = 300.0
+    # Worker processes per task queue (see app/core/celery_app.py); a worker
+    # started without -c gets the sum for the queues it consumes (-Q)
+    CELERY_PERSISTENCE_CONCURRENCY: int = 2
+    CELERY_ANALYTICS_CONCURRENCY: int = 1
+    CELERY_MAINTENANCE_CONCURRENCY: int = 1
+    CELERY_DEFAULT_CONCURRENCY: int = 1
+    # Task payloads of at least this many bytes are sent gzip-compressed (0 = never)
+    CELERY_COMPRESS_MIN_BYTES: int = 4096
+    CELERY_RESULT_EXPIRES_S: int = 3600
+    # Analytics: hourly per-tenant/per-model counters kept in Redis and flushed
+    # to analytics_hourly_rollups (app/services/analytics_rollups.py), and the
+    # fraction of turns that still get a raw analytics_events row
+    ANALYTICS_ROLLUP_FLUSH_S: float = 60.0
+    ANALYTICS_ROLLUP_BATCH_SIZE: int = 500
+    ANALYTICS_EVENT_SAMPLE_RATE: float = 1.0
+    # Monthly partitions of messages / llm_usage / analytics_events: months
+    # created ahead, and the floor under the plans' analytics retention
+    # before a month's partitions are dropped (app/services/history_partitions.py)
+    HISTORY_PARTITIONS_AHEAD: int = 3
+    HISTORY_RETENTION_MIN_DAYS: int = 90
+    HISTORY_PARTITION_MAINTENANCE_S: int = 86400
 
     # Digital Ocean Spaces / S3
     SPACES_ACCESS_KEY_ID: Optional[str] = os.getenv("SPACES_ACCESS_KEY_ID")
@@ -77,6 +135,56 @@ class Settings(BaseSettings):
     # Internal Security
     INTERNAL_CACHE_HEADER: Optional[str] = None
 
+    # Verified-API-key cache (HMAC secret falls back to INTERNAL_CACHE_HEADER)
+    API_KEY_CACHE_SECRET: Optional[str] = None
+    API_KEY_CACHE_TTL_S: int = 300
+
+    # Redis credit counter (TTL of an idle counter / ledger reconcile interval)
+    CREDIT_COUNTER_TTL_S: int = 86400
+    CREDIT_RECONCILE_INTERVAL_S: int = 300
+    # Lifetime of an unsettled credit hold placed by the gate
+    CREDIT_HOLD_TTL_S: int = 300
+    # Batched credit charging: flush window (0 = charge each turn directly)
+    # and the most charges applied per ledger transaction
+    CREDIT_CHARGE_FLUSH_S: float = 5.0
+    CREDIT_CHARGE_BATCH_SIZE: int = 500
+    # Batched chat-turn persistence: flush window (0 = one write per turn in
+    # its own task) and the most turns written per transaction
+    CHAT_PERSIST_FLUSH_S: float = 0.0
+    CHAT_PERSIST_BATCH_SIZE: int = 200
+    # Chat persistence transport: "celery" (persist_chat_response task) or
+    # "stream" (Redis Stream + app/stream_worker.py consumers)
+    CHAT_PERSIST_TRANSPORT: str = "celery"
+    CHAT_STREAM_BATCH_SIZE: int = 200
+    CHAT_STREAM_BLOCK_MS: int = 1000
+    CHAT_STREAM_CLAIM_IDLE_MS: int = 60000
+    CHAT_STREAM_CONSUMERS: int = 2
+    # Acked entries are trimmed this often; a longer stream is logged as a backlog
+    CHAT_STREAM_TRIM_S: float = 5.0
+    CHAT_STREAM_BACKLOG_WARN: int = 1_000_000
+    # Cached session -> conversation id map (Redis TTL / in-process entries)
+    CONVERSATION_MAP_TTL_S: int = 3600
+    CONVERSATION_MAP_LOCAL_SIZE: int = 10000
+
+    # Batched write-behind interval for tenant_api_keys.last_used_at
+    API_KEY_USAGE_FLUSH_S: float = 30.0
+
+    # Cold-path auth loader: "sequential" (one query per table) or "single"
+    # (key, tenant, domains, plan and credit balance in one statement)
+    TENANT_GATE_LOADER: str = "sequential"
+
+    # Tenant security context snapshot (Redis TTL / in-process revalidation interval)
+    TENANT_CONTEXT_TTL_S: int = 300
+    TENANT_CONTEXT_LOCAL_TTL_S: float = 5.0
+    # In-process copies are reloaded from Redis at least this often
+    TENANT_CONTEXT_LOCAL_MAX_AGE_S: float = 60.0
+    # In-process copies kept per worker (least recently used evicted first)
+    TENANT_CONTEXT_LOCAL_SIZE: int = 10000
+
+    # argon2 verification pool (cold-path key checks run off the event loop)
+    API_KEY_VERIFY_WORKERS: int = 2
+    API_KEY_VERIFY_QUEUE_DEPTH: int = 16
+
     model_config = SettingsConfigDict(
         env_file=".env",
         extra="ignore"
@@ -0,0 +1,82 @@
+"""
+app/core/deadline.py
+
+Request-scoped time budget for the RAG pipeline.
+
+A Deadline is created once per chat request (in the route) and passed down
+to every stage — embedding, retrieval, LLM call, retries — so the whole
+request stays within CHAT_REQUEST_TIMEOUT_S instead of each stage adding
+its own fixed 30 s timeout on top of the others.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot start because the request budget is spent."""
+
+    def __init__(self, stage: str, remaining: float):
+        self.stage = stage
+        self.remaining = remaining
+        super().__init__(f"Deadline exceeded before '{stage}' ({remaining:.2f}s left)")
+
+
+class Deadline:
+    __slots__ = ("budget", "_expires_at")
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self._expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_settings(cls) -> "Deadline":
+        from app.core.config import settings
+        return cls(settings.CHAT_REQUEST_TIMEOUT_S)
+
+    def remaining(self) -> float:
+        """Seconds left in the budget (never negative)."""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def timeout(self, cap: float, share: float = 1.0, reserve: float = 0.0) -> float:
+        """
+        Sub-budget for one stage: `share` of what is left after keeping
+        `reserve` seconds for later stages, never more than `cap`.
+        """
+        return max(0.0, min(cap, (self.remaining() - reserve) * share))
+
+    def check(self, stage: str, min_remaining: float = 0.0) -> None:
+        """Raise DeadlineExceeded if less than `min_remaining` seconds are left."""
+        remaining = self.remaining()
+        if remaining <= min_remaining:
+            raise DeadlineExceeded(stage, remaining)
+
+    # ------------------------------------------------------------------
+    # tenacity integration
+    # ------------------------------------------------------------------
+
+    def retry_stop(self, reserve: float) -> Callable:
+        """
+        Tenacity stop condition: give up once a further attempt could not
+        finish with at least `reserve` seconds left.
+        """
+        def _stop(retry_state) -> bool:
+            return self.remaining() <= reserve
+        return _stop
+
+    def retry_wait(self, wait: Callable, reserve: float) -> Callable:
+        """Wrap a tenacity wait strategy so back-off never eats into `reserve`."""
+        def _wait(retry_state) -> float:
+            return max(0.0, min(wait(retry_state), self.remaining() - reserve))
+        return _wait
+
+
+def ensure_deadline(deadline: Optional[Deadline]) -> Deadline:
+    """Callers outside a request (tasks, scripts) get a fresh default budget."""
+    return deadline if deadline is not None else Deadline.from_settings()
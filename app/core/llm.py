@@ -9,15 +9,20 @@ client = AsyncOpenAI(
     max_retries=0   # Disable automatic retries to handle circuit breaker and specific errors manually
 )
 
-async def get_embedding(text: str, model: str = "text-embedding-3-small") -> list[float]:
+async def get_embedding(
+    text: str,
+    model: str = "text-embedding-3-small",
+    timeout: float = 30.0,
+) -> list[float]:
     """
     Generate an embedding for the given text using OpenAI.
+    `timeout` is usually the caller's share of the request deadline.
     """
     text = text.replace("\n", " ")
     try:
         response = await asyncio.wait_for(
-            client.embeddings.create(input=[text], model=model),
-            timeout=30.0
+            client.embeddings.create(input=[text], model=model, timeout=timeout),
+            timeout=timeout
         )
         return response.data[0].embedding
     except (APITimeoutError, asyncio.TimeoutError):
@@ -27,7 +32,8 @@ async def get_chat_completion(
     messages: list[dict], 
     model: str = "gpt-3.5-turbo", 
     temperature: float = 0.7,
-    max_tokens: int = 500  # Reasonable limit (FINDING-007)
+    max_tokens: int = 500,  # Reasonable limit (FINDING-007)
+    timeout: float = 30.0,  # 30 second timeout (FINDING-006), capped by the request deadline
 ):
     """
     Get a chat completion from OpenAI with timeout and token limits.
@@ -38,9 +44,10 @@ async def get_chat_completion(
                 model=model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                timeout=timeout,
             ),
-            timeout=30.0  # 30 second timeout (FINDING-006)
+            timeout=timeout
         )
         return response
     except (APITimeoutError, asyncio.TimeoutError):
@@ -50,19 +57,25 @@ async def get_chat_completion_stream(
     messages: list[dict],
     model: str = "gpt-3.5-turbo",
     temperature: float = 0.7,
-    max_tokens: int = 500
+    max_tokens: int = 500,
+    timeout: float = 30.0,
 ):
     """
     Get a streaming chat completion from OpenAI.
+    `timeout` bounds the wait for the response headers (time to first byte).
     """
     try:
-        stream = await client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=True,
-            stream_options={"include_usage": True}
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            ),
+            timeout=timeout
         )
         return stream
     except Exception as e:
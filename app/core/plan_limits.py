@@ -1,8 +1,9 @@
 """
 app/core/plan_limits.py
 
-Parses Plan.features JSONB into a typed PlanLimits dataclass and
-provides a helper to load it for a given tenant.
+Parses Plan.features JSONB into a typed PlanLimits dataclass, merges in
+the tenant's TenantLimitsOverride and provides a helper to load it for a
+given tenant. Parsed limits are cached per plan and override version.
 
 Expected Plan.features structure:
 {
@@ -41,8 +42,10 @@ Expected Plan.features structure:
 
 from __future__ import annotations
 
+import dataclasses
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import List, Optional, TYPE_CHECKING
+from typing import Any, Awaitable, Callable, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from sqlalchemy.ext.asyncio import AsyncSession
@@ -50,28 +53,29 @@ if TYPE_CHECKING:
 
 
 # ---------------------------------------------------------------------------
-# Sub-limit dataclasses
+# Sub-limit dataclasses (frozen + slotted: parsed limits are shared across
+# requests through the plan-limits cache, so they must never be mutated)
 # ---------------------------------------------------------------------------
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UsageLimits:
     max_requests_per_day: int = 2000
     max_requests_per_minute: int = 30
     max_conversations_per_month: int = 10000
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class BillingLimits:
     monthly_spend_limit_usd: float = 50.0
     daily_spend_limit_usd: float = 5.0
     overage_allowed: bool = False
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ModelLimits:
     max_tokens_per_request: int = 500
     max_chunks_per_query: int = 5
-    allowed_models: List[str] = field(default_factory=lambda: ["gpt-4o-mini"])
+    allowed_models: Tuple[str, ...] = ("gpt-4o-mini",)
 
     @property
     def default_model(self) -> str:
@@ -79,29 +83,48 @@ class ModelLimits:
         return self.allowed_models[0] if self.allowed_models else "gpt-4o-mini"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class KnowledgeBaseLimits:
     max_files: int = 50
     max_storage_mb: int = 500
     max_chunks_total: int = 50000
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TeamLimits:
     max_users: int = 5
 
 
+@dataclass(frozen=True, slots=True)
+class AnalyticsLimits:
+    retention_days: int = 90
+
+
+# TenantLimitsOverride column -> (PlanLimits section, field, cast)
+OVERRIDE_FIELDS = {
+    "max_requests_per_day": ("usage", "max_requests_per_day", int),
+    "max_requests_per_minute": ("usage", "max_requests_per_minute", int),
+    "monthly_spend_limit_usd": ("billing", "monthly_spend_limit_usd", float),
+    "daily_spend_limit_usd": ("billing", "daily_spend_limit_usd", float),
+    "max_tokens_per_request": ("model_limits", "max_tokens_per_request", int),
+    "max_chunks_per_query": ("model_limits", "max_chunks_per_query", int),
+    "max_files": ("knowledge_base", "max_files", int),
+    "max_total_storage_mb": ("knowledge_base", "max_storage_mb", int),
+}
+
+
 # ---------------------------------------------------------------------------
 # Root dataclass
 # ---------------------------------------------------------------------------
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PlanLimits:
     usage: UsageLimits = field(default_factory=UsageLimits)
     billing: BillingLimits = field(default_factory=BillingLimits)
     model_limits: ModelLimits = field(default_factory=ModelLimits)
     knowledge_base: KnowledgeBaseLimits = field(default_factory=KnowledgeBaseLimits)
     team: TeamLimits = field(default_factory=TeamLimits)
+    analytics: AnalyticsLimits = field(default_factory=AnalyticsLimits)
 
     @classmethod
     def from_features(cls, features: dict) -> "PlanLimits":
@@ -117,6 +140,7 @@ class PlanLimits:
         model_raw = features.get("model_limits", {})
         kb_raw = features.get("knowledge_base", {})
         team_raw = features.get("team", {})
+        analytics_raw = features.get("analytics", {})
 
         return cls(
             usage=UsageLimits(
@@ -132,7 +156,7 @@ class PlanLimits:
             model_limits=ModelLimits(
                 max_tokens_per_request=int(model_raw.get("max_tokens_per_request", 500)),
                 max_chunks_per_query=int(model_raw.get("max_chunks_per_query", 5)),
-                allowed_models=list(model_raw.get("allowed_models", ["gpt-4o-mini"])),
+                allowed_models=tuple(model_raw.get("allowed_models", ["gpt-4o-mini"])),
             ),
             knowledge_base=KnowledgeBaseLimits(
                 max_files=int(kb_raw.get("max_files", 50)),
@@ -142,28 +166,153 @@ class PlanLimits:
             team=TeamLimits(
                 max_users=int(team_raw.get("max_users", 5)),
             ),
+            analytics=AnalyticsLimits(
+                retention_days=int(analytics_raw.get("retention_days", 90)),
+            ),
         )
 
+    def with_overrides(self, override: Any) -> "PlanLimits":
+        """
+        Apply a TenantLimitsOverride (ORM row or mapping of its columns) on
+        top of the plan's limits. NULL columns keep the plan value.
+        """
+        if override is None:
+            return self
+        sections = {}
+        for column, (section, name, cast) in OVERRIDE_FIELDS.items():
+            value = override.get(column) if isinstance(override, dict) else getattr(override, column, None)
+            if value is None:
+                continue
+            sections.setdefault(section, {})[name] = cast(value)
+        if not sections:
+            return self
+        return dataclasses.replace(self, **{
+            section: dataclasses.replace(getattr(self, section), **values)
+            for section, values in sections.items()
+        })
+
 
 # ---------------------------------------------------------------------------
-# Helper: load plan limits for a given tenant
+# Parsed-limits cache
 # ---------------------------------------------------------------------------
 
-async def get_plan_limits(tenant: "Tenant", db: "AsyncSession") -> PlanLimits:
+class PlanLimitsCache:
     """
-    Load the Plan associated with this tenant and return its PlanLimits.
-    Falls back to safe defaults if no plan is assigned or features are empty.
+    In-process cache of parsed limits keyed by
+    (plan_id, plan version, plan.updated_at, override tenant, override.updated_at).
+
+    Tenants without overrides share one entry per plan. Plan.updated_at is
+    not bumped on every edit, so the management server also signals plan
+    changes through the internal API, which increments the Redis plan
+    version (`planlimits:ver:{plan_id}`) that every worker keys on.
     """
-    if tenant.plan_id is None:
-        return PlanLimits()
 
+    MAX_ENTRIES = 1024
+    VERSION_PREFIX = "planlimits:ver:"
+
+    def __init__(self):
+        self._entries: "OrderedDict[tuple, PlanLimits]" = OrderedDict()
+
+    async def plan_version(self, plan_id) -> int:
+        if plan_id is None:
+            return 0
+        from app.utils.redis_client import redis_client
+        value = await redis_client.get_str(f"{self.VERSION_PREFIX}{plan_id}")
+        return int(value or 0)
+
+    def get(self, key: tuple) -> Optional[PlanLimits]:
+        limits = self._entries.get(key)
+        if limits is not None:
+            self._entries.move_to_end(key)
+        return limits
+
+    def put(self, key: tuple, limits: PlanLimits) -> None:
+        self._entries[key] = limits
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    async def invalidate_plan(self, plan_id) -> None:
+        from app.utils.redis_client import redis_client
+        await redis_client.incr(f"{self.VERSION_PREFIX}{plan_id}")
+        for key in [k for k in self._entries if str(k[0]) == str(plan_id)]:
+            self._entries.pop(key, None)
+
+
+plan_limits_cache = PlanLimitsCache()
+
+
+async def _cached_plan_limits(
+    key: tuple,
+    load: Callable[[], Awaitable[Tuple[Optional[dict], Any]]],
+) -> PlanLimits:
+    limits = plan_limits_cache.get(key)
+    if limits is None:
+        features, override = await load()
+        limits = PlanLimits.from_features(features or {}).with_overrides(override)
+        plan_limits_cache.put(key, limits)
+    return limits
+
+
+async def resolve_plan_limits(
+    tenant_id,
+    plan_id,
+    plan_updated_at,
+    override_updated_at,
+    load: Callable[[], Awaitable[Tuple[Optional[dict], Any]]],
+) -> PlanLimits:
+    """
+    Return cached limits for this version key, or call `load()` for
+    (plan features, override row) and parse them once.
+    """
+    key = (
+        plan_id,
+        await plan_limits_cache.plan_version(plan_id),
+        plan_updated_at,
+        tenant_id if override_updated_at is not None else None,
+        override_updated_at,
+    )
+    return await _cached_plan_limits(key, load)
+
+
+# ---------------------------------------------------------------------------
+# Helper: load plan limits for a given tenant
+# ---------------------------------------------------------------------------
+
+async def get_plan_limits(tenant: "Tenant", db: "AsyncSession", version: Optional[int] = None) -> PlanLimits:
+    """
+    Return the PlanLimits for this tenant's plan with its TenantLimitsOverride
+    merged in. Falls back to safe defaults if no plan is assigned or
+    features are empty.
+
+    Nothing is queried while the parsed limits are cached: they are keyed
+    by the Redis plan version and the tenant's context version stamp
+    (`version`, from the caller's cached TenantContext, else read from
+    Redis), which the management server bumps when an override changes.
+    Without Redis the limits are loaded on every call.
+    """
     from sqlalchemy import select
-    from app.db.models import Plan
+    from app.auth.tenant_context import tenant_context_cache
+    from app.db.models import Plan, TenantLimitsOverride
+    from app.db.replica import execute_read
 
-    result = await db.execute(select(Plan).where(Plan.id == tenant.plan_id))
-    plan: Optional[Plan] = result.scalars().first()
+    async def load():
+        features = None
+        if tenant.plan_id is not None:
+            features = (await execute_read(
+                db, select(Plan.features).where(Plan.id == tenant.plan_id)
+            )).scalar_one_or_none()
+        override = (await execute_read(
+            db, select(TenantLimitsOverride).where(TenantLimitsOverride.tenant_id == tenant.id)
+        )).scalars().first()
+        return features, override
 
-    if plan is None or not plan.features:
-        return PlanLimits()
+    if version is None:
+        version = await tenant_context_cache.current_version(tenant.id)
+    if version is None:
+        # Invalidations cannot reach this worker: nothing may be cached
+        features, override = await load()
+        return PlanLimits.from_features(features or {}).with_overrides(override)
 
-    return PlanLimits.from_features(plan.features)
+    key = (tenant.plan_id, await plan_limits_cache.plan_version(tenant.plan_id), tenant.id, version)
+    return await _cached_plan_limits(key, load)
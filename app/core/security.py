@@ -1,3 +1,9 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
 from passlib.hash import argon2
 
 def hash_api_key(api_key: str) -> str:
@@ -16,3 +22,109 @@ def verify_api_key(api_key: str, hashed: str) -> bool:
     except (ValueError, TypeError):
         # Handle malformed or legacy hashes gracefully
         return False
+
+
+class VerifierSaturated(Exception):
+    """Raised when the verification pool already has its maximum backlog."""
+
+
+class BoundedVerifier:
+    """
+    Runs argon2 verification on a small dedicated thread pool so a burst of
+    cold or invalid keys cannot stall the event loop. argon2-cffi releases
+    the GIL while hashing, so threads give real parallelism here.
+
+    At most `max_workers + max_queue` verifications may be in flight; beyond
+    that callers are rejected immediately instead of queueing unboundedly.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "verified": 0,
+            "rejected": 0,
+            "queue_wait_ms_total": 0.0,
+            "queue_wait_ms_max": 0.0,
+            "verify_ms_total": 0.0,
+            "verify_ms_max": 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="argon2-verify"
+            )
+        return self._executor
+
+    def _timed(self, fn: Callable[..., bool], submitted: float, *args) -> bool:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            wait_ms = (started - submitted) * 1000
+            verify_ms = (finished - started) * 1000
+            with self._lock:
+                stats = self._stats
+                stats["verified"] += 1
+                stats["queue_wait_ms_total"] += wait_ms
+                stats["queue_wait_ms_max"] = max(stats["queue_wait_ms_max"], wait_ms)
+                stats["verify_ms_total"] += verify_ms
+                stats["verify_ms_max"] = max(stats["verify_ms_max"], verify_ms)
+
+    async def run(self, fn: Callable[..., bool], *args) -> bool:
+        """Run `fn(*args)` on the pool, or raise VerifierSaturated if it is full."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise VerifierSaturated()
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(self._timed, fn, time.perf_counter(), *args)
+        except BaseException:
+            self._release()
+            raise
+        # Released when the job itself ends, not when the caller stops
+        # waiting: a cancelled caller leaves the job running on the pool
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+        verified = stats["verified"] or 1
+        return {
+            "pending": pending,
+            "max_pending": self.max_pending,
+            "verified": stats["verified"],
+            "rejected": stats["rejected"],
+            "queue_wait_ms_avg": round(stats["queue_wait_ms_total"] / verified, 2),
+            "queue_wait_ms_max": round(stats["queue_wait_ms_max"], 2),
+            "verify_ms_avg": round(stats["verify_ms_total"] / verified, 2),
+            "verify_ms_max": round(stats["verify_ms_max"], 2),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _build_verifier() -> BoundedVerifier:
+    from app.core.config import settings
+    return BoundedVerifier(
+        max_workers=settings.API_KEY_VERIFY_WORKERS,
+        max_queue=settings.API_KEY_VERIFY_QUEUE_DEPTH,
+    )
+
+
+api_key_verifier = _build_verifier()
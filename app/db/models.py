@@ -173,6 +173,11 @@ class EmailToken(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    # One conversation per widget/API session (target of the persistence upsert,
+    # migrations/0002_conversation_sessions.sql)
+    __table_args__ = (
+        sa.UniqueConstraint("tenant_id", "session_id", name="uq_conversations_tenant_session"),
+    )
     id = sa.Column(postgresql.UUID(as_uuid=True),
                    primary_key=True, default=gen_uuid)
     tenant_id = sa.Column(postgresql.UUID(as_uuid=True), sa.ForeignKey(
@@ -187,6 +192,8 @@ class Conversation(Base):
 
 
 class Message(Base):
+    # Partitioned by month on created_at; the database primary key is
+    # (id, created_at) (migrations/0004_partition_chat_history.sql)
     __tablename__ = "messages"
     id = sa.Column(postgresql.UUID(as_uuid=True),
                    primary_key=True, default=gen_uuid)
@@ -200,6 +207,7 @@ class Message(Base):
 
 
 class AnalyticsEvent(Base):
+    # Partitioned by month on created_at, like messages
     __tablename__ = "analytics_events"
     id = sa.Column(postgresql.UUID(as_uuid=True),
                    primary_key=True, default=gen_uuid)
@@ -211,6 +219,33 @@ class AnalyticsEvent(Base):
                            server_default=func.now())
 
 
+class AnalyticsRollup(Base):
+    """
+    Hourly per-tenant, per-model chat counters, accumulated in Redis and
+    flushed by the flush_analytics_rollups task
+    (migrations/0003_analytics_hourly_rollups.sql).
+    """
+    __tablename__ = "analytics_hourly_rollups"
+    __table_args__ = (
+        sa.UniqueConstraint("tenant_id", "model", "hour", name="uq_analytics_rollups_bucket"),
+    )
+
+    id = sa.Column(postgresql.UUID(as_uuid=True), primary_key=True, default=gen_uuid)
+    tenant_id = sa.Column(postgresql.UUID(as_uuid=True), sa.ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    model = sa.Column(sa.String, nullable=False)
+    hour = sa.Column(sa.DateTime(timezone=True), nullable=False)
+
+    requests          = sa.Column(sa.BigInteger, nullable=False, default=0)
+    prompt_tokens     = sa.Column(sa.BigInteger, nullable=False, default=0)
+    completion_tokens = sa.Column(sa.BigInteger, nullable=False, default=0)
+    total_tokens      = sa.Column(sa.BigInteger, nullable=False, default=0)
+    cost_usd          = sa.Column(sa.Numeric(14, 6), nullable=False, default=0)
+    cache_hits        = sa.Column(sa.BigInteger, nullable=False, default=0)
+    fallbacks         = sa.Column(sa.BigInteger, nullable=False, default=0)
+
+    updated_at = sa.Column(sa.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class Coupon(Base):
     __tablename__ = "coupons"
     id = sa.Column(postgresql.UUID(as_uuid=True),
@@ -412,22 +447,24 @@ class TenantLimitsOverride(Base):
     tenant_id = sa.Column(postgresql.UUID(as_uuid=True), sa.ForeignKey(
         "tenants.id", ondelete="CASCADE"), nullable=False, unique=True)
 
+    # Limits applied over the plan's (app/core/plan_limits.py OVERRIDE_FIELDS):
+    # NULL keeps the plan value, so they have no defaults
     # Financial Limits
-    monthly_spend_limit_usd = sa.Column(sa.Numeric(10, 2), default=50.00)
-    daily_spend_limit_usd = sa.Column(sa.Numeric(10, 2), default=5.00)
+    monthly_spend_limit_usd = sa.Column(sa.Numeric(10, 2), nullable=True)
+    daily_spend_limit_usd = sa.Column(sa.Numeric(10, 2), nullable=True)
 
     # Usage Limits
-    max_requests_per_minute = sa.Column(sa.Integer, default=30)
-    max_requests_per_day = sa.Column(sa.Integer, default=2000)
+    max_requests_per_minute = sa.Column(sa.Integer, nullable=True)
+    max_requests_per_day = sa.Column(sa.Integer, nullable=True)
     max_concurrent_sessions = sa.Column(sa.Integer, default=100)
 
     # AI Limits
-    max_tokens_per_request = sa.Column(sa.Integer, default=1500)
-    max_chunks_per_query = sa.Column(sa.Integer, default=5)
+    max_tokens_per_request = sa.Column(sa.Integer, nullable=True)
+    max_chunks_per_query = sa.Column(sa.Integer, nullable=True)
 
     # Knowledge Base Limits
-    max_files = sa.Column(sa.Integer, default=50)
-    max_total_storage_mb = sa.Column(sa.Integer, default=500)
+    max_files = sa.Column(sa.Integer, nullable=True)
+    max_total_storage_mb = sa.Column(sa.Integer, nullable=True)
     max_embeddings_per_month = sa.Column(sa.Integer, default=50000)
 
     # Safety Controls
@@ -441,6 +478,7 @@ class TenantLimitsOverride(Base):
 
 
 class LLMUsage(Base):
+    # Partitioned by month on created_at, like messages
     __tablename__ = "llm_usage"
 
     id = sa.Column(postgresql.UUID(as_uuid=True),
@@ -449,8 +487,8 @@ class LLMUsage(Base):
         "tenants.id", ondelete="CASCADE"), nullable=True, index=True)
     conversation_id = sa.Column(postgresql.UUID(as_uuid=True), sa.ForeignKey(
         "conversations.id", ondelete="CASCADE"), nullable=True, index=True)
-    message_id = sa.Column(postgresql.UUID(as_uuid=True), sa.ForeignKey(
-        "messages.id", ondelete="CASCADE"), nullable=True, index=True)
+    # Not a foreign key: messages is partitioned, so messages.id alone is not unique-indexed
+    message_id = sa.Column(postgresql.UUID(as_uuid=True), nullable=True, index=True)
 
     model = sa.Column(sa.String, nullable=False)
     prompt_tokens = sa.Column(sa.Integer, nullable=False)
@@ -515,6 +553,9 @@ class CreditUsageLog(Base):
     # status: 'charged', 'refunded', 'failed'
     status = sa.Column(sa.String, nullable=False, default="charged")
 
+    # Set per chat turn (the persistence task id) so redelivered tasks never charge twice
+    idempotency_key = sa.Column(sa.String, nullable=True, unique=True)  # migrations/0001_credit_charge_idempotency.sql
+
     created_at = sa.Column(sa.DateTime(timezone=True), server_default=func.now(), index=True)
 
     # relationship back to ledger
@@ -0,0 +1,149 @@
+"""
+app/db/replica.py
+
+Optional read replica for read-only request-path queries.
+
+With DATABASE_REPLICA_URL set, the pgvector retrieval search and the
+plan-limits lookups run on the replica through execute_read(), so vector
+scans stop competing with persistence writes on the primary. Everything
+else stays on the primary session: writes, the credit ledger, and the auth
+gate query (its key and tenant checks must see revocations at once).
+
+The replica is only used while it is known to be fresh. Its replication
+lag is measured in the background every DB_REPLICA_CHECK_S (0 when it has
+replayed all the WAL it received, so an idle primary does not read as
+lag). Until the first check passes, while the lag exceeds
+DB_REPLICA_MAX_LAG_S, or after a replica query fails, reads go to the
+primary. A failed read is retried on the primary within the same call.
+
+The engine follows DB_POOL_MODE like the primary one. It belongs to the
+API's event loop, so Celery tasks do not use it.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.logging import logger
+
+_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_s
+    """
+)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._engine = None
+        self._sessions: Optional[sessionmaker] = None
+        self._healthy = False
+        self._lag_s: Optional[float] = None
+        self._next_check = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+        self._counters = {"replica_reads": 0, "primary_reads": 0, "replica_errors": 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.DATABASE_REPLICA_URL)
+
+    def usable(self) -> bool:
+        """Whether reads should go to the replica now (starts a lag check when one is due)."""
+        if not self.configured:
+            return False
+        if time.monotonic() >= self._next_check and (self._check_task is None or self._check_task.done()):
+            self._next_check = time.monotonic() + settings.DB_REPLICA_CHECK_S
+            self._check_task = asyncio.get_running_loop().create_task(self.check())
+        return self._healthy
+
+    async def check(self) -> bool:
+        """Measure the replica's lag and mark it usable or not."""
+        try:
+            async with self.sessions()() as db:
+                lag_s = float((await asyncio.wait_for(
+                    db.execute(_LAG_SQL), timeout=settings.DB_REPLICA_CHECK_S,
+                )).scalar_one())
+        except Exception as e:
+            self._mark_unhealthy(f"lag check failed: {e}")
+            return False
+        self._lag_s = lag_s
+        healthy = lag_s <= settings.DB_REPLICA_MAX_LAG_S
+        if healthy != self._healthy:
+            logger.info(f"Read replica {'in use' if healthy else 'bypassed'} (lag {lag_s:.1f}s)")
+        self._healthy = healthy
+        return healthy
+
+    def sessions(self) -> sessionmaker:
+        if self._sessions is None:
+            from app.db.session import async_database_url, create_pooled_engine, create_unpooled_engine
+
+            url = async_database_url(settings.DATABASE_REPLICA_URL)
+            if settings.DB_POOL_MODE == "pooled":
+                self._engine = create_pooled_engine(
+                    pool_size=settings.DB_POOL_SIZE,
+                    max_overflow=settings.DB_MAX_OVERFLOW,
+                    pool_recycle=settings.DB_POOL_RECYCLE_S,
+                    url=url,
+                )
+            else:
+                self._engine = create_unpooled_engine(url)
+            self._sessions = sessionmaker(self._engine, class_=AsyncSession, expire_on_commit=False)
+        return self._sessions
+
+    def _mark_unhealthy(self, reason: str) -> None:
+        if self._healthy:
+            logger.warning(f"Read replica bypassed: {reason}")
+        self._healthy = False
+        self._counters["replica_errors"] += 1
+
+    async def execute(self, db: AsyncSession, statement, params: Optional[Dict[str, Any]] = None):
+        """Run a read-only statement on the replica when usable, else (or if it fails) on `db`."""
+        if self.usable():
+            try:
+                async with self.sessions()() as replica_db:
+                    result = await replica_db.execute(statement, params)
+                self._counters["replica_reads"] += 1
+                return result
+            except (exc.DBAPIError, OSError) as e:
+                self._mark_unhealthy(str(e))
+        self._counters["primary_reads"] += 1
+        return await db.execute(statement, params)
+
+    def stats(self) -> Dict[str, Any]:
+        from app.db.session import pool_stats
+
+        if not self.configured:
+            return {"configured": False}
+        return {
+            "configured": True,
+            "in_use": self._healthy,
+            "lag_s": self._lag_s,
+            "max_lag_s": settings.DB_REPLICA_MAX_LAG_S,
+            "pool": pool_stats(self._engine) if self._engine is not None else None,
+            **self._counters,
+        }
+
+    async def dispose(self) -> None:
+        if self._check_task is not None:
+            self._check_task.cancel()
+        if self._engine is not None:
+            await self._engine.dispose()
+        self._engine = self._sessions = None
+        self._healthy = False
+
+
+read_replica = ReplicaRouter()
+
+
+async def execute_read(db: AsyncSession, statement, params: Optional[Dict[str, Any]] = None):
+    """Read-only `statement` on the read replica when one is configured and fresh, else on `db`."""
+    return await read_replica.execute(db, statement, params)
@@ -1,34 +1,160 @@
 # app/db/session.py
 import os
+import time
+import uuid
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy import exc, text
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError(
         "DATABASE_URL env var is required (point to Supabase Postgres)")
 
-# If someone provided a sync URL like "postgresql://...", convert it to asyncpg dialect:
-if DATABASE_URL.startswith("postgresql://"):
-    DATABASE_URL = DATABASE_URL.replace(
-        "postgresql://", "postgresql+asyncpg://", 1)
 
-from sqlalchemy.pool import NullPool
+def async_database_url(url: str) -> str:
+    # If someone provided a sync URL like "postgresql://...", convert it to asyncpg dialect:
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+DATABASE_URL = async_database_url(DATABASE_URL)
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from app.core.config import settings
+
+
+class PoolWaitStats:
+    """Checkout counters for a MeteredQueuePool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def record(self, wait_s: float, timed_out: bool = False) -> None:
+        self.checkouts += 1
+        self.timeouts += int(timed_out)
+        self.total_wait_s += wait_s
+        self.max_wait_s = max(self.max_wait_s, wait_s)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that times how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
 
-# create async engine (using NullPool for Supabase Session mode)
-# sslmode=require is enforced to prevent MitM attacks
-engine = create_async_engine(
-    DATABASE_URL, 
-    future=True, 
-    echo=False,
-    poolclass=NullPool,
-    connect_args={"ssl": "require"}
-)
+    def _do_get(self):
+        # Covers waiting for a free connection and opening an overflow one
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+def _connect_args() -> dict:
+    # sslmode=require is enforced to prevent MitM attacks
+    connect_args = {"ssl": "require"}
+    if settings.DB_EXTERNAL_POOLER:
+        # Transaction-mode poolers (pgbouncer, Supavisor) hand each transaction
+        # to any server connection: no cached or reused prepared statement names
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
+    return connect_args
+
+
+def create_pooled_engine(
+    pool_size: int,
+    max_overflow: int,
+    pool_recycle: int,
+    pool_timeout: Optional[float] = None,
+    url: Optional[str] = None,
+):
+    """
+    A pooled engine (on DATABASE_URL unless `url` is given). Its connections
+    belong to the event loop that opens them, so only use it from one
+    long-lived loop (a server worker, the persistent task loop in
+    app/tasks/runtime.py, the stream worker).
+    """
+    return create_async_engine(
+        url or DATABASE_URL,
+        future=True,
+        echo=False,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout if pool_timeout is not None else settings.DB_POOL_TIMEOUT_S,
+        pool_pre_ping=True,
+        connect_args=_connect_args(),
+    )
+
+
+def create_unpooled_engine(url: Optional[str] = None):
+    """One connection per session; safe from any event loop."""
+    return create_async_engine(
+        url or DATABASE_URL,
+        future=True,
+        echo=False,
+        poolclass=NullPool,
+        connect_args=_connect_args(),
+    )
+
+
+# DB_POOL_MODE "null": a new connection per session (as suits Supabase session
+# mode or an external pooler); "pooled": connections are kept and reused
+if settings.DB_POOL_MODE == "pooled":
+    engine = create_pooled_engine(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_S,
+    )
+    unpooled_engine = create_unpooled_engine()
+else:
+    engine = unpooled_engine = create_unpooled_engine()
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False)
 
+# For code that runs on a short-lived event loop (asyncio.run per Celery task)
+UnpooledSessionLocal = sessionmaker(
+    unpooled_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def pool_stats(db_engine=None) -> dict:
+    """Connection pool metrics of an engine (the API engine by default)."""
+    pool = (db_engine or engine).pool
+    if not isinstance(pool, MeteredQueuePool):
+        return {"mode": "null", "external_pooler": settings.DB_EXTERNAL_POOLER}
+    wait = pool.wait_stats
+    return {
+        "mode": "pooled",
+        "external_pooler": settings.DB_EXTERNAL_POOLER,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        "checkouts": wait.checkouts,
+        "timeouts": wait.timeouts,
+        "avg_wait_ms": round(wait.total_wait_s / wait.checkouts * 1000, 2) if wait.checkouts else 0.0,
+        "max_wait_ms": round(wait.max_wait_s * 1000, 2),
+    }
+
 
 async def init_db():
     # lightweight connectivity check only
@@ -10,6 +10,12 @@ from app.api.internal import router as internal_router
 from app.core.logging import setup_logging, logger
 from app.middleware.cors import DynamicCORSMiddleware
 from app.utils.redis_client import redis_client
+from app.core.security import api_key_verifier
+from app.auth.key_usage import key_usage_buffer
+from app.tasks.publisher import task_publisher
+from app.services.chat_stream import chat_turn_stream
+from app.db.session import engine
+from app.db.replica import read_replica
 
 # Setup structured logging
 setup_logging()
@@ -25,9 +31,18 @@ async def lifespan(app: FastAPI):
 
     await redis_client.connect()
     logger.info("Application startup: Redis connected")
+    key_usage_buffer.start()
+    if settings.TASK_ENQUEUE_MODE == "async":
+        task_publisher.start()
     yield
     # Shutdown logic
+    await chat_turn_stream.drain()
+    await task_publisher.stop()
+    await key_usage_buffer.stop()
     await redis_client.close()
+    await engine.dispose()
+    await read_replica.dispose()
+    api_key_verifier.shutdown()
     logger.info("Application shutdown: Redis closed")
 
 app = FastAPI(
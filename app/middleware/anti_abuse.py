@@ -1,10 +1,16 @@
 from fastapi import Request, HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Union
+from app.auth.domain_matcher import DomainMatcher
 from app.core.logging import logger
 
-async def validate_domain_whitelist(request: Request, whitelisted_domains: Optional[List[str]]):
+async def validate_domain_whitelist(
+    request: Request,
+    whitelisted_domains: Optional[Union[DomainMatcher, List[str]]],
+):
     """
     Validate that the request Origin or Referer is in the whitelisted domains.
+    Accepts the tenant's compiled DomainMatcher (shared with the auth gate),
+    or a plain list where every entry also admits its subdomains.
     """
     if not whitelisted_domains:
         # If no whitelist is defined, allow all (or change to block all if preferred)
@@ -24,19 +30,16 @@ async def validate_domain_whitelist(request: Request, whitelisted_domains: Optio
             detail="Forbidden: Domain not whitelisted"
         )
 
+    matcher = whitelisted_domains
+    if not isinstance(matcher, DomainMatcher):
+        matcher = DomainMatcher.compile(whitelisted_domains, include_subdomains=True)
+
     # Basic domain check logic
     from urllib.parse import urlparse
     target_host = urlparse(target).netloc or urlparse(target).path
     target_host = target_host.split(":")[0].lower()
 
-    is_whitelisted = False
-    for domain in whitelisted_domains:
-        domain = domain.strip().lower()
-        if target_host == domain or target_host.endswith("." + domain):
-            is_whitelisted = True
-            break
-            
-    if not is_whitelisted:
+    if not matcher.matches(target_host):
         logger.warning(f"Domain validation failed for target '{target}' (resolved host: '{target_host}')")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1,3 +1,6 @@
+from typing import Callable
+
+
 class PromptBuilder:
     BOOKING_URL = "https://rakrilabs.zohobookings.in/#/421636000000040050"
 
@@ -127,3 +130,78 @@ class PromptBuilder:
             response = response.replace("<a", "👉 <a")
 
         return response
+
+    def output_guard(self) -> "StreamingOutputGuard":
+        """Create an incremental guardrail for one streamed answer."""
+        return StreamingOutputGuard(self.BOOKING_URL, self.enforce_output_rules)
+
+
+class StreamingOutputGuard:
+    """
+    Incremental counterpart of PromptBuilder.enforce_output_rules for streamed
+    answers, producing exactly what enforce_output_rules returns for the
+    whole answer.
+
+    Those rules rewrite booking URLs and prefix anchors ("<a") with 👉, but
+    whether they apply depends on the whole response: a URL becomes a link
+    only if no "<a" ever appears, and anchors get 👉 only if it never
+    appears. So text passes through immediately up to the first URL or
+    anchor (minus a tail that could still start one), and everything from
+    there is held back until the outcome is known: once both "<a" and 👉
+    have been seen nothing is rewritten anymore, otherwise flush() applies
+    the rules to the complete answer.
+    """
+
+    ANCHOR = "<a"
+    EMOJI = "👉"
+
+    def __init__(self, booking_url: str, rules: Callable[[str], str]):
+        self.booking_url = booking_url
+        self._rules = rules
+        self._patterns = (booking_url, self.ANCHOR)
+        self._max_holdback = max(len(p) for p in self._patterns) - 1
+        self._raw = ""
+        self._emitted = 0
+        # "<a" and 👉 both seen: the rules leave the rest of the answer alone
+        self._passthrough = False
+
+    def feed(self, text: str) -> str:
+        """Consume a raw delta and return the text that is safe to emit now."""
+        self._raw += text
+        if not self._passthrough:
+            self._passthrough = self.ANCHOR in self._raw and self.EMOJI in self._raw
+        if self._passthrough:
+            return self._release(len(self._raw))
+
+        cut = len(self._raw) - self._holdback(self._raw[self._emitted:])
+        for pattern in self._patterns:
+            match = self._raw.find(pattern, self._emitted)
+            if match != -1:
+                cut = min(cut, match)
+        return self._release(cut)
+
+    def flush(self) -> str:
+        """Return whatever is still held back once the stream has ended."""
+        if self._passthrough:
+            return self._release(len(self._raw))
+        # Everything emitted so far precedes the first URL or anchor, which
+        # the rules leave unchanged
+        out = self._rules(self._raw)[self._emitted:]
+        self._emitted = len(self._raw)
+        self._passthrough = True
+        return out
+
+    def _release(self, end: int) -> str:
+        if end <= self._emitted:
+            return ""
+        out = self._raw[self._emitted:end]
+        self._emitted = end
+        return out
+
+    def _holdback(self, text: str) -> int:
+        """Length of the longest suffix of `text` that starts some pattern."""
+        for size in range(min(len(text), self._max_holdback), 0, -1):
+            tail = text[-size:]
+            if any(p.startswith(tail) for p in self._patterns):
+                return size
+        return 0
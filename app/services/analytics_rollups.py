@@ -0,0 +1,200 @@
+"""
+app/services/analytics_rollups.py
+─────────────────────────────────
+Hourly per-tenant, per-model analytics counters.
+
+Every persisted turn used to be visible to dashboards only as an
+analytics_events row with a JSON payload, so per-tenant tokens and cost
+meant scanning (and parsing) every event. Persistence now also adds each
+turn to counters in a Redis hash per tenant and hour
+(`analytics:{rollups}:<tenant>:<YYYYMMDDHH>`, one `<model>|<counter>`
+field per counter) with HINCRBY. The periodic `flush_analytics_rollups`
+task moves them into analytics_hourly_rollups:
+
+  - one Lua call takes (reads and deletes) up to ANALYTICS_ROLLUP_BATCH_SIZE
+    dirty hashes
+  - one INSERT ... ON CONFLICT adds them to the hour's rows
+
+so analytics reads cost O(hours) rather than O(events). Counters taken
+from Redis are put back when the INSERT fails; a worker crash between
+the two loses at most one batch of counts.
+
+With the rollups in place, ANALYTICS_EVENT_SAMPLE_RATE < 1 keeps only a
+sample of the raw events (0 drops them).
+"""
+
+from __future__ import annotations
+
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.models import AnalyticsRollup
+
+# All keys share the {rollups} hash tag so the take script stays in one slot
+PREFIX = "analytics:{rollups}"
+DIRTY_KEY = f"{PREFIX}:dirty"
+
+COUNTERS = (
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cost_micros",
+    "cache_hits",
+    "fallbacks",
+)
+
+# Unflushed buckets are kept at most this long (flush is normally every minute)
+BUCKET_TTL_S = 7 * 86400
+
+_TAKE_LUA = """
+local out = {}
+for i = 2, #KEYS do
+  out[#out + 1] = KEYS[i]
+  out[#out + 1] = redis.call('HGETALL', KEYS[i])
+  redis.call('DEL', KEYS[i])
+  redis.call('SREM', KEYS[1], KEYS[i])
+end
+return out
+"""
+
+# (tenant_id, turn timestamp, persistence data)
+Turn = Tuple[uuid.UUID, float, Dict[str, Any]]
+
+
+def turn_counters(data: Dict[str, Any]) -> Dict[str, int]:
+    """A turn's contribution to its bucket."""
+    return {
+        "requests": 1,
+        "prompt_tokens": int(data.get("prompt_tokens", 0)),
+        "completion_tokens": int(data.get("completion_tokens", 0)),
+        "total_tokens": int(data.get("total_tokens", 0)),
+        "cost_micros": round(float(data.get("cost_usd", 0)) * 1_000_000),
+        "cache_hits": int(bool(data.get("cached"))),
+        "fallbacks": int(bool(data.get("error") or data.get("no_context"))),
+    }
+
+
+def keep_raw_event(key: Optional[str] = None) -> bool:
+    """
+    Whether this turn still gets an analytics_events row (decided by the
+    turn's idempotency `key` when given, so a rewrite samples it the same way).
+    """
+    rate = settings.ANALYTICS_EVENT_SAMPLE_RATE
+    if rate >= 1:
+        return True
+    return (random.Random(key) if key is not None else random).random() < rate
+
+
+def _bucket_key(tenant_id: uuid.UUID, ts: float) -> str:
+    return f"{PREFIX}:{tenant_id}:{datetime.fromtimestamp(ts, tz=timezone.utc):%Y%m%d%H}"
+
+
+class AnalyticsRollups:
+    async def record(self, turns: Iterable[Turn]) -> None:
+        """Add persisted turns to their hourly counters (one pipelined round trip)."""
+        buckets: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for tenant_id, ts, data in turns:
+            fields = buckets[_bucket_key(tenant_id, ts)]
+            model = data.get("model", "gpt-4o-mini")
+            for counter, value in turn_counters(data).items():
+                if value:
+                    fields[f"{model}|{counter}"] += value
+        await self._increment(buckets)
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Move the Redis counters into analytics_hourly_rollups. Returns the buckets written."""
+        from app.utils.redis_client import redis_client
+
+        client = await redis_client.get_client()
+        if client is None:
+            return 0
+        written = 0
+        while True:
+            keys = await client.srandmember(DIRTY_KEY, settings.ANALYTICS_ROLLUP_BATCH_SIZE)
+            if not keys:
+                return written
+            taken = await redis_client.eval(_TAKE_LUA, [DIRTY_KEY, *keys], [])
+            if taken is None:
+                return written
+            buckets = {
+                key: {field: int(value) for field, value in zip(flat[::2], flat[1::2])}
+                for key, flat in zip(taken[::2], taken[1::2])
+                if flat
+            }
+            if not buckets:
+                continue
+            try:
+                await self.write(db, buckets)
+            except Exception as e:
+                await db.rollback()
+                await self._increment(buckets)
+                logger.error(f"Writing {len(buckets)} analytics rollup buckets failed, kept in Redis: {e}")
+                raise
+            written += len(buckets)
+
+    async def write(self, db: AsyncSession, buckets: Dict[str, Dict[str, int]]) -> None:
+        rows = []
+        for key, fields in buckets.items():
+            tenant_id, hour = key[len(PREFIX) + 1:].split(":")
+            by_model: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+            for field, value in fields.items():
+                model, counter = field.rsplit("|", 1)
+                by_model[model][counter] = value
+            for model, counters in by_model.items():
+                rows.append({
+                    "id": uuid.uuid4(),
+                    "tenant_id": uuid.UUID(tenant_id),
+                    "model": model,
+                    "hour": datetime.strptime(hour, "%Y%m%d%H").replace(tzinfo=timezone.utc),
+                    "requests": counters["requests"],
+                    "prompt_tokens": counters["prompt_tokens"],
+                    "completion_tokens": counters["completion_tokens"],
+                    "total_tokens": counters["total_tokens"],
+                    "cost_usd": Decimal(counters["cost_micros"]) / 1_000_000,
+                    "cache_hits": counters["cache_hits"],
+                    "fallbacks": counters["fallbacks"],
+                })
+
+        stmt = pg_insert(AnalyticsRollup).values(rows)
+        additive = ("requests", "prompt_tokens", "completion_tokens", "total_tokens",
+                    "cost_usd", "cache_hits", "fallbacks")
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_analytics_rollups_bucket",
+            set_={
+                **{column: getattr(AnalyticsRollup, column) + getattr(stmt.excluded, column) for column in additive},
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+    async def _increment(self, buckets: Dict[str, Dict[str, int]]) -> None:
+        from app.utils.redis_client import redis_client
+
+        client = await redis_client.get_client()
+        if client is None or not buckets:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for key, fields in buckets.items():
+                    for field, value in fields.items():
+                        pipe.hincrby(key, field, value)
+                    pipe.expire(key, BUCKET_TTL_S)
+                pipe.sadd(DIRTY_KEY, *buckets)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error updating {len(buckets)} analytics rollup buckets: {e}")
+
+
+analytics_rollups = AnalyticsRollups()
@@ -0,0 +1,262 @@
+"""
+app/services/chat_persistence.py
+────────────────────────────────
+Micro-batched persistence of chat turns.
+
+persist_response costs a conversation SELECT, two flushes, four single-row
+INSERTs and a commit per turn. With CHAT_PERSIST_FLUSH_S > 0 the
+persistence task only queues the turn in Redis, and the periodic
+`flush_chat_turns` task writes everything queued in one transaction per
+batch of CHAT_PERSIST_BATCH_SIZE turns:
+
+  - one multi-row INSERT ... ON CONFLICT resolves the conversations of the
+    sessions not already in the conversation map (see conversations.py)
+  - one multi-row INSERT each for messages, llm_usage and analytics_events
+    (the turns are also added to the hourly rollups, analytics_rollups.py)
+
+so the statement count falls from ~8 per turn to ~5 per batch. Row ids are derived
+from the turn's idempotency key (uuid5), so usage rows can reference their
+message without a round trip. Messages carry the time the turn was queued
+(the batch shares one transaction timestamp, which would otherwise tie user
+and assistant rows). Ids and timestamps are therefore the same every time
+a turn is written, and the INSERTs use ON CONFLICT DO NOTHING. A batch
+taken again after its commit (see redis_batch_queue.py) adds no rows, and
+only the turns whose messages were actually inserted reach the rollups.
+
+Credits are charged after the commit through credit_batcher, keyed by the
+turn's task id. A batch that fails as a whole is retried turn by turn
+through persist_response.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.models import AnalyticsEvent, LLMUsage, Message
+from app.services.analytics_rollups import analytics_rollups, keep_raw_event
+from app.services.conversations import conversation_map, upsert_conversations
+from app.utils.redis_batch_queue import RedisBatchQueue
+
+# Namespace of the uuid5 row ids derived from turn idempotency keys
+_ROW_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "chat_persistence")
+
+
+class ChatTurnBatcher:
+    def __init__(self):
+        self.queue = RedisBatchQueue("chat:{turns}")
+
+    async def enqueue(
+        self,
+        idempotency_key: str,
+        tenant_id: uuid.UUID,
+        session_id: str,
+        data: Dict[str, Any],
+    ) -> bool:
+        """Queue a turn for the next flush. False if Redis is unavailable."""
+        return await self.queue.push({
+            "key": idempotency_key,
+            "tenant_id": str(tenant_id),
+            "session_id": session_id,
+            "data": data,
+            "ts": time.time(),
+        })
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write queued turns batch by batch. Returns the number of turns processed."""
+        token = await self.queue.lock()
+        if token is None:
+            return 0  # another flush is draining the queue
+        processed = 0
+        try:
+            while True:
+                turns = await self.queue.take(settings.CHAT_PERSIST_BATCH_SIZE, token)
+                if not turns:
+                    return processed
+                await self.write(db, turns)
+                await self.queue.done(token)
+                processed += len(turns)
+        finally:
+            await self.queue.unlock(token)
+
+    async def write(self, db: AsyncSession, turns: List[dict]) -> None:
+        """
+        persist_turns(), falling back to one turn at a time if the batch
+        fails. Raises (so the caller keeps the batch for a retry) only when
+        every turn failed because the database is unreachable.
+        """
+        try:
+            await self.persist_turns(db, turns)
+        except Exception as e:
+            await db.rollback()
+            await conversation_map.forget({(uuid.UUID(t["tenant_id"]), t["session_id"]) for t in turns})
+            logger.error(f"Batched persistence of {len(turns)} chat turns failed, persisting one by one: {e}")
+            errors = await self._persist_individually(db, turns)
+            if len(errors) == len(turns) and all(_is_unreachable(error) for error in errors):
+                raise errors[-1]
+
+    async def persist_turns(self, db: AsyncSession, turns: List[dict]) -> Dict[str, uuid.UUID]:
+        """
+        Write a batch of turns in one transaction, then charge their credits.
+        Returns the conversation id of each turn by idempotency key.
+        """
+        from app.services.credit_batcher import credit_batcher
+
+        by_key: Dict[str, dict] = {}
+        for turn in turns:
+            by_key.setdefault(turn["key"], turn)
+
+        # 1. Conversations: cached ids, one upsert for the rest
+        started: Dict[Tuple[uuid.UUID, str], float] = {}
+        for turn in by_key.values():
+            session = (uuid.UUID(turn["tenant_id"]), turn["session_id"])
+            started[session] = min(turn["ts"], started.get(session, turn["ts"]))
+        conversations = await upsert_conversations(
+            db, {session: _as_datetime(ts) for session, ts in started.items()}
+        )
+
+        # 2. Messages, usage and analytics rows for every turn
+        messages, usage, events = [], [], []
+        conversation_of: Dict[str, uuid.UUID] = {}
+        for key, turn in by_key.items():
+            tenant_id = uuid.UUID(turn["tenant_id"])
+            conversation_id = conversations[(tenant_id, turn["session_id"])]
+            conversation_of[key] = conversation_id
+            data = turn["data"]
+            created_at = _as_datetime(turn["ts"])
+            bot_message_id = _row_id(key, "assistant")
+            model = data.get("model", "gpt-4o-mini")
+
+            messages.append({
+                "id": _row_id(key, "user"),
+                "conversation_id": conversation_id,
+                "sender": "user",
+                "text": data["query"],
+                "meta": {},
+                "created_at": created_at,
+            })
+            messages.append({
+                "id": bot_message_id,
+                "conversation_id": conversation_id,
+                "sender": "assistant",
+                "text": data["answer"],
+                "meta": {"truncated": True} if data.get("truncated") else {},
+                "created_at": created_at + timedelta(microseconds=1),
+            })
+            usage.append({
+                "id": _row_id(key, "usage"),
+                "tenant_id": tenant_id,
+                "conversation_id": conversation_id,
+                "message_id": bot_message_id,
+                "model": model,
+                "prompt_tokens": data["prompt_tokens"],
+                "completion_tokens": data["completion_tokens"],
+                "total_tokens": data["total_tokens"],
+                "cost_usd": data["cost_usd"],
+                "created_at": created_at,
+            })
+            if keep_raw_event(key):
+                events.append({
+                    "id": _row_id(key, "event"),
+                    "tenant_id": tenant_id,
+                    "event_type": "chat_completion",
+                    "payload": analytics_payload(conversation_id, data),
+                    "created_at": created_at,
+                })
+
+        inserted = set((await db.execute(
+            pg_insert(Message).values(messages).on_conflict_do_nothing().returning(Message.id)
+        )).scalars().all())
+        await db.execute(pg_insert(LLMUsage).values(usage).on_conflict_do_nothing())
+        if events:
+            await db.execute(pg_insert(AnalyticsEvent).values(events).on_conflict_do_nothing())
+        await db.commit()
+        await conversation_map.put_many(conversations)
+        await analytics_rollups.record(
+            (uuid.UUID(turn["tenant_id"]), turn["ts"], turn["data"])
+            for key, turn in by_key.items()
+            if _row_id(key, "assistant") in inserted
+        )
+
+        # 3. Credits, once the conversations they reference are committed
+        # (every turn: a previous attempt may have committed but not charged;
+        # the idempotency key keeps a turn from being charged twice)
+        for key, turn in by_key.items():
+            data = turn["data"]
+            try:
+                await credit_batcher.submit(
+                    db,
+                    key,
+                    tenant_id=uuid.UUID(turn["tenant_id"]),
+                    prompt_tokens=data.get("prompt_tokens", 0),
+                    completion_tokens=data.get("completion_tokens", 0),
+                    conversation_id=conversation_of[key],
+                    request_type="chat",
+                    model=data.get("model", "gpt-4o-mini"),
+                    hold_id=data.get("credit_hold_id"),
+                )
+            except Exception as e:
+                logger.error(f"Failed to charge credits for tenant {turn['tenant_id']}: {e}", exc_info=True)
+
+        logger.info(f"Persisted {len(by_key)} chat turns ({len(conversations)} conversations)")
+        return conversation_of
+
+    async def _persist_individually(self, db: AsyncSession, turns: List[dict]) -> int:
+        """
+        Fallback when a batch cannot be written: one bad turn must not block
+        the rest. Returns the error of each turn dropped.
+        """
+        from app.services.chat_service import chat_service
+
+        errors: List[Exception] = []
+        for turn in turns:
+            try:
+                await chat_service.persist_response(
+                    db=db,
+                    tenant_id=uuid.UUID(turn["tenant_id"]),
+                    session_id=turn["session_id"],
+                    data=turn["data"],
+                    idempotency_key=turn["key"],
+                )
+            except Exception as e:
+                await db.rollback()
+                errors.append(e)
+                logger.error(f"Dropping chat turn {turn['key']} for session {turn['session_id']}: {e}")
+        return errors
+
+
+def analytics_payload(conversation_id: uuid.UUID, data: Dict[str, Any]) -> dict:
+    """Payload of a turn's chat_completion analytics event."""
+    return {
+        "conversation_id": str(conversation_id),
+        "tokens": data["total_tokens"],
+        "cost": float(data["cost_usd"]),
+        "model": data.get("model", "gpt-4o-mini"),
+        "truncated": bool(data.get("truncated", False)),
+    }
+
+
+def _is_unreachable(error: Exception) -> bool:
+    """Connection failures, as opposed to a turn the database rejected."""
+    if isinstance(error, (exc.OperationalError, exc.InterfaceError, OSError)):
+        return True
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+
+def _row_id(key: str, row: str) -> uuid.UUID:
+    return uuid.uuid5(_ROW_ID_NAMESPACE, f"{key}:{row}")
+
+
+def _as_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+chat_turn_batcher = ChatTurnBatcher()
@@ -11,7 +11,6 @@ from sqlalchemy import select
 from app.db.models import (
     KnowledgeBaseChunk,
     KnowledgeBaseEmbedding,
-    Conversation,
     Message,
     LLMUsage,
     AnalyticsEvent,
@@ -19,9 +18,14 @@ from app.db.models import (
     ApiKey,
 )
 from app.core.llm import get_embedding, get_chat_completion, get_chat_completion_stream
+from app.core.deadline import Deadline, DeadlineExceeded, ensure_deadline
+from app.db.replica import execute_read
 from app.prompt.builder import PromptBuilder
+import asyncio
+import json
+import time
 import uuid
-from typing import Optional, Tuple, Dict, Any, TYPE_CHECKING
+from typing import Optional, Tuple, Dict, Any, Callable, Awaitable, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from app.core.plan_limits import PlanLimits
@@ -37,15 +41,189 @@ MODEL_PRICING: Dict[str, Dict[str, float]] = {
 }
 
 
+# Per-stage slices of the request deadline: (cap in seconds, share of what's left)
+EMBEDDING_BUDGET = (30.0, 0.3)
+RETRIEVAL_BUDGET = (10.0, 0.5)
+COMPLETION_BUDGET = (30.0, 1.0)
+# Time kept back after the LLM call for guardrails, caching and scheduling persistence
+POST_PROCESS_RESERVE_S = 0.5
+# An upstream attempt (or retry) is not started with less time than this left
+MIN_ATTEMPT_S = 1.0
+
+
+def _is_retryable_openai_error(e):
+    """Predicate to skip retries for non-transient OpenAI errors."""
+    import openai
+
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(e, openai.RateLimitError):
+        # Do NOT retry if it's a quota issue
+        return "insufficient_quota" not in str(e).lower()
+    if isinstance(e, openai.APIStatusError):
+        # Retry on 500+ errors, but not on 400s (invalid_request, auth, etc)
+        return e.status_code >= 500
+    return False
+
+
+def _openai_retry(deadline: Deadline):
+    """Retry transient OpenAI errors, but only while the request deadline allows it."""
+    from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception
+
+    return retry(
+        wait=deadline.retry_wait(wait_exponential(multiplier=1, min=1, max=5), reserve=MIN_ATTEMPT_S),
+        stop=stop_after_attempt(2) | deadline.retry_stop(reserve=MIN_ATTEMPT_S),
+        retry=retry_if_exception(_is_retryable_openai_error),
+        reraise=True,
+    )
+
+
+def _is_timeout(e: BaseException) -> bool:
+    from fastapi import HTTPException
+
+    if isinstance(e, (DeadlineExceeded, asyncio.TimeoutError)):
+        return True
+    return isinstance(e, HTTPException) and e.status_code == 504
+
+
 def _calc_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
     pricing = MODEL_PRICING.get(model, MODEL_PRICING["gpt-4o-mini"])
     return (prompt_tokens * pricing["prompt"]) + (completion_tokens * pricing["completion"])
 
 
+def _estimate_prompt_tokens(messages: list) -> int:
+    # Rough estimate (1 token ≈ 4 chars), used when a stream is aborted
+    # before OpenAI sends its final usage chunk.
+    return sum(len(m.get("content") or "") for m in messages) // 4
+
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _describe_sources(chunks: list) -> list:
+    """Lightweight, client-safe description of the retrieved chunks."""
+    return [
+        {
+            "chunk_id": str(getattr(chunk, "id", "")),
+            "file_id": str(getattr(chunk, "file_id", "")),
+            "page_no": getattr(chunk, "page_no", None),
+        }
+        for chunk in chunks
+    ]
+
+
+class _PhaseTimer:
+    """Wall-clock milliseconds per pipeline phase, measured from creation."""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self._phases[f"{phase}_ms"] = round((now - self._last) * 1000, 2)
+        self._last = now
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            **self._phases,
+            "elapsed_ms": round((time.perf_counter() - self._start) * 1000, 2),
+        }
+
+
+async def _close_upstream_stream(stream) -> None:
+    """
+    Close an upstream OpenAI stream so generation (and billing) stops at once.
+    Shielded from cancellation because it usually runs while the request
+    task is being torn down after a client disconnect.
+    """
+    import anyio
+
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is None:
+        return
+    with anyio.CancelScope(shield=True):
+        try:
+            await close()
+        except Exception as e:
+            from app.core.logging import logger
+            logger.warning(f"Failed to close upstream LLM stream: {e}")
+
+
+def _query_hash(query: str) -> str:
+    import hashlib
+    return hashlib.md5(query.strip().lower().encode()).hexdigest()
+
+
+class EmbeddingPrefetch:
+    """
+    Query embedding (cache lookup or OpenAI call) started speculatively,
+    before the auth/plan/credit gate has finished. The pipeline awaits it
+    instead of starting its own; if the gate rejects the request or the
+    pipeline never gets to retrieval, it is discarded.
+    """
+
+    __slots__ = ("query_hash", "_task")
+
+    def __init__(self, query_hash: str, task: "asyncio.Task"):
+        self.query_hash = query_hash
+        self._task = task
+
+    def matches(self, query: str) -> bool:
+        return _query_hash(query) == self.query_hash
+
+    async def result(self) -> list:
+        return await self._task
+
+    def discard(self) -> None:
+        if not self._task.done():
+            self._task.cancel()
+
+
+class CreditHold:
+    """
+    The gate's credit reservation for one streamed answer. It is handed to
+    persistence (which settles it) at most once; a stream that ends without
+    persisting anything releases it instead, so the held credits do not stay
+    locked for CREDIT_HOLD_TTL_S.
+    """
+
+    __slots__ = ("tenant_id", "_hold_id")
+
+    def __init__(self, tenant_id: uuid.UUID, hold_id: Optional[str]):
+        self.tenant_id = tenant_id
+        self._hold_id = hold_id
+
+    def take(self) -> Optional[str]:
+        """The hold id for persistence to settle (None once taken)."""
+        hold_id, self._hold_id = self._hold_id, None
+        return hold_id
+
+    async def release(self) -> None:
+        """Give back an untaken hold (shielded: usually runs during teardown)."""
+        import anyio
+        from app.services.credit_counter import credit_counter
+
+        hold_id = self.take()
+        if hold_id:
+            with anyio.CancelScope(shield=True):
+                await credit_counter.settle(self.tenant_id, 0, hold_id)
+
+
 class ChatService:
     def __init__(self):
         self.prompt_builder = PromptBuilder()
 
+    def prefetch_embedding(self, query: str, deadline: Deadline) -> EmbeddingPrefetch:
+        """Start resolving the query embedding in the background."""
+        query_hash = _query_hash(query)
+        task = asyncio.create_task(self._embed_query(query, query_hash, deadline))
+        # Retrieved (or dropped) by the pipeline; don't warn about it on discard
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return EmbeddingPrefetch(query_hash, task)
+
     async def get_response(
         self,
         db: AsyncSession,
@@ -53,6 +231,8 @@ class ChatService:
         query: str,
         session_id: Optional[str] = None,
         plan_limits: Optional["PlanLimits"] = None,
+        deadline: Optional[Deadline] = None,
+        embedding_prefetch: Optional[EmbeddingPrefetch] = None,
     ) -> Tuple[str, str, Dict[str, Any]]:
         """
         Core RAG logic: Retrieve → Prompt → LLM.
@@ -62,10 +242,42 @@ class ChatService:
           - max_tokens_per_request → limits LLM output tokens
           - allowed_models (first entry) → which model to call
 
+        Every stage takes its timeout from `deadline`; when the budget runs
+        out the request degrades to a cached or fallback answer.
+
+        `embedding_prefetch`, if given, is the embedding already started
+        alongside the request gate (see prefetch_embedding).
+
         Returns: (answer, session_id, metadata_for_persistence)
         """
+        try:
+            return await self._get_response(
+                db=db,
+                tenant=tenant,
+                query=query,
+                session_id=session_id,
+                plan_limits=plan_limits,
+                deadline=deadline,
+                embedding_prefetch=embedding_prefetch,
+            )
+        finally:
+            # No-op if retrieval consumed it; cancels it on early returns
+            if embedding_prefetch is not None:
+                embedding_prefetch.discard()
+
+    async def _get_response(
+        self,
+        db: AsyncSession,
+        tenant: Tenant,
+        query: str,
+        session_id: Optional[str],
+        plan_limits: Optional["PlanLimits"],
+        deadline: Optional[Deadline],
+        embedding_prefetch: Optional[EmbeddingPrefetch],
+    ) -> Tuple[str, str, Dict[str, Any]]:
         from app.utils.redis_client import redis_client
-        import hashlib
+
+        deadline = ensure_deadline(deadline)
 
         # Resolve plan-aware settings (or safe defaults)
         if plan_limits is not None:
@@ -98,7 +310,7 @@ class ChatService:
             }
 
         # 1. Check Cache (Full Response)
-        query_hash = hashlib.md5(query.strip().lower().encode()).hexdigest()
+        query_hash = _query_hash(query)
         cache_key = f"cache:chat:{tenant.id}:{query_hash}"
 
         cached_res = await redis_client.get_cache(cache_key)
@@ -116,63 +328,10 @@ class ChatService:
             return cached_res["answer"], session_id, persistence_data
 
         try:
-            from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception, retry_if_exception_type
-            import openai
-
-            def is_retryable_openai_error(e):
-                """Predicate to skip retries for non-transient OpenAI errors."""
-                if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
-                    return True
-                if isinstance(e, openai.RateLimitError):
-                    # Do NOT retry if it's a quota issue
-                    return "insufficient_quota" not in str(e).lower()
-                if isinstance(e, openai.APIStatusError):
-                    # Retry on 500+ errors, but not on 400s (invalid_request, auth, etc)
-                    return e.status_code >= 500
-                return False
-
             # 2. Retrieve chunks (plan-limited)
             try:
-                # 2a. Check Embedding Cache
-                emb_cache_key = f"cache:embedding:{query_hash}"
-                cached_emb_data = await redis_client.get_cache(emb_cache_key)
-                
-                if cached_emb_data and "embedding" in cached_emb_data:
-                    from app.core.logging import logger
-                    logger.info(f"Using cached embedding for query {query_hash}")
-                    embedding = cached_emb_data["embedding"]
-                else:
-                    @retry(
-                        wait=wait_exponential(multiplier=1, min=1, max=5),
-                        stop=stop_after_attempt(2),
-                        retry=retry_if_exception(is_retryable_openai_error)
-                    )
-                    async def fetch_embedding_with_retry():
-                        return await get_embedding(query)
-                    
-                    embedding = await fetch_embedding_with_retry()
-                    # Cache embedding for 7 days
-                    await redis_client.set_cache(emb_cache_key, {"embedding": embedding}, ttl=604800)
-
-                query_stmt = (
-                    select(KnowledgeBaseChunk)
-                    .join(
-                        KnowledgeBaseEmbedding,
-                        KnowledgeBaseChunk.id == KnowledgeBaseEmbedding.chunk_id,
-                    )
-                    .where(
-                        KnowledgeBaseEmbedding.tenant_id == tenant.id,
-                        KnowledgeBaseEmbedding.model == "text-embedding-3-small",
-                        KnowledgeBaseChunk.status == "active",
-                    )
-                    .order_by(
-                        KnowledgeBaseEmbedding.embedding.cosine_distance(embedding)
-                    )
-                    .limit(max_chunks)   # ← plan-limited
-                )
-
-                result = await db.execute(query_stmt)
-                chunks = result.scalars().all()
+                embedding = await self._resolve_embedding(query, query_hash, deadline, embedding_prefetch)
+                chunks = await self._retrieve_chunks(db, tenant, embedding, max_chunks, deadline)
             except Exception as e:
                 from app.core.logging import logger
                 logger.error(f"Retrieval Error for tenant {tenant.id}: {e}")
@@ -180,7 +339,11 @@ class ChatService:
                 # Check for quota error in retrieval (embeddings call)
                 if "insufficient_quota" in str(e).lower():
                     await redis_client.set_str("cb:openai:quota_exceeded", "1", ttl=3600) # Break for 1 hour
-                
+
+                # Out of time: don't pretend the knowledge base had nothing
+                if _is_timeout(e):
+                    raise
+
                 chunks = [] # Fallback to no context if DB fails
 
             # Early release: We've finished all DB reads for the RAG context.
@@ -227,16 +390,14 @@ class ChatService:
 
             # 4. Call LLM (plan-limited model & max_tokens)
             try:
-                @retry(
-                    wait=wait_exponential(multiplier=1, min=1, max=5),
-                    stop=stop_after_attempt(2),
-                    retry=retry_if_exception(is_retryable_openai_error)
-                )
+                @_openai_retry(deadline)
                 async def fetch_completion_with_retry():
+                    deadline.check("completion", MIN_ATTEMPT_S)
                     return await get_chat_completion(
                         messages,
                         model=model,
                         max_tokens=max_tokens,
+                        timeout=deadline.timeout(*COMPLETION_BUDGET, reserve=POST_PROCESS_RESERVE_S),
                     )
 
                 llm_completion = await fetch_completion_with_retry()
@@ -281,6 +442,26 @@ class ChatService:
             from app.core.logging import logger
             logger.error(f"ChatService Global Error for tenant {tenant.id}: {e}")
 
+            if _is_timeout(e):
+                logger.warning(
+                    "chat_deadline_exceeded",
+                    tenant_id=str(tenant.id),
+                    budget_s=deadline.budget,
+                )
+                # A concurrent request may have answered the same question meanwhile
+                cached_res = await redis_client.get_cache(cache_key)
+                if cached_res:
+                    return cached_res["answer"], session_id, {
+                        "query": query,
+                        "answer": cached_res["answer"],
+                        "model": model,
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                        "cost_usd": 0.0,
+                        "cached": True,
+                    }
+
             if await redis_client.is_circuit_broken():
                  fallback_answer = "Our AI service is temporarily unavailable due to capacity limits. Please try again later."
             else:
@@ -295,94 +476,172 @@ class ChatService:
                 "total_tokens": 0,
                 "cost_usd": 0.0,
                 "cached": False,
-                "error": True,
+                "error": "deadline_exceeded" if _is_timeout(e) else True,
             }
             return fallback_answer, session_id, persistence_data
 
+    async def _resolve_embedding(
+        self,
+        query: str,
+        query_hash: str,
+        deadline: Deadline,
+        embedding_prefetch: Optional[EmbeddingPrefetch],
+    ) -> list:
+        """Use the speculative embedding when it is for this query, else fetch now."""
+        if embedding_prefetch is not None and embedding_prefetch.query_hash == query_hash:
+            return await embedding_prefetch.result()
+        return await self._embed_query(query, query_hash, deadline)
+
+    async def _embed_query(self, query: str, query_hash: str, deadline: Deadline) -> list:
+        """
+        Embedding for the query: Redis cache first, then OpenAI within the
+        embedding share of the request deadline.
+        """
+        from app.utils.redis_client import redis_client
+
+        emb_cache_key = f"cache:embedding:{query_hash}"
+        cached_emb_data = await redis_client.get_cache(emb_cache_key)
+
+        if cached_emb_data and "embedding" in cached_emb_data:
+            from app.core.logging import logger
+            logger.info(f"Using cached embedding for query {query_hash}")
+            return cached_emb_data["embedding"]
+
+        @_openai_retry(deadline)
+        async def fetch_embedding_with_retry():
+            deadline.check("embedding", MIN_ATTEMPT_S)
+            return await get_embedding(query, timeout=deadline.timeout(*EMBEDDING_BUDGET))
+
+        embedding = await fetch_embedding_with_retry()
+        # Cache embedding for 7 days
+        await redis_client.set_cache(emb_cache_key, {"embedding": embedding}, ttl=604800)
+        return embedding
+
+    async def _retrieve_chunks(
+        self,
+        db: AsyncSession,
+        tenant: Tenant,
+        embedding: list,
+        max_chunks: int,
+        deadline: Deadline,
+    ) -> list:
+        """pgvector similarity search, bounded by the retrieval share of the deadline."""
+        deadline.check("retrieval")
+        query_stmt = (
+            select(KnowledgeBaseChunk)
+            .join(
+                KnowledgeBaseEmbedding,
+                KnowledgeBaseChunk.id == KnowledgeBaseEmbedding.chunk_id,
+            )
+            .where(
+                KnowledgeBaseEmbedding.tenant_id == tenant.id,
+                KnowledgeBaseEmbedding.model == "text-embedding-3-small",
+                KnowledgeBaseChunk.status == "active",
+            )
+            .order_by(
+                KnowledgeBaseEmbedding.embedding.cosine_distance(embedding)
+            )
+            .limit(max_chunks)   # ← plan-limited
+        )
+
+        # On the read replica when one is configured and fresh
+        result = await asyncio.wait_for(
+            execute_read(db, query_stmt),
+            timeout=deadline.timeout(*RETRIEVAL_BUDGET),
+        )
+        return result.scalars().all()
+
     async def persist_response(
         self,
         db: AsyncSession,
         tenant_id: uuid.UUID,
         session_id: str,
         data: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
     ):
         """
         Save conversation history, usage, and analytics to the database.
         Designed to be run as a background task.
+
+        Credits are charged after the commit, through the batched charger
+        when enabled; `idempotency_key` (the task id) keeps a redelivered
+        task from charging twice.
         """
-        # 1. Handle Conversation
-        conv_result = await db.execute(
-            select(Conversation).where(
-                Conversation.session_id == session_id,
-                Conversation.tenant_id == tenant_id,
+        from app.services.analytics_rollups import analytics_rollups, keep_raw_event
+        from app.services.chat_persistence import analytics_payload
+        from app.services.conversations import conversation_map, upsert_conversation
+
+        session = (tenant_id, session_id)
+        try:
+            # 1. Handle Conversation (cached id, or one upsert)
+            conversation_id = await upsert_conversation(db, tenant_id, session_id)
+
+            # 2. Save Messages
+            user_msg = Message(
+                conversation_id=conversation_id,
+                sender="user",
+                text=data["query"],
             )
-        )
-        conversation = conv_result.scalars().first()
-        if not conversation:
-            conversation = Conversation(tenant_id=tenant_id, session_id=session_id)
-            db.add(conversation)
+            db.add(user_msg)
+
+            bot_msg = Message(
+                conversation_id=conversation_id,
+                sender="assistant",
+                text=data["answer"],
+                # Streamed answers cut short by a client disconnect
+                meta={"truncated": True} if data.get("truncated") else {},
+            )
+            db.add(bot_msg)
             await db.flush()
 
-        # 2. Save Messages
-        user_msg = Message(
-            conversation_id=conversation.id,
-            sender="user",
-            text=data["query"],
-        )
-        db.add(user_msg)
+            # 3. Save Usage (record actual model used)
+            llm_usage = LLMUsage(
+                tenant_id=tenant_id,
+                conversation_id=conversation_id,
+                message_id=bot_msg.id,
+                model=data.get("model", "gpt-4o-mini"),
+                prompt_tokens=data["prompt_tokens"],
+                completion_tokens=data["completion_tokens"],
+                total_tokens=data["total_tokens"],
+                cost_usd=data["cost_usd"],
+            )
+            db.add(llm_usage)
+
+            # 4. Analytics (raw event, possibly sampled; the hourly rollup counts every turn)
+            if keep_raw_event():
+                event = AnalyticsEvent(
+                    tenant_id=tenant_id,
+                    event_type="chat_completion",
+                    payload=analytics_payload(conversation_id, data),
+                )
+                db.add(event)
 
-        bot_msg = Message(
-            conversation_id=conversation.id,
-            sender="assistant",
-            text=data["answer"],
-        )
-        db.add(bot_msg)
-        await db.flush()
-
-        # 3. Save Usage (record actual model used)
-        llm_usage = LLMUsage(
-            tenant_id=tenant_id,
-            conversation_id=conversation.id,
-            message_id=bot_msg.id,
-            model=data.get("model", "gpt-4o-mini"),
-            prompt_tokens=data["prompt_tokens"],
-            completion_tokens=data["completion_tokens"],
-            total_tokens=data["total_tokens"],
-            cost_usd=data["cost_usd"],
-        )
-        db.add(llm_usage)
-
-        # 4. Analytics
-        event = AnalyticsEvent(
-            tenant_id=tenant_id,
-            event_type="chat_completion",
-            payload={
-                "conversation_id": str(conversation.id),
-                "tokens": data["total_tokens"],
-                "cost": float(data["cost_usd"]),
-                "model": data.get("model", "gpt-4o-mini"),
-            },
-        )
-        db.add(event)
+            await db.commit()
+        except Exception:
+            # The cached conversation id may be what failed
+            await conversation_map.forget([session])
+            raise
+        await conversation_map.put_many({session: conversation_id})
+        await analytics_rollups.record([(tenant_id, time.time(), data)])
 
         # 5. Deduct Credits
         try:
-            from app.services.credit_service import charge_credits
-            await charge_credits(
-                db=db,
+            from app.services.credit_batcher import credit_batcher
+            await credit_batcher.submit(
+                db,
+                idempotency_key or str(uuid.uuid4()),
                 tenant_id=tenant_id,
                 prompt_tokens=data.get("prompt_tokens", 0),
                 completion_tokens=data.get("completion_tokens", 0),
-                conversation_id=conversation.id,
+                conversation_id=conversation_id,
                 request_type="chat",
-                model=data.get("model", "gpt-4o-mini")
+                model=data.get("model", "gpt-4o-mini"),
+                hold_id=data.get("credit_hold_id"),
             )
         except Exception as e:
             from app.core.logging import logger
             logger.error(f"Failed to charge credits for tenant {tenant_id}: {e}", exc_info=True)
 
-        await db.commit()
-
 
     async def get_streaming_response(
         self,
@@ -391,18 +650,87 @@ class ChatService:
         query: str,
         session_id: Optional[str] = None,
         plan_limits: Optional["PlanLimits"] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        event_stream: bool = False,
+        deadline: Optional[Deadline] = None,
+        embedding_prefetch: Optional[EmbeddingPrefetch] = None,
+        credit_hold_id: Optional[str] = None,
     ):
         """
         Streaming version of the RAG pipeline.
         Yields tokens and handles background persistence.
+
+        With `event_stream=True` the output is Server-Sent Events instead of
+        raw text: a `status` event is sent immediately, a `sources` event as
+        soon as retrieval finishes (while the LLM request is still in
+        flight), then `token` events and a final `done` event carrying
+        per-phase server timings.
+
+        If the client disconnects mid-answer (detected via `is_disconnected`
+        or task cancellation), or `deadline` runs out, the upstream stream is
+        closed immediately and the partial answer is persisted with
+        `truncated=True`.
+
+        `credit_hold_id` is the gate's credit reservation, settled when the
+        answer is persisted and released when the stream ends without one.
+        """
+        credit_hold = CreditHold(tenant.id, credit_hold_id)
+        events = self._stream_events(
+            db=db,
+            tenant=tenant,
+            query=query,
+            session_id=session_id,
+            plan_limits=plan_limits,
+            is_disconnected=is_disconnected,
+            deadline=ensure_deadline(deadline),
+            embedding_prefetch=embedding_prefetch,
+            credit_hold=credit_hold,
+        )
+        try:
+            async for event, data in events:
+                if event_stream:
+                    yield _format_sse(event, data)
+                elif event == "token":
+                    yield data["text"]
+        finally:
+            # Propagate early close to the inner generator so it can clean up
+            await events.aclose()
+            if embedding_prefetch is not None:
+                embedding_prefetch.discard()
+            # Early exits (circuit breaker, timeouts, no context, LLM errors)
+            # and disconnects before the answer was persisted
+            await credit_hold.release()
+
+    async def _stream_events(
+        self,
+        db: AsyncSession,
+        tenant: Tenant,
+        query: str,
+        session_id: Optional[str] = None,
+        plan_limits: Optional["PlanLimits"] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        deadline: Optional[Deadline] = None,
+        embedding_prefetch: Optional[EmbeddingPrefetch] = None,
+        credit_hold: Optional[CreditHold] = None,
+    ):
+        """
+        Core streaming pipeline. Yields (event, data) tuples; see
+        get_streaming_response for the event protocol. `credit_hold` is only
+        taken on the paths that schedule persistence.
         """
         from app.utils.redis_client import redis_client
-        import hashlib
-        import json
+        from app.core.logging import logger
+
+        timings = _PhaseTimer()
+        deadline = ensure_deadline(deadline)
+        credit_hold = credit_hold or CreditHold(tenant.id, None)
 
         if not session_id:
             session_id = str(uuid.uuid4())
 
+        # Flush something right away so the client knows we're working
+        yield "status", {"phase": "retrieving", "session_id": session_id}
+
         # Resolve plan-aware settings (or safe defaults)
         if plan_limits is not None:
             max_chunks = plan_limits.model_limits.max_chunks_per_query
@@ -415,78 +743,38 @@ class ChatService:
 
         # 0. Check Circuit Breaker
         if await redis_client.is_circuit_broken():
-            from app.core.logging import logger
             logger.warning(f"Circuit Breaker active for tenant {tenant.id}. Skipping Streaming LLM.")
-            yield "Our AI service is temporarily unavailable due to capacity limits. Please try again later."
+            yield "token", {"text": "Our AI service is temporarily unavailable due to capacity limits. Please try again later."}
+            yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
             return
 
         # 1. Retrieve chunks
         try:
-            from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception
-            import openai
-
-            def is_retryable_openai_error(e):
-                """Predicate to skip retries for non-transient OpenAI errors."""
-                if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
-                    return True
-                if isinstance(e, openai.RateLimitError):
-                    return "insufficient_quota" not in str(e).lower()
-                if isinstance(e, openai.APIStatusError):
-                    return e.status_code >= 500
-                return False
-
-            query_hash = hashlib.md5(query.strip().lower().encode()).hexdigest()
-            emb_cache_key = f"cache:embedding:{query_hash}"
-            cached_emb_data = await redis_client.get_cache(emb_cache_key)
-
-            if cached_emb_data and "embedding" in cached_emb_data:
-                from app.core.logging import logger
-                logger.info(f"Using cached embedding for streaming query {query_hash}")
-                embedding = cached_emb_data["embedding"]
-            else:
-                @retry(
-                    wait=wait_exponential(multiplier=1, min=1, max=5),
-                    stop=stop_after_attempt(2),
-                    retry=retry_if_exception(is_retryable_openai_error)
-                )
-                async def fetch_embedding_with_retry():
-                    return await get_embedding(query)
-                
-                embedding = await fetch_embedding_with_retry()
-                await redis_client.set_cache(emb_cache_key, {"embedding": embedding}, ttl=604800)
-
-            query_stmt = (
-                select(KnowledgeBaseChunk)
-                .join(
-                    KnowledgeBaseEmbedding,
-                    KnowledgeBaseChunk.id == KnowledgeBaseEmbedding.chunk_id,
-                )
-                .where(
-                    KnowledgeBaseEmbedding.tenant_id == tenant.id,
-                    KnowledgeBaseEmbedding.model == "text-embedding-3-small",
-                    KnowledgeBaseChunk.status == "active",
-                )
-                .order_by(
-                    KnowledgeBaseEmbedding.embedding.cosine_distance(embedding)
-                )
-                .limit(max_chunks)
-            )
-            result = await db.execute(query_stmt)
-            chunks = result.scalars().all()
+            query_hash = _query_hash(query)
+            embedding = await self._resolve_embedding(query, query_hash, deadline, embedding_prefetch)
+            timings.mark("embedding")
+            chunks = await self._retrieve_chunks(db, tenant, embedding, max_chunks, deadline)
         except Exception as e:
-            from app.core.logging import logger
             logger.error(f"Streaming Retrieval Error for tenant {tenant.id}: {e}")
             if "insufficient_quota" in str(e).lower():
                 await redis_client.set_str("cb:openai:quota_exceeded", "1", ttl=3600)
+            if _is_timeout(e):
+                logger.warning("chat_deadline_exceeded", tenant_id=str(tenant.id), budget_s=deadline.budget)
+                await db.close()
+                yield "token", {"text": "I'm having trouble thinking right now. Please try again."}
+                yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
+                return
             chunks = []
+        timings.mark("retrieval")
             
         await db.close()
 
         # --- RETRIEVAL-FIRST FLOW (Streaming) ---
         if not chunks:
-            from app.core.logging import logger
             logger.info(f"No context found for tenant {tenant.id} in streaming request. Returning fallback.")
-            yield "I'm sorry, I don't have enough information to answer that based on my knowledge base."
+            yield "sources", {"sources": [], "timings": timings.as_dict()}
+            yield "token", {"text": "I'm sorry, I don't have enough information to answer that based on my knowledge base."}
+            yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
             return
 
         # 2. Build prompt
@@ -495,7 +783,8 @@ class ChatService:
         # 🚨 HARD GATE: Check if prompt builder returned a direct answer (bypass streaming LLM)
         if isinstance(messages, str):
             answer = self.prompt_builder.enforce_output_rules(messages)
-            yield answer
+            yield "sources", {"sources": _describe_sources(chunks), "timings": timings.as_dict()}
+            yield "token", {"text": answer}
             
             # Post-stream persistence for bypassed results
             persistence_data = {
@@ -507,80 +796,181 @@ class ChatService:
                 "total_tokens": 0,
                 "cost_usd": 0.0,
                 "cached": False,
+                "credit_hold_id": credit_hold.take(),
             }
-            from app.tasks.background import persist_chat_response
-            persist_chat_response.delay(
-                tenant_id_str=str(tenant.id),
-                session_id=session_id,
-                data=persistence_data,
-            )
+            from app.services.chat_stream import schedule_chat_persistence
+            schedule_chat_persistence(tenant.id, session_id, persistence_data)
+            yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
             return
 
-        # 3. Call Streaming LLM
-        try:
-            stream = await get_chat_completion_stream(
+        # 3. Call Streaming LLM. The request is started first so the sources
+        # event goes out while OpenAI is still working on the first token.
+        stream_task = asyncio.create_task(
+            get_chat_completion_stream(
                 messages,
                 model=model,
                 max_tokens=max_tokens,
+                timeout=deadline.timeout(*COMPLETION_BUDGET, reserve=POST_PROCESS_RESERVE_S),
             )
+        )
+        try:
+            yield "sources", {"sources": _describe_sources(chunks), "timings": timings.as_dict()}
+            yield "status", {"phase": "generating"}
+            stream = await stream_task
         except Exception as e:
-            from app.core.logging import logger
             logger.error(f"Streaming LLM Error for tenant {tenant.id}: {e}")
             if "insufficient_quota" in str(e).lower():
                 await redis_client.set_str("cb:openai:quota_exceeded", "1", ttl=3600)
-            yield "I'm having trouble thinking right now. Please try again."
+            yield "token", {"text": "I'm having trouble thinking right now. Please try again."}
+            yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
             return
+        except BaseException:
+            # Client left before the LLM answered: don't leave the request running
+            stream_task.cancel()
+            if stream_task.done() and not stream_task.cancelled() and stream_task.exception() is None:
+                await _close_upstream_stream(stream_task.result())
+            raise
+        timings.mark("llm_connect")
 
         full_answer = []
         usage_data = None
+        delta_count = 0
+        truncated = False
+        truncated_reason = None
+        # Apply output guardrails (links, emojis, etc.) on the fly
+        output_guard = self.prompt_builder.output_guard()
 
-        async for chunk in stream:
-            if chunk.choices and chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                full_answer.append(content)
-                yield content
-            
-            if hasattr(chunk, 'usage') and chunk.usage:
-                usage_data = chunk.usage
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content = output_guard.feed(chunk.choices[0].delta.content)
+                    if delta_count == 0:
+                        timings.mark("first_token")
+                    delta_count += 1
+                    if content:
+                        full_answer.append(content)
+                        yield "token", {"text": content}
+
+                if hasattr(chunk, 'usage') and chunk.usage:
+                    usage_data = chunk.usage
+
+                # Stop paying for tokens nobody will read
+                if is_disconnected is not None and await is_disconnected():
+                    truncated, truncated_reason = True, "client_disconnected"
+                    break
+                if deadline.expired:
+                    truncated, truncated_reason = True, "deadline_exceeded"
+                    break
+        except (asyncio.CancelledError, GeneratorExit):
+            # Starlette cancels the response task (or closes the generator)
+            # when the client goes away mid-stream.
+            truncated, truncated_reason = True, "client_disconnected"
+            raise
+        finally:
+            if truncated:
+                logger.info(
+                    "stream_truncated",
+                    reason=truncated_reason,
+                    tenant_id=str(tenant.id),
+                    session_id=session_id,
+                    completion_chunks=delta_count,
+                )
+                await _close_upstream_stream(stream)
+                full_answer.append(output_guard.flush())
+                self._schedule_stream_persistence(
+                    tenant=tenant,
+                    session_id=session_id,
+                    query=query,
+                    model=model,
+                    messages=messages,
+                    answer="".join(full_answer),
+                    usage_data=usage_data,
+                    completion_chunks=delta_count,
+                    truncated=True,
+                    credit_hold_id=credit_hold.take(),
+                )
+
+        if truncated:
+            if truncated_reason == "deadline_exceeded":
+                # The client is still there: give it the held-back tail
+                if full_answer[-1]:
+                    yield "token", {"text": full_answer[-1]}
+                yield "done", {"session_id": session_id, "truncated": True, "timings": timings.as_dict()}
+            return
+
+        tail = output_guard.flush()
+        if tail:
+            full_answer.append(tail)
+            yield "token", {"text": tail}
+        timings.mark("generation")
 
         # 4. Persistence & Cleanup (Post-stream)
         answer_str = "".join(full_answer)
-        
-        # Calculate cost if usage_data is available
-        prompt_tokens = 0
-        completion_tokens = 0
-        total_tokens = 0
-        cost_usd = 0.0
-        
+        self._schedule_stream_persistence(
+            tenant=tenant,
+            session_id=session_id,
+            query=query,
+            model=model,
+            messages=messages,
+            answer=answer_str,
+            usage_data=usage_data,
+            completion_chunks=delta_count,
+            credit_hold_id=credit_hold.take(),
+        )
+
+        # Cache the result
+        query_hash = _query_hash(query)
+        cache_key = f"cache:chat:{tenant.id}:{query_hash}"
+        await redis_client.set_cache(cache_key, {"answer": answer_str}, ttl=86400)
+
+        logger.info("stream_timings", tenant_id=str(tenant.id), **timings.as_dict())
+        yield "done", {"session_id": session_id, "truncated": False, "timings": timings.as_dict()}
+
+    def _schedule_stream_persistence(
+        self,
+        tenant: Tenant,
+        session_id: str,
+        query: str,
+        model: str,
+        messages: list,
+        answer: str,
+        usage_data: Any,
+        completion_chunks: int,
+        truncated: bool = False,
+        credit_hold_id: Optional[str] = None,
+    ) -> None:
+        """
+        Build persistence data for a streamed answer and schedule it via Celery.
+        Aborted streams never receive OpenAI's final usage chunk, so their
+        usage is estimated from the prompt size and the deltas received.
+        """
         if usage_data:
             prompt_tokens = usage_data.prompt_tokens
             completion_tokens = usage_data.completion_tokens
             total_tokens = usage_data.total_tokens
-            cost_usd = _calc_cost(model, prompt_tokens, completion_tokens)
+        elif truncated:
+            prompt_tokens = _estimate_prompt_tokens(messages)
+            completion_tokens = completion_chunks
+            total_tokens = prompt_tokens + completion_tokens
+        else:
+            prompt_tokens = completion_tokens = total_tokens = 0
 
         persistence_data = {
             "query": query,
-            "answer": answer_str,
+            "answer": answer,
             "model": model,
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens,
             "total_tokens": total_tokens,
-            "cost_usd": cost_usd,
+            "cost_usd": _calc_cost(model, prompt_tokens, completion_tokens) if total_tokens else 0.0,
             "cached": False,
+            "credit_hold_id": credit_hold_id,
         }
+        if truncated:
+            persistence_data["truncated"] = True
 
         # Schedule background persistence
-        from app.tasks.background import persist_chat_response
-        persist_chat_response.delay(
-            tenant_id_str=str(tenant.id),
-            session_id=session_id,
-            data=persistence_data,
-        )
-
-        # Cache the result
-        query_hash = hashlib.md5(query.strip().lower().encode()).hexdigest()
-        cache_key = f"cache:chat:{tenant.id}:{query_hash}"
-        await redis_client.set_cache(cache_key, {"answer": answer_str}, ttl=86400)
-
+        from app.services.chat_stream import schedule_chat_persistence
+        schedule_chat_persistence(tenant.id, session_id, persistence_data)
 
 chat_service = ChatService()
@@ -0,0 +1,202 @@
+"""
+app/services/chat_stream.py
+───────────────────────────
+Redis Streams write-behind log for chat persistence.
+
+With CHAT_PERSIST_TRANSPORT = "stream" a finished turn is not sent through
+Celery (result backend, task_track_started and a per-task ack for what is
+an append-only event). It is appended as one compact XADD to the
+`chat:turns` stream. The request does not wait for the append.
+
+Consumers (app/stream_worker.py) share the consumer group `persisters`.
+Each one:
+  - reclaims entries left pending for CHAT_STREAM_CLAIM_IDLE_MS by a crashed
+    consumer (XAUTOCLAIM), otherwise reads new ones (XREADGROUP)
+  - writes the batch with ChatTurnBatcher.write (bulk INSERTs, one
+    transaction)
+  - acks the whole batch with one XACK
+
+The stream has no MAXLEN cap, because that would trim turns no consumer
+has read yet. Every CHAT_STREAM_TRIM_S a consumer trims it with XTRIM MINID
+up to the oldest entry still pending in the group, or its last-delivered
+id when nothing is pending. Only acked entries are removed, and a backlog
+beyond CHAT_STREAM_BACKLOG_WARN entries is logged. Entries XAUTOCLAIM
+reports as deleted are acked so they leave the pending list.
+
+The entry id is the turn's idempotency key, so a reclaimed entry is never
+charged twice. Throughput scales by adding consumers. If Redis rejects the
+append, the turn falls back to the Celery task.
+
+Needs Redis >= 6.2 (XAUTOCLAIM).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.core.logging import logger
+
+STREAM_KEY = "chat:turns"
+GROUP = "persisters"
+
+
+def schedule_chat_persistence(tenant_id: uuid.UUID, session_id: str, data: Dict[str, Any]) -> None:
+    """Hand a finished turn to the configured persistence transport without blocking."""
+    if settings.CHAT_PERSIST_TRANSPORT == "stream":
+        try:
+            chat_turn_stream.append_soon(tenant_id, session_id, data)
+            return
+        except RuntimeError:
+            pass  # no running event loop: use Celery
+    _enqueue_celery(tenant_id, session_id, data)
+
+
+def _enqueue_celery(tenant_id: uuid.UUID, session_id: str, data: Dict[str, Any]) -> None:
+    from app.tasks.background import persist_chat_response
+    from app.tasks.publisher import enqueue_task
+    enqueue_task(
+        persist_chat_response,
+        tenant_id_str=str(tenant_id),
+        session_id=session_id,
+        data=data,
+    )
+
+
+class ChatTurnStream:
+    def __init__(self):
+        self._appends: Set[asyncio.Task] = set()
+        self._next_trim = 0.0
+
+    # ─── Producer ────────────────────────────────────────────────────────────
+
+    def append_soon(self, tenant_id: uuid.UUID, session_id: str, data: Dict[str, Any]) -> None:
+        """Schedule the XADD on the running loop (raises RuntimeError without one)."""
+        task = asyncio.get_running_loop().create_task(self._append(tenant_id, session_id, data))
+        self._appends.add(task)
+        task.add_done_callback(self._appends.discard)
+
+    async def _append(self, tenant_id: uuid.UUID, session_id: str, data: Dict[str, Any]) -> None:
+        from app.utils.redis_client import redis_client
+        entry_id = await redis_client.xadd(
+            STREAM_KEY,
+            {"t": str(tenant_id), "s": session_id, "d": json.dumps(data), "ts": f"{time.time():.6f}"},
+        )
+        if entry_id is None:
+            logger.warning(f"Chat turn stream unavailable, persisting session {session_id} via Celery")
+            _enqueue_celery(tenant_id, session_id, data)
+
+    async def drain(self) -> None:
+        """Wait for appends still in flight (app shutdown)."""
+        if self._appends:
+            await asyncio.gather(*self._appends, return_exceptions=True)
+
+    # ─── Consumer ────────────────────────────────────────────────────────────
+
+    async def ensure_group(self) -> None:
+        from app.utils.redis_client import redis_client
+        client = await redis_client.get_client()
+        try:
+            await client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read_batch(self, consumer: str) -> List[tuple]:
+        """Stale pending entries first, then new ones (blocking up to CHAT_STREAM_BLOCK_MS)."""
+        from app.utils.redis_client import redis_client
+        client = await redis_client.get_client()
+        count = settings.CHAT_STREAM_BATCH_SIZE
+
+        claimed = await client.xautoclaim(
+            STREAM_KEY, GROUP, consumer,
+            min_idle_time=settings.CHAT_STREAM_CLAIM_IDLE_MS, start_id="0-0", count=count,
+        )
+        entries = [entry for entry in claimed[1] if entry and entry[1]]
+        # Pending entries that no longer exist in the stream can never be
+        # processed; ack them so they leave the pending list
+        deleted = list(claimed[2]) if len(claimed) > 2 else []
+        deleted += [entry[0] for entry in claimed[1] if entry and not entry[1]]
+        if deleted:
+            logger.error(f"Consumer {consumer} found {len(deleted)} pending chat turns deleted from the stream")
+            await client.xack(STREAM_KEY, GROUP, *deleted)
+        if entries:
+            logger.warning(f"Consumer {consumer} reclaimed {len(entries)} stale chat turns")
+            return entries
+
+        response = await client.xreadgroup(
+            GROUP, consumer, {STREAM_KEY: ">"}, count=count, block=settings.CHAT_STREAM_BLOCK_MS,
+        )
+        return response[0][1] if response else []
+
+    async def ack(self, entry_ids: List[str]) -> None:
+        from app.utils.redis_client import redis_client
+        client = await redis_client.get_client()
+        await client.xack(STREAM_KEY, GROUP, *entry_ids)
+
+    async def trim(self) -> int:
+        """Drop entries the group has acked (never unread or pending ones). Returns the number removed."""
+        from app.utils.redis_client import redis_client
+        client = await redis_client.get_client()
+        if client is None:
+            return 0
+        # Read last-delivered before the pending summary: an entry delivered
+        # in between is newer than the id read first
+        groups = await client.xinfo_groups(STREAM_KEY)
+        group = next((g for g in groups if g["name"] == GROUP), None)
+        if group is None:
+            return 0
+        min_id = group["last-delivered-id"]
+        pending = await client.xpending(STREAM_KEY, GROUP)
+        if pending["pending"]:
+            min_id = pending["min"]
+        removed = await client.xtrim(STREAM_KEY, minid=min_id, approximate=True)
+        backlog = await client.xlen(STREAM_KEY)
+        if backlog > settings.CHAT_STREAM_BACKLOG_WARN:
+            logger.warning(f"Chat turn stream backlog is {backlog} entries; consumers are falling behind")
+        return removed
+
+    async def _trim_if_due(self) -> None:
+        if time.monotonic() < self._next_trim:
+            return
+        self._next_trim = time.monotonic() + settings.CHAT_STREAM_TRIM_S
+        await self.trim()
+
+    async def consume(self, consumer: str, sessions, stop: Optional[asyncio.Event] = None) -> None:
+        """Read, write and ack batches until `stop` is set."""
+        from app.services.chat_persistence import chat_turn_batcher
+
+        await self.ensure_group()
+        while stop is None or not stop.is_set():
+            try:
+                await self._trim_if_due()
+                entries = await self.read_batch(consumer)
+                if not entries:
+                    continue
+                turns = [_decode(entry_id, fields) for entry_id, fields in entries]
+                async with sessions() as db:
+                    await chat_turn_batcher.write(db, turns)
+                await self.ack([entry_id for entry_id, _ in entries])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Unacked entries stay pending and are reclaimed later
+                logger.error(f"Chat turn consumer {consumer} failed: {e}")
+                await asyncio.sleep(1)
+
+
+def _decode(entry_id: str, fields: Dict[str, str]) -> dict:
+    return {
+        "key": f"stream:{entry_id}",
+        "tenant_id": fields["t"],
+        "session_id": fields["s"],
+        "data": json.loads(fields["d"]),
+        "ts": float(fields["ts"]),
+    }
+
+
+chat_turn_stream = ChatTurnStream()
@@ -0,0 +1,136 @@
+"""
+app/services/conversations.py
+─────────────────────────────
+Conversation upsert with a cached session -> conversation id map.
+
+Persisting a turn used to look the conversation up by (session_id,
+tenant_id) and insert it on a miss, so two concurrent turns of a new
+session could both miss and create duplicates. conversations now has a
+unique (tenant_id, session_id) constraint and the conversation is
+resolved with INSERT ... ON CONFLICT ... RETURNING id, which returns the
+existing row's id when there is one.
+
+Once the turn is committed, the id is remembered in-process (bounded
+LRU) and in Redis (`conv:{tenant_id}:{session_id}`), both for
+CONVERSATION_MAP_TTL_S from the session's last turn, so follow-up turns
+skip the statement entirely. A cached id can only go stale if its
+conversation is deleted inside that window; persistence forgets a
+session's entry whenever writing to it fails.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Conversation
+
+SessionKey = Tuple[uuid.UUID, str]
+
+
+def _redis_key(tenant_id: uuid.UUID, session_id: str) -> str:
+    return f"conv:{tenant_id}:{session_id}"
+
+
+class ConversationMap:
+    def __init__(self):
+        self._local: "OrderedDict[SessionKey, Tuple[uuid.UUID, float]]" = OrderedDict()
+
+    async def get_many(self, sessions: Iterable[SessionKey]) -> Dict[SessionKey, uuid.UUID]:
+        """Cached conversation ids for `sessions` (misses are left out)."""
+        from app.utils.redis_client import redis_client
+
+        now = time.monotonic()
+        found: Dict[SessionKey, uuid.UUID] = {}
+        missing = []
+        for session in sessions:
+            entry = self._local.get(session)
+            if entry is not None and entry[1] > now:
+                self._local.move_to_end(session)
+                found[session] = entry[0]
+            else:
+                missing.append(session)
+
+        if missing:
+            values = await redis_client.mget(*(_redis_key(*session) for session in missing)) or ()
+            for session, value in zip(missing, values):
+                if value:
+                    found[session] = uuid.UUID(value)
+                    self._remember(session, found[session], now)
+        return found
+
+    async def put_many(self, conversations: Dict[SessionKey, uuid.UUID]) -> None:
+        from app.utils.redis_client import redis_client
+
+        now = time.monotonic()
+        for session, conversation_id in conversations.items():
+            self._remember(session, conversation_id, now)
+        await redis_client.set_many(
+            {_redis_key(*session): str(conversation_id) for session, conversation_id in conversations.items()},
+            ttl=settings.CONVERSATION_MAP_TTL_S,
+        )
+
+    async def forget(self, sessions: Iterable[SessionKey]) -> None:
+        from app.utils.redis_client import redis_client
+
+        sessions = list(sessions)
+        for session in sessions:
+            self._local.pop(session, None)
+        await redis_client.delete(*(_redis_key(*session) for session in sessions))
+
+    def _remember(self, session: SessionKey, conversation_id: uuid.UUID, now: float) -> None:
+        self._local[session] = (conversation_id, now + settings.CONVERSATION_MAP_TTL_S)
+        self._local.move_to_end(session)
+        while len(self._local) > settings.CONVERSATION_MAP_LOCAL_SIZE:
+            self._local.popitem(last=False)
+
+
+async def upsert_conversations(
+    db: AsyncSession,
+    sessions: Dict[SessionKey, Optional[datetime]],
+) -> Dict[SessionKey, uuid.UUID]:
+    """
+    Conversation id for every (tenant_id, session_id), creating the missing
+    ones (started at the given time, or now) in one statement. Sessions
+    found in the conversation map cost no query at all. Call
+    conversation_map.put_many() with the result after committing.
+    """
+    conversations = await conversation_map.get_many(sessions)
+    missing = [session for session in sessions if session not in conversations]
+    if not missing:
+        return conversations
+
+    now = datetime.now(timezone.utc)
+    stmt = pg_insert(Conversation).values([
+        {
+            "id": uuid.uuid4(),
+            "tenant_id": tenant_id,
+            "session_id": session_id,
+            "started_at": sessions[(tenant_id, session_id)] or now,
+        }
+        for tenant_id, session_id in missing
+    ])
+    # A no-op update rather than DO NOTHING, so existing rows are RETURNed too
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_conversations_tenant_session",
+        set_={"session_id": stmt.excluded.session_id},
+    ).returning(Conversation.tenant_id, Conversation.session_id, Conversation.id)
+
+    for row in await db.execute(stmt):
+        conversations[(row.tenant_id, row.session_id)] = row.id
+    return conversations
+
+
+async def upsert_conversation(db: AsyncSession, tenant_id: uuid.UUID, session_id: str) -> uuid.UUID:
+    """Conversation id for one session, created if needed."""
+    return (await upsert_conversations(db, {(tenant_id, session_id): None}))[(tenant_id, session_id)]
+
+
+conversation_map = ConversationMap()
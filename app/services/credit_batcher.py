@@ -0,0 +1,282 @@
+"""
+app/services/credit_batcher.py
+──────────────────────────────
+Batched credit charging for chat turns.
+
+charge_credits costs a ledger lookup, an UPDATE, an INSERT and a commit per
+chat turn. Persistence tasks instead append the charge to a Redis list and
+the periodic `flush_credit_charges` task applies everything queued in the
+last CREDIT_CHARGE_FLUSH_S in one transaction:
+
+  - one DISTINCT ON query picks the active ledger of every tenant in the batch
+  - one multi-row INSERT ... ON CONFLICT (idempotency_key) DO NOTHING writes
+    the usage-log rows; only rows actually inserted are charged, so a
+    redelivered persistence task (task_acks_late) never charges twice
+  - one UPDATE per batch locks the ledgers and applies their charges in
+    queue order while the running total stays within credits_total, like
+    the direct path charging them one by one; the log rows of the charges
+    past the limit are marked failed instead
+  - tenants without an active ledger get a default one in the same
+    transaction, so nothing is committed before the batch is complete
+
+The queue is a RedisBatchQueue: a batch stays in flight until its commit,
+so a worker that dies mid-flush leaves it to be re-applied (harmlessly,
+thanks to the idempotency keys) by the next flush.
+"""
+
+from __future__ import annotations
+
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.models import CreditLedger, CreditUsageLog
+from app.utils.redis_batch_queue import RedisBatchQueue
+
+_ACTIVE_LEDGERS_SQL = text(
+    """
+    SELECT DISTINCT ON (tenant_id) tenant_id, id
+    FROM credit_ledger
+    WHERE tenant_id = ANY(CAST(:tenant_ids AS uuid[]))
+      AND credits_used < credits_total
+      AND (valid_to IS NULL OR valid_to > now())
+    ORDER BY tenant_id, credits_total - credits_used DESC
+    """
+)
+
+# Charges arrive in queue order. Each ledger accepts the prefix of its charges
+# whose running total fits under credits_total; only those keys are returned.
+_APPLY_CHARGES_SQL = text(
+    """
+    WITH v AS (
+        SELECT key, id, delta, ord
+        FROM unnest(CAST(:keys AS text[]), CAST(:ledger_ids AS uuid[]), CAST(:deltas AS integer[]))
+             WITH ORDINALITY AS v(key, id, delta, ord)
+    ),
+    l AS (
+        SELECT id, credits_used, credits_total
+        FROM credit_ledger
+        WHERE id IN (SELECT id FROM v)
+        FOR UPDATE
+    ),
+    accepted AS (
+        SELECT key, id, delta
+        FROM (
+            SELECT v.key, v.id, v.delta, l.credits_total,
+                   l.credits_used + sum(v.delta) OVER (PARTITION BY v.id ORDER BY v.ord) AS used_after
+            FROM v JOIN l ON l.id = v.id
+        ) AS running
+        WHERE used_after <= credits_total
+    ),
+    applied AS (
+        UPDATE credit_ledger AS cl
+        SET credits_used = cl.credits_used + a.delta,
+            updated_at   = now()
+        FROM (SELECT id, sum(delta) AS delta FROM accepted GROUP BY id) AS a
+        WHERE cl.id = a.id
+    )
+    SELECT key FROM accepted
+    """
+)
+
+_MARK_FAILED_SQL = text(
+    """
+    UPDATE credit_usage_log
+    SET status = 'failed', credits_charged = 0
+    WHERE idempotency_key = ANY(CAST(:keys AS text[]))
+    """
+)
+
+
+class CreditChargeBatcher:
+    def __init__(self):
+        self.queue = RedisBatchQueue("credits:{charges}")
+
+    async def enqueue(
+        self,
+        idempotency_key: str,
+        tenant_id: uuid.UUID,
+        prompt_tokens: int,
+        completion_tokens: int,
+        conversation_id: Optional[uuid.UUID] = None,
+        request_type: str = "chat",
+        model: str = "gpt-4o",
+        hold_id: Optional[str] = None,
+    ) -> bool:
+        """Queue a charge for the next flush. False if Redis is unavailable."""
+        return await self.queue.push({
+            "key": idempotency_key,
+            "tenant_id": str(tenant_id),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "conversation_id": str(conversation_id) if conversation_id else None,
+            "request_type": request_type,
+            "model": model,
+            "hold_id": hold_id,
+        })
+
+    async def submit(self, db: AsyncSession, idempotency_key: str, **charge) -> None:
+        """
+        Charge a chat turn: queued for the next flush when batching is on,
+        otherwise (or if Redis is unavailable) straight through charge_credits.
+        """
+        from app.services.credit_service import charge_credits
+
+        if settings.CREDIT_CHARGE_FLUSH_S > 0 and await self.enqueue(idempotency_key, **charge):
+            return
+        await charge_credits(db=db, idempotency_key=idempotency_key, **charge)
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Apply queued charges batch by batch. Returns the number of charges processed."""
+        token = await self.queue.lock()
+        if token is None:
+            return 0  # another flush is draining the queue
+        processed = 0
+        try:
+            while True:
+                charges = await self.queue.take(settings.CREDIT_CHARGE_BATCH_SIZE, token)
+                if not charges:
+                    return processed
+                try:
+                    await self.apply(db, charges)
+                except Exception as e:
+                    await db.rollback()
+                    logger.error(f"[Credits] Batched charge of {len(charges)} failed, charging one by one: {e}")
+                    await self._apply_individually(db, charges)
+                await self.queue.done(token)
+                processed += len(charges)
+        finally:
+            await self.queue.unlock(token)
+
+    async def apply(self, db: AsyncSession, charges: List[dict]) -> Dict[str, int]:
+        """
+        Charge a batch in one transaction. Returns credits charged per
+        idempotency key (0 for duplicates and refused charges).
+        """
+        from app.services.credit_counter import credit_counter
+        from app.services.credit_service import DEFAULT_PLAN_CREDITS, tokens_to_credits
+
+        by_key: Dict[str, dict] = {}
+        for charge in charges:
+            by_key.setdefault(charge["key"], charge)
+        credits = {
+            key: tokens_to_credits(c["prompt_tokens"] + c["completion_tokens"])
+            for key, c in by_key.items()
+        }
+        billable = [key for key, amount in credits.items() if amount > 0]
+
+        charged: Dict[str, int] = {key: 0 for key in by_key}
+        provisioned: List[uuid.UUID] = []
+        if billable:
+            tenant_ids = list({uuid.UUID(by_key[key]["tenant_id"]) for key in billable})
+            ledgers = {
+                row.tenant_id: row.id
+                for row in await db.execute(_ACTIVE_LEDGERS_SQL, {"tenant_ids": tenant_ids})
+            }
+            provisioned = [tenant_id for tenant_id in tenant_ids if tenant_id not in ledgers]
+            if provisioned:
+                logger.warning(f"[Credits] No ledger found for {len(provisioned)} tenants; provisioning default")
+                for tenant_id in provisioned:
+                    ledgers[tenant_id] = uuid.uuid4()
+                await db.execute(
+                    pg_insert(CreditLedger).values([
+                        {
+                            "id": ledgers[tenant_id],
+                            "tenant_id": tenant_id,
+                            "credits_total": DEFAULT_PLAN_CREDITS,
+                            "credits_used": 0,
+                            "source": "plan",
+                            "description": "Initial plan credits",
+                        }
+                        for tenant_id in provisioned
+                    ])
+                )
+
+            rows = []
+            for key in billable:
+                c = by_key[key]
+                tenant_id = uuid.UUID(c["tenant_id"])
+                rows.append({
+                    "id": uuid.uuid4(),
+                    "tenant_id": tenant_id,
+                    "ledger_id": ledgers[tenant_id],
+                    "conversation_id": uuid.UUID(c["conversation_id"]) if c["conversation_id"] else None,
+                    "request_type": c["request_type"],
+                    "prompt_tokens": c["prompt_tokens"],
+                    "completion_tokens": c["completion_tokens"],
+                    "total_tokens": c["prompt_tokens"] + c["completion_tokens"],
+                    "credits_charged": credits[key],
+                    "model": c["model"],
+                    "status": "charged",
+                    "idempotency_key": key,
+                })
+            inserted = dict((await db.execute(
+                pg_insert(CreditUsageLog)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["idempotency_key"])
+                .returning(CreditUsageLog.idempotency_key, CreditUsageLog.ledger_id)
+            )).all())
+
+            # RETURNING order is unspecified: charge in queue order
+            new_keys = [key for key in billable if key in inserted]
+            if new_keys:
+                accepted = {
+                    row.key
+                    for row in await db.execute(
+                        _APPLY_CHARGES_SQL,
+                        {
+                            "keys": new_keys,
+                            "ledger_ids": [inserted[key] for key in new_keys],
+                            "deltas": [credits[key] for key in new_keys],
+                        },
+                    )
+                }
+                refused = [key for key in new_keys if key not in accepted]
+                if refused:
+                    logger.warning(f"[Credits] {len(refused)} batched charges refused: ledger near/at limit")
+                    await db.execute(_MARK_FAILED_SQL, {"keys": refused})
+                for key in accepted:
+                    charged[key] = credits[key]
+            await db.commit()
+
+        for tenant_id in provisioned:
+            await credit_counter.invalidate(tenant_id)
+
+        # Settle the gate's holds; duplicates and refusals only release them
+        for key, c in by_key.items():
+            await credit_counter.settle(uuid.UUID(c["tenant_id"]), charged[key], c["hold_id"])
+
+        logger.info(
+            f"[Credits] Applied {sum(1 for v in charged.values() if v)} of {len(by_key)} batched charges "
+            f"({sum(charged.values())} credits)"
+        )
+        return charged
+
+    async def _apply_individually(self, db: AsyncSession, charges: List[dict]) -> None:
+        """Fallback when a batch cannot be applied: one bad charge must not block the rest."""
+        from app.services.credit_service import charge_credits
+
+        for c in charges:
+            try:
+                await charge_credits(
+                    db=db,
+                    tenant_id=uuid.UUID(c["tenant_id"]),
+                    prompt_tokens=c["prompt_tokens"],
+                    completion_tokens=c["completion_tokens"],
+                    conversation_id=uuid.UUID(c["conversation_id"]) if c["conversation_id"] else None,
+                    request_type=c["request_type"],
+                    model=c["model"],
+                    hold_id=c["hold_id"],
+                    idempotency_key=c["key"],
+                )
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"[Credits] Dropping charge {c['key']} for tenant {c['tenant_id']}: {e}")
+
+
+credit_batcher = CreditChargeBatcher()
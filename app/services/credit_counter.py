@@ -0,0 +1,238 @@
+"""
+app/services/credit_counter.py
+──────────────────────────────
+Redis-maintained credit balance per tenant.
+
+The gate used to run a SUM over credit_ledger on every chat and widget
+config request. Instead each tenant gets a small hash plus its holds:
+
+    credits:{<tenant_id>}              -> {remaining, total, held}
+    credits:{<tenant_id>}:holds        -> zset hold_id -> expiry (epoch s)
+    credits:{<tenant_id>}:hold_amounts -> hash hold_id -> credits held
+
+(the braces are a Redis Cluster hash tag, keeping a tenant's keys in one
+slot so the Lua scripts below can touch them together)
+
+  - seeded from the ledger aggregate on a miss (and expiring after
+    CREDIT_COUNTER_TTL_S so an unused counter is rebuilt eventually), with
+    `held` recomputed from the holds that outlived the previous counter
+  - decremented atomically when credits are charged (never created by a
+    decrement, so a missing counter is always rebuilt from Postgres)
+  - overwritten from Postgres by the periodic reconcile task
+  - dropped whenever ledger rows are added, so top-ups are visible at once
+
+Reservations: the gate places an estimated hold with one atomic script
+(available = remaining - held), so concurrent requests cannot all pass on
+the same last credit. charge_credits settles the hold to the actual usage;
+holds that are never settled expire after CREDIT_HOLD_TTL_S and are purged
+by the next reservation.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import logger
+
+KEY_PREFIX = "credits:"
+
+# Reservation results
+RESERVE_MISS = -1          # no counter: seed from the ledger and retry
+RESERVE_INSUFFICIENT = -2  # not enough unreserved credits
+
+# KEYS: counter, holds, hold_amounts
+# ARGV: hold_id, estimate, min_credits, now, expires_at, ttl
+# Returns RESERVE_MISS / RESERVE_INSUFFICIENT, 0 (allowed, no ledger so
+# nothing to hold) or the number of credits held.
+_RESERVE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+for _, id in ipairs(expired) do
+    local amount = redis.call('HGET', KEYS[3], id)
+    if amount then
+        redis.call('HINCRBY', KEYS[1], 'held', -tonumber(amount))
+        redis.call('HDEL', KEYS[3], id)
+    end
+    redis.call('ZREM', KEYS[2], id)
+end
+if tonumber(redis.call('HGET', KEYS[1], 'total') or '0') == 0 then
+    return 0
+end
+local available = tonumber(redis.call('HGET', KEYS[1], 'remaining') or '0')
+    - tonumber(redis.call('HGET', KEYS[1], 'held') or '0')
+if available < tonumber(ARGV[3]) then
+    return -2
+end
+local amount = math.min(tonumber(ARGV[2]), available)
+redis.call('HINCRBY', KEYS[1], 'held', amount)
+redis.call('HSET', KEYS[3], ARGV[1], amount)
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+return amount
+"""
+
+# KEYS: counter, holds, hold_amounts
+# ARGV: hold_id ('' for none), actual credits
+# Releases the hold and deducts the actual usage. Only an existing counter
+# is touched: a partial hash would read as a balance.
+_SETTLE_LUA = """
+local exists = redis.call('EXISTS', KEYS[1]) == 1
+if ARGV[1] ~= '' then
+    local amount = redis.call('HGET', KEYS[3], ARGV[1])
+    if amount then
+        if exists then
+            redis.call('HINCRBY', KEYS[1], 'held', -tonumber(amount))
+        end
+        redis.call('HDEL', KEYS[3], ARGV[1])
+        redis.call('ZREM', KEYS[2], ARGV[1])
+    end
+end
+if exists then
+    return redis.call('HINCRBY', KEYS[1], 'remaining', -tonumber(ARGV[2]))
+end
+return nil
+"""
+
+# KEYS: counter, holds, hold_amounts
+# ARGV: remaining, total, now, ttl
+# Rebuilds the counter. Holds placed before it was dropped (top-up
+# invalidation, TTL expiry) are still settled against it, so `held` must
+# be their sum: otherwise settling them would drive it negative.
+_SEED_LUA = """
+local held = 0
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])) do
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('ZREM', KEYS[2], id)
+end
+for _, id in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    held = held + tonumber(redis.call('HGET', KEYS[3], id) or '0')
+end
+redis.call('HSET', KEYS[1], 'remaining', ARGV[1], 'total', ARGV[2], 'held', held)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return held
+"""
+
+# Reconcile only counters that are still in use
+_RECONCILE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'remaining', ARGV[1], 'total', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def _key(tenant_id) -> str:
+    return f"{KEY_PREFIX}{{{tenant_id}}}"
+
+
+def _keys(tenant_id) -> list:
+    counter = _key(tenant_id)
+    return [counter, f"{counter}:holds", f"{counter}:hold_amounts"]
+
+
+class CreditCounter:
+    async def get(self, tenant_id: uuid.UUID) -> Optional[dict]:
+        """{"remaining", "total"} from Redis, or None on a miss."""
+        from app.utils.redis_client import redis_client
+        values = await redis_client.hmget(_key(tenant_id), "remaining", "total")
+        if not values or values[0] is None or values[1] is None:
+            return None
+        return {"remaining": int(values[0]), "total": int(values[1])}
+
+    async def seed(self, tenant_id: uuid.UUID, total: int, used: int) -> None:
+        from app.utils.redis_client import redis_client
+        await redis_client.eval(
+            _SEED_LUA,
+            _keys(tenant_id),
+            [max(0, total - used), total, time.time(), settings.CREDIT_COUNTER_TTL_S],
+        )
+
+    async def reserve(
+        self,
+        tenant_id: uuid.UUID,
+        hold_id: str,
+        estimate: int,
+        min_credits: int,
+    ) -> Optional[int]:
+        """
+        Atomically place a hold of up to `estimate` credits (never less than
+        `min_credits`). Returns the held amount, 0 when nothing needs holding,
+        RESERVE_MISS / RESERVE_INSUFFICIENT, or None if Redis is unavailable.
+        """
+        from app.utils.redis_client import redis_client
+        now = time.time()
+        ttl = settings.CREDIT_HOLD_TTL_S
+        result = await redis_client.eval(
+            _RESERVE_LUA,
+            _keys(tenant_id),
+            [hold_id, estimate, min_credits, now, now + ttl, ttl],
+        )
+        return int(result) if result is not None else None
+
+    async def settle(
+        self,
+        tenant_id: uuid.UUID,
+        credits: int,
+        hold_id: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Release `hold_id` (if any) and deduct the actual `credits` charged;
+        returns the new remaining balance if the counter is cached.
+        """
+        from app.utils.redis_client import redis_client
+        return await redis_client.eval(_SETTLE_LUA, _keys(tenant_id), [hold_id or "", credits])
+
+    async def charge(self, tenant_id: uuid.UUID, credits: int) -> Optional[int]:
+        """Atomically deduct `credits` without a reservation."""
+        return await self.settle(tenant_id, credits)
+
+    async def invalidate(self, tenant_id: uuid.UUID) -> None:
+        # Outstanding holds stay: seed() counts them into `held` again, so
+        # settling them still releases their amount
+        from app.utils.redis_client import redis_client
+        await redis_client.delete(_key(tenant_id))
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """
+        Overwrite every live counter with the ledger aggregate from Postgres.
+        Returns the number of counters that were corrected or refreshed.
+        """
+        from app.db.models import CreditLedger
+        from app.utils.redis_client import redis_client
+
+        now = func.now()
+        rows = (await db.execute(
+            select(
+                CreditLedger.tenant_id,
+                func.coalesce(func.sum(CreditLedger.credits_total), 0).label("total"),
+                func.coalesce(func.sum(CreditLedger.credits_used), 0).label("used"),
+            )
+            .where((CreditLedger.valid_to == None) | (CreditLedger.valid_to > now))  # noqa: E711
+            .group_by(CreditLedger.tenant_id)
+        )).all()
+
+        refreshed = 0
+        for row in rows:
+            total, used = int(row.total), int(row.used)
+            result = await redis_client.eval(
+                _RECONCILE_LUA,
+                [_key(row.tenant_id)],
+                [max(0, total - used), total, settings.CREDIT_COUNTER_TTL_S],
+            )
+            refreshed += int(result or 0)
+        logger.info(f"[Credits] Reconciled {refreshed} credit counters ({len(rows)} tenants with ledgers)")
+        return refreshed
+
+
+credit_counter = CreditCounter()
@@ -27,6 +27,9 @@ TOKENS_PER_CREDIT: int = 1000
 # Minimum credits required to attempt a chat request
 MIN_CREDITS_FOR_CHAT: int = 1
 
+# Prompt tokens assumed when sizing a credit hold (history + context + message)
+RESERVATION_PROMPT_TOKENS: int = 2000
+
 # Approximate tokens for an average chat turn (used for "estimated convos" calc)
 AVG_TOKENS_PER_CONVERSATION: int = 800
 
@@ -58,6 +61,11 @@ def tokens_to_credits(tokens: int) -> int:
     return max(1, (tokens + TOKENS_PER_CREDIT - 1) // TOKENS_PER_CREDIT)
 
 
+def estimate_request_credits(max_tokens_per_request: int) -> int:
+    """Upper-bound credits for one chat request, used to size its hold."""
+    return max(MIN_CREDITS_FOR_CHAT, tokens_to_credits(RESERVATION_PROMPT_TOKENS + max_tokens_per_request))
+
+
 def credits_to_estimated_convos(credits_remaining: int) -> int:
     """Estimate how many average conversations the remaining credits can cover."""
     avg_credits_per_convo = tokens_to_credits(AVG_TOKENS_PER_CONVERSATION)
@@ -115,6 +123,14 @@ async def get_credit_balance(
 
     total: int = int(row.total) if row else 0
     used: int = int(row.used) if row else 0
+    return summarize_credit_balance(total, used)
+
+
+def summarize_credit_balance(total: int, used: int) -> dict:
+    """
+    Balance dict for already-aggregated ledger totals (e.g. from the
+    single-query tenant gate).
+    """
     remaining: int = max(0, total - used)
 
     usage_pct: float = (used / total * 100.0) if total > 0 else 0.0
@@ -157,6 +173,8 @@ async def ensure_tenant_ledger(
     db.add(ledger)
     await db.commit()
     await db.refresh(ledger)
+    from app.services.credit_counter import credit_counter
+    await credit_counter.invalidate(tenant_id)
     logger.info(f"[Credits] Created ledger for tenant {tenant_id}: {credits} credits ({source})")
     return ledger
 
@@ -171,22 +189,43 @@ async def charge_credits(
     conversation_id: Optional[uuid.UUID] = None,
     request_type: str = "chat",
     model: str = "gpt-4o",
+    hold_id: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
 ) -> Tuple[int, bool]:
     """
     Deduct credits from the tenant's active ledger for a completed request.
 
     This is called AFTER a successful API round-trip to avoid charging on failure.
     Uses a raw UPDATE with WHERE credits_used + delta <= credits_total for atomicity.
+    The gate's reservation `hold_id` (if any) is settled to the actual charge.
+    A repeated `idempotency_key` is not charged again.
+
+    Chat turns normally go through credit_batcher instead; this is the
+    direct path (batching disabled or Redis unavailable).
 
     Returns:
         (credits_charged, success)
     """
+    from app.services.credit_counter import credit_counter
+
     total_tokens = prompt_tokens + completion_tokens
     credits = tokens_to_credits(total_tokens)
 
     if credits <= 0:
+        if hold_id:
+            await credit_counter.settle(tenant_id, 0, hold_id)
         return 0, True
 
+    if idempotency_key:
+        charged = await db.execute(
+            select(CreditUsageLog.id).where(CreditUsageLog.idempotency_key == idempotency_key)
+        )
+        if charged.first():
+            logger.info(f"[Credits] Charge {idempotency_key} for tenant {tenant_id} already applied")
+            if hold_id:
+                await credit_counter.settle(tenant_id, 0, hold_id)
+            return 0, True
+
     ledger = await get_active_ledger(db, tenant_id)
     if not ledger:
         # No ledger → auto-provision a default one so first-time users aren't blocked
@@ -227,9 +266,12 @@ async def charge_credits(
             credits_charged=0,
             model=model,
             status="failed",
+            idempotency_key=idempotency_key,
         )
         db.add(log_entry)
         await db.commit() # this might throw if caller has open transaction not ready to commit. Since it's run in background worker it's OK.
+        if hold_id:
+            await credit_counter.settle(tenant_id, 0, hold_id)
         return 0, False
 
     # Log the successful charge
@@ -245,10 +287,14 @@ async def charge_credits(
         credits_charged=credits,
         model=model,
         status="charged",
+        idempotency_key=idempotency_key,
     )
     db.add(log_entry)
     await db.commit()
 
+    # Keep the gate's Redis balance in step (reconciled periodically anyway)
+    await credit_counter.settle(tenant_id, credits, hold_id)
+
     logger.info(
         f"[Credits] Charged {credits} credits for tenant {tenant_id} "
         f"({request_type}, {total_tokens} tokens)"
@@ -260,15 +306,68 @@ async def has_sufficient_credits(
     db: AsyncSession,
     tenant_id: uuid.UUID,
     min_credits: int = MIN_CREDITS_FOR_CHAT,
+    balance: Optional[dict] = None,
 ) -> bool:
     """
     Quick check: does the tenant have enough credits to start a request?
     Returns True even when no ledger exists (auto-provision will happen at charge time).
+    Pass a `balance` already loaded for this request to skip the aggregate query.
+    Otherwise the Redis credit counter answers with a single read and the
+    ledger is aggregated only to (re)seed it on a miss.
     """
-    balance = await get_credit_balance(db, tenant_id)
+    if balance is None:
+        from app.services.credit_counter import credit_counter
+        cached = await credit_counter.get(tenant_id)
+        if cached is not None:
+            if cached["total"] == 0:
+                return True
+            return cached["remaining"] >= min_credits
+        balance = await get_credit_balance(db, tenant_id)
+        await credit_counter.seed(tenant_id, balance["credits_total"], balance["credits_used"])
     # If there's NO ledger at all, credits_total == 0 and is_exhausted == False
     # (the `total > 0` guard in get_credit_balance). Allow through; ledger will be
     # seeded on first charge.
     if balance["credits_total"] == 0:
         return True
     return balance["credits_remaining"] >= min_credits
+
+
+async def reserve_credits(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    estimate: int,
+    min_credits: int = MIN_CREDITS_FOR_CHAT,
+    balance: Optional[dict] = None,
+) -> Tuple[bool, Optional[str]]:
+    """
+    Admit a request by placing a hold of up to `estimate` credits.
+
+    The check and the hold are one atomic Redis script, so concurrent
+    requests cannot all pass on the same remaining credits. On a counter
+    miss it is seeded (from `balance` when the gate already loaded it) and
+    the reservation retried once. If Redis is unavailable this degrades to
+    the plain balance check without a hold.
+
+    Returns:
+        (allowed, hold_id) – hold_id is None when nothing was held
+    """
+    from app.services.credit_counter import (
+        RESERVE_INSUFFICIENT,
+        RESERVE_MISS,
+        credit_counter,
+    )
+
+    hold_id = uuid.uuid4().hex
+    held = await credit_counter.reserve(tenant_id, hold_id, estimate, min_credits)
+    if held == RESERVE_MISS:
+        if balance is None:
+            balance = await get_credit_balance(db, tenant_id)
+        await credit_counter.seed(tenant_id, balance["credits_total"], balance["credits_used"])
+        held = await credit_counter.reserve(tenant_id, hold_id, estimate, min_credits)
+
+    if held is None or held == RESERVE_MISS:
+        ok = await has_sufficient_credits(db, tenant_id, min_credits=min_credits, balance=balance)
+        return ok, None
+    if held == RESERVE_INSUFFICIENT:
+        return False, None
+    return True, (hold_id if held > 0 else None)
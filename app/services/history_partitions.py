@@ -0,0 +1,157 @@
+"""
+app/services/history_partitions.py
+──────────────────────────────────
+Monthly partitions and retention for the chat history tables.
+
+messages, llm_usage and analytics_events are range-partitioned by UTC
+month on created_at (migrations/0004_partition_chat_history.sql), with one
+partition per month named `<table>_pYYYY_MM`. The daily
+`maintain_history_partitions` task:
+
+  - creates the partitions for the current month and the next
+    HISTORY_PARTITIONS_AHEAD months, so inserts always have a target
+  - drops every partition whose whole month is older than the longest
+    analytics retention of any plan (`analytics.retention_days`), never
+    less than HISTORY_RETENTION_MIN_DAYS
+
+Purging is one DROP TABLE per month and table instead of DELETEs over
+millions of rows, so there is no dead-tuple churn for vacuum. The longest
+retention across plans decides the cutoff: a plan's retention is how much
+history its tenants are guaranteed to keep, and a month is only dropped
+once no plan still covers it.
+
+Tables that have not been migrated yet are skipped.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import logger
+
+PARTITIONED_TABLES = ("messages", "llm_usage", "analytics_events")
+
+_PARTITION_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+_IS_PARTITIONED_SQL = text(
+    """
+    SELECT c.relname
+      FROM pg_class c
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE c.relkind = 'p'
+       AND n.nspname = current_schema()
+       AND c.relname = ANY(CAST(:tables AS text[]))
+    """
+)
+
+_PARTITIONS_SQL = text(
+    """
+    SELECT child.relname
+      FROM pg_inherits i
+      JOIN pg_class parent ON parent.oid = i.inhparent
+      JOIN pg_class child ON child.oid = i.inhrelid
+      JOIN pg_namespace n ON n.oid = parent.relnamespace
+     WHERE parent.relname = :table
+       AND n.nspname = current_schema()
+    """
+)
+
+
+def month_start(dt: datetime) -> datetime:
+    dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """The month a `<table>_pYYYY_MM` partition holds (None for other names)."""
+    match = _PARTITION_RE.search(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+async def longest_retention_days(db: AsyncSession) -> int:
+    """Longest analytics retention of any plan, floored at HISTORY_RETENTION_MIN_DAYS."""
+    from app.core.plan_limits import PlanLimits
+    from app.db.models import Plan
+
+    features = (await db.execute(select(Plan.features))).scalars().all()
+    days = [PlanLimits.from_features(f or {}).analytics.retention_days for f in features]
+    return max([settings.HISTORY_RETENTION_MIN_DAYS, *days])
+
+
+async def partitioned_tables(db: AsyncSession) -> List[str]:
+    rows = await db.execute(_IS_PARTITIONED_SQL, {"tables": list(PARTITIONED_TABLES)})
+    found = {row.relname for row in rows}
+    return [table for table in PARTITIONED_TABLES if table in found]
+
+
+async def ensure_partitions(db: AsyncSession, tables: List[str], now: datetime) -> List[str]:
+    """Create this month's and the next HISTORY_PARTITIONS_AHEAD months' partitions."""
+    created = []
+    current = month_start(now)
+    for table in tables:
+        existing = {row.relname for row in await db.execute(_PARTITIONS_SQL, {"table": table})}
+        for offset in range(settings.HISTORY_PARTITIONS_AHEAD + 1):
+            month = add_months(current, offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            await db.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+    await db.commit()
+    return created
+
+
+async def drop_expired_partitions(
+    db: AsyncSession, tables: List[str], now: datetime, retention_days: int
+) -> List[str]:
+    """Drop the partitions whose whole month ended more than `retention_days` ago."""
+    cutoff = now.timestamp() - retention_days * 86400
+    dropped = []
+    for table in tables:
+        names = [row.relname for row in await db.execute(_PARTITIONS_SQL, {"table": table})]
+        for name in sorted(names):
+            month = partition_month(name)
+            if month is not None and add_months(month, 1).timestamp() <= cutoff:
+                # One partition per transaction: the parent is locked only briefly
+                await db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                await db.commit()
+                dropped.append(name)
+    return dropped
+
+
+async def maintain_history_partitions(db: AsyncSession, now: Optional[datetime] = None) -> Dict[str, object]:
+    now = now or datetime.now(timezone.utc)
+    tables = await partitioned_tables(db)
+    if not tables:
+        logger.warning("Chat history tables are not partitioned yet; skipping partition maintenance")
+        return {"tables": [], "created": [], "dropped": []}
+
+    retention_days = await longest_retention_days(db)
+    created = await ensure_partitions(db, tables, now)
+    dropped = await drop_expired_partitions(db, tables, now, retention_days)
+    if created or dropped:
+        logger.info(
+            f"History partitions: created {created or 'none'}, dropped {dropped or 'none'} "
+            f"(retention {retention_days} days)"
+        )
+    return {"tables": tables, "retention_days": retention_days, "created": created, "dropped": dropped}
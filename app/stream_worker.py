@@ -0,0 +1,59 @@
+"""
+app/stream_worker.py
+
+Chat turn stream consumers (CHAT_PERSIST_TRANSPORT = "stream").
+
+    python -m app.stream_worker
+
+Runs CHAT_STREAM_CONSUMERS consumers of the `persisters` group on one
+event loop with a pooled engine (see app/services/chat_stream.py). Scale
+out by running more processes; consumer names include the host and pid,
+so each process reclaims the others' stale entries but never reads as them.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.logging import logger, setup_logging
+from app.db.session import create_pooled_engine
+from app.services.chat_stream import chat_turn_stream
+from app.utils.redis_client import redis_client
+
+
+async def main() -> None:
+    engine = create_pooled_engine(
+        pool_size=settings.CHAT_STREAM_CONSUMERS,
+        max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+        pool_recycle=settings.WORKER_DB_POOL_RECYCLE_S,
+    )
+    sessions = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    consumers = [
+        asyncio.create_task(chat_turn_stream.consume(f"{prefix}-{i}", sessions, stop))
+        for i in range(settings.CHAT_STREAM_CONSUMERS)
+    ]
+    logger.info(f"Started {len(consumers)} chat turn stream consumers ({prefix})")
+    try:
+        # Consumers finish their current batch once stop is set
+        await asyncio.gather(*consumers)
+    finally:
+        await engine.dispose()
+        await redis_client.close()
+        logger.info("Chat turn stream consumers stopped")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
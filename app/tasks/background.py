@@ -1,36 +1,120 @@
-import asyncio
 from typing import Any, Dict
 import uuid
+from celery.signals import worker_process_shutdown, worker_shutdown
 from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.services.chat_persistence import chat_turn_batcher
 from app.services.chat_service import chat_service
-from app.db.session import AsyncSessionLocal
+from app.tasks.runtime import task_runtime
 from app.core.logging import logger
 
-@celery_app.task(name="persist_chat_response")
-def persist_chat_response(tenant_id_str: str, session_id: str, data: Dict[str, Any]):
+@celery_app.task(name="persist_chat_response", bind=True, ignore_result=True)
+def persist_chat_response(self, tenant_id_str: str, session_id: str, data: Dict[str, Any]):
     """
-    Sync wrapper for the async chat_service.persist_response.
+    Sync wrapper for the async chat_service.persist_response, or with
+    CHAT_PERSIST_FLUSH_S > 0 just queues the turn for flush_chat_turns.
+    The task id doubles as the credit charge's idempotency key, so a
+    redelivery (acks_late) does not charge the turn twice.
     """
-    from app.db.session import engine, AsyncSessionLocal
-    import uuid
-    
     tenant_id = uuid.UUID(tenant_id_str)
-    
-    async def run_persistence():
+    # Read here: the task context is thread-local and the body may run on the task loop thread
+    task_id = self.request.id
+
+    async def run_persistence(sessions):
+        if settings.CHAT_PERSIST_FLUSH_S > 0 and await chat_turn_batcher.enqueue(task_id, tenant_id, session_id, data):
+            return
         try:
-            async with AsyncSessionLocal() as db:
+            async with sessions() as db:
                 await chat_service.persist_response(
                     db=db,
                     tenant_id=tenant_id,
                     session_id=session_id,
-                    data=data
+                    data=data,
+                    idempotency_key=task_id,
                 )
                 logger.info(f"Successfully persisted chat response for session {session_id}")
         except Exception as e:
             logger.error(f"Error persisting chat response for session {session_id}: {e}")
             raise e
-        finally:
-            # NullPool will release the connection immediately on close within AsyncSessionLocal
-            pass
 
-    asyncio.run(run_persistence())
+    task_runtime.run(run_persistence)
+
+
+@celery_app.task(name="reconcile_credit_counters", ignore_result=True)
+def reconcile_credit_counters():
+    """
+    Periodically overwrite the Redis credit counters with the ledger totals,
+    correcting any drift from charges that missed Redis.
+    """
+    from app.services.credit_counter import credit_counter
+
+    async def run_reconcile(sessions):
+        async with sessions() as db:
+            return await credit_counter.reconcile(db)
+
+    return task_runtime.run(run_reconcile)
+
+
+@celery_app.task(name="flush_credit_charges", ignore_result=True)
+def flush_credit_charges():
+    """
+    Apply the credit charges queued by persistence tasks in batched
+    ledger transactions (see app/services/credit_batcher.py).
+    """
+    from app.services.credit_batcher import credit_batcher
+
+    async def run_flush(sessions):
+        async with sessions() as db:
+            return await credit_batcher.flush(db)
+
+    return task_runtime.run(run_flush)
+
+
+@celery_app.task(name="flush_chat_turns", ignore_result=True)
+def flush_chat_turns():
+    """
+    Write the chat turns queued by persistence tasks in batched
+    transactions (see app/services/chat_persistence.py).
+    """
+    async def run_flush(sessions):
+        async with sessions() as db:
+            return await chat_turn_batcher.flush(db)
+
+    return task_runtime.run(run_flush)
+
+
+@celery_app.task(name="flush_analytics_rollups", ignore_result=True)
+def flush_analytics_rollups():
+    """
+    Move the hourly analytics counters from Redis into
+    analytics_hourly_rollups (see app/services/analytics_rollups.py).
+    """
+    from app.services.analytics_rollups import analytics_rollups
+
+    async def run_flush(sessions):
+        async with sessions() as db:
+            return await analytics_rollups.flush(db)
+
+    return task_runtime.run(run_flush)
+
+
+@celery_app.task(name="maintain_history_partitions", ignore_result=True)
+def maintain_history_partitions():
+    """
+    Create upcoming monthly partitions of the chat history tables and drop
+    the ones past retention (see app/services/history_partitions.py).
+    """
+    from app.services import history_partitions
+
+    async def run_maintenance(sessions):
+        async with sessions() as db:
+            return await history_partitions.maintain_history_partitions(db)
+
+    return task_runtime.run(run_maintenance)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_task_runtime(**kwargs):
+    # Prefork children get worker_process_shutdown; solo/threads pools only worker_shutdown
+    task_runtime.shutdown()
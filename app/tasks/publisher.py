@@ -0,0 +1,252 @@
+"""
+app/tasks/publisher.py
+
+Non-blocking Celery task enqueue for async request handlers.
+
+`task.delay()` publishes to the broker synchronously, so calling it from
+an `async def` route stalls every other request on the worker's event
+loop for a network round trip. With TASK_ENQUEUE_MODE = "async",
+enqueue_task() only puts the call on a bounded in-process queue. A
+background publisher drains the queue in batches of up to
+TASK_PUBLISH_BATCH_SIZE. Each batch is sent from a worker thread over one
+acquired producer connection, so a burst costs a single connection
+checkout instead of one per task.
+
+When the broker is unavailable, or the queue is full, calls are appended
+to JSON-lines spill files under TASK_SPILL_DIR. They are replayed every
+TASK_SPILL_REPLAY_S once publishing succeeds again. A spill file is claimed
+by renaming it before replay, so several API workers can share the
+directory; a claim left behind by a crashed process is handed back after
+TASK_SPILL_CLAIM_TIMEOUT_S. Spill files are written from a worker thread,
+never on the event loop. Each call gets its Celery task id when it is submitted, and the
+id is kept in the spill file. A call that is published again after a
+partial failure therefore keeps the id the tasks use as their
+idempotency key. Queue depth, throughput and spill counters are exposed on
+/v1/internal/metrics.
+
+"direct" (the default) keeps calling task.delay() inline. Either way,
+payloads of CELERY_COMPRESS_MIN_BYTES or more are sent gzip-compressed.
+"""
+
+import asyncio
+import glob
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# (task name, kwargs, task id)
+TaskCall = Tuple[str, Dict[str, Any], str]
+
+
+def enqueue_task(task, **kwargs) -> None:
+    """Schedule `task` with `kwargs` without blocking the event loop (in "async" mode)."""
+    if settings.TASK_ENQUEUE_MODE == "async" and task_publisher.running:
+        task_publisher.submit(task.name, kwargs)
+        return
+    from app.core.celery_app import publish_options
+    options = publish_options(kwargs)
+    if options:
+        task.apply_async(kwargs=kwargs, **options)
+    else:
+        task.delay(**kwargs)
+
+
+class TaskPublisher:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Overflow spills running in worker threads (awaited by stop())
+        self._spilling: Set[asyncio.Task] = set()
+        self._broker_down_until = 0.0
+        self._counters = {
+            "submitted": 0,
+            "published": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "overflowed": 0,
+            "publish_errors": 0,
+            "max_depth": 0,
+        }
+        self._last_batch_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def submit(self, name: str, kwargs: Dict[str, Any]) -> bool:
+        """Queue a task call. False if the queue was full and the call was spilled instead."""
+        self._counters["submitted"] += 1
+        call = (name, kwargs, str(uuid.uuid4()))
+        try:
+            self._queue.put_nowait(call)
+        except asyncio.QueueFull:
+            self._counters["overflowed"] += 1
+            task = asyncio.get_running_loop().create_task(self._spill([call]))
+            self._spilling.add(task)
+            task.add_done_callback(self._spilling.discard)
+            return False
+        self._counters["max_depth"] = max(self._counters["max_depth"], self._queue.qsize())
+        return True
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=settings.TASK_PUBLISH_QUEUE_SIZE)
+            self._tasks = [
+                asyncio.create_task(self._publish_loop()),
+                asyncio.create_task(self._replay_loop()),
+            ]
+
+    async def stop(self) -> None:
+        """Stop the loops, then publish (or spill) whatever is still queued."""
+        if self._queue is None:
+            return
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        queue, self._queue, self._tasks = self._queue, None, []
+        remaining = []
+        while not queue.empty():
+            remaining.append(queue.get_nowait())
+        if remaining:
+            await self._publish_or_spill(remaining)
+        if self._spilling:
+            await asyncio.gather(*self._spilling)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": settings.TASK_ENQUEUE_MODE,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": settings.TASK_PUBLISH_QUEUE_SIZE,
+            "broker_down": self._broker_down_until > time.monotonic(),
+            "last_batch_ms": round(self._last_batch_ms, 2),
+            "spill_files": len(self._spill_files()),
+            **self._counters,
+        }
+
+    async def _publish_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < settings.TASK_PUBLISH_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._publish_or_spill(batch)
+
+    async def _publish_or_spill(self, batch: List[TaskCall]) -> bool:
+        if self._broker_down_until > time.monotonic():
+            await self._spill(batch)
+            return False
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._publish, batch)
+        except Exception as e:
+            self._counters["publish_errors"] += 1
+            self._broker_down_until = time.monotonic() + settings.TASK_SPILL_REPLAY_S
+            logger.error(f"Task publish of {len(batch)} calls failed, spilling to disk: {e}")
+            await self._spill(batch)
+            return False
+        self._last_batch_ms = (time.perf_counter() - start) * 1000
+        self._counters["published"] += len(batch)
+        return True
+
+    def _publish(self, batch: List[TaskCall]) -> None:
+        """Send a batch over one producer connection (runs in a worker thread)."""
+        from app.core.celery_app import celery_app, publish_options
+        with celery_app.producer_or_acquire() as producer:
+            for name, kwargs, task_id in batch:
+                celery_app.send_task(
+                    name, kwargs=kwargs, task_id=task_id, producer=producer, **publish_options(kwargs)
+                )
+
+    # ─── Durable spill-over ──────────────────────────────────────────────────
+
+    async def _spill(self, batch: List[TaskCall]) -> None:
+        if await asyncio.to_thread(self._write_spill, batch):
+            self._counters["spilled"] += len(batch)
+
+    def _write_spill(self, batch: List[TaskCall]) -> bool:
+        """Write a spill file (runs in a worker thread). False if the calls were dropped."""
+        os.makedirs(settings.TASK_SPILL_DIR, exist_ok=True)
+        path = os.path.join(settings.TASK_SPILL_DIR, f"spill-{os.getpid()}-{uuid.uuid4().hex}.jsonl")
+        try:
+            with open(path, "w") as f:
+                for name, kwargs, task_id in batch:
+                    f.write(json.dumps({"task": name, "kwargs": kwargs, "task_id": task_id}) + "\n")
+        except Exception as e:
+            logger.error(f"Dropping {len(batch)} task calls, spill to {path} failed: {e}")
+            return False
+        return True
+
+    def _spill_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(settings.TASK_SPILL_DIR, "spill-*.jsonl")))
+
+    def _recover_claims(self) -> int:
+        """Hand back spill files whose replay was claimed but never finished (crashed process)."""
+        recovered = 0
+        cutoff = time.time() - settings.TASK_SPILL_CLAIM_TIMEOUT_S
+        for claimed in glob.glob(os.path.join(settings.TASK_SPILL_DIR, "spill-*.jsonl.replaying-*")):
+            try:
+                if os.path.getmtime(claimed) > cutoff:
+                    continue
+                os.rename(claimed, claimed.rsplit(".replaying-", 1)[0])
+            except OSError:
+                continue  # finished, or recovered by another worker
+            recovered += 1
+        if recovered:
+            logger.warning(f"Recovered {recovered} abandoned task spill files")
+        return recovered
+
+    def _claim(self, path: str) -> Optional[Tuple[str, List[TaskCall]]]:
+        """Claim a spill file and read its calls (runs in a worker thread). None if taken."""
+        claimed = f"{path}.replaying-{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return None  # another worker took it
+        # The claim's age is measured from now, not from when the file was spilled
+        os.utime(claimed)
+        with open(claimed) as f:
+            batch = [
+                (entry["task"], entry["kwargs"], entry.get("task_id") or str(uuid.uuid4()))
+                for entry in map(json.loads, filter(None, f))
+            ]
+        return claimed, batch
+
+    async def _replay_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TASK_SPILL_REPLAY_S)
+            if self._broker_down_until <= time.monotonic():
+                await self.replay()
+
+    async def replay(self) -> int:
+        """Publish spilled calls again. Returns the number replayed."""
+        replayed = 0
+        await asyncio.to_thread(self._recover_claims)
+        for path in await asyncio.to_thread(self._spill_files):
+            claim = await asyncio.to_thread(self._claim, path)
+            if claim is None:
+                continue
+            claimed, batch = claim
+            try:
+                await asyncio.to_thread(self._publish, batch)
+            except Exception as e:
+                os.rename(claimed, path)
+                self._broker_down_until = time.monotonic() + settings.TASK_SPILL_REPLAY_S
+                logger.error(f"Replay of {path} failed, keeping it for later: {e}")
+                break
+            os.remove(claimed)
+            replayed += len(batch)
+        if replayed:
+            self._counters["replayed"] += replayed
+            logger.info(f"Replayed {replayed} spilled task calls")
+        return replayed
+
+
+task_publisher = TaskPublisher()
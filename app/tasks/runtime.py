@@ -0,0 +1,100 @@
+"""
+app/tasks/runtime.py
+
+How Celery tasks run their async code.
+
+"per_task" (default): each task calls asyncio.run() with a NullPool
+session, so every chat message pays for a new event loop, a new TLS
+connection to Postgres and a new Redis pool.
+
+"persistent" (CELERY_TASK_LOOP): each worker process keeps one event loop
+on a background thread, with a pooled async engine and the Redis client
+bound to that loop. Tasks submit their coroutine to it and block on the
+result, so connections are reused from one task to the next. The loop is
+created lazily in the process that runs tasks (after the prefork fork)
+and torn down when the worker process shuts down.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# A task body: receives a session factory, returns a coroutine
+TaskBody = Callable[[sessionmaker], Awaitable[Any]]
+
+
+class TaskRuntime:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._engine = None
+        self._sessions: Optional[sessionmaker] = None
+
+    def run(self, body: TaskBody) -> Any:
+        """Run `body` to completion per CELERY_TASK_LOOP and return its result."""
+        if settings.CELERY_TASK_LOOP != "persistent":
+            return asyncio.run(self._run_once(body))
+        loop, sessions = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(body(sessions), loop).result()
+
+    async def _run_once(self, body: TaskBody) -> Any:
+        from app.db.session import UnpooledSessionLocal
+        from app.utils.redis_client import redis_client
+        try:
+            return await body(UnpooledSessionLocal)
+        finally:
+            # NullPool releases the DB connection on session close; the Redis
+            # pool is bound to this asyncio.run() loop, so drop it with the loop.
+            await redis_client.close()
+
+    def _ensure_started(self):
+        with self._lock:
+            # Threads do not survive fork: a child rebuilds its own loop
+            if self._loop is None or self._pid != os.getpid():
+                from app.db.session import create_pooled_engine
+
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="celery-task-loop", daemon=True)
+                thread.start()
+                self._engine = create_pooled_engine(
+                    pool_size=settings.WORKER_DB_POOL_SIZE,
+                    max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+                    pool_recycle=settings.WORKER_DB_POOL_RECYCLE_S,
+                )
+                self._sessions = sessionmaker(self._engine, class_=AsyncSession, expire_on_commit=False)
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                logger.info(f"Started persistent task loop in worker process {self._pid}")
+            return self._loop, self._sessions
+
+    def shutdown(self) -> None:
+        """Dispose the pooled engine and Redis client and stop the loop."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, thread, engine = self._loop, self._thread, self._engine
+            self._loop = self._thread = self._engine = self._sessions = None
+
+        async def close():
+            from app.utils.redis_client import redis_client
+            await engine.dispose()
+            await redis_client.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close(), loop).result(timeout=10)
+        except Exception as e:
+            logger.error(f"Error closing persistent task loop resources: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+task_runtime = TaskRuntime()
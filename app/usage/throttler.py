@@ -2,15 +2,19 @@
 app/usage/throttler.py
 
 Usage enforcement.
-Checks trial expiry and credit balance before allowing a chat call.
+Checks trial expiry and reserves credits before allowing a chat call.
 """
 
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
-from app.services.credit_service import has_sufficient_credits
+from app.services.credit_service import (
+    estimate_request_credits,
+    has_sufficient_credits,
+    reserve_credits,
+)
 
 if TYPE_CHECKING:
     from app.db.models import Tenant
@@ -21,13 +25,20 @@ async def enforce_plan_limits(
     tenant: "Tenant",
     plan_limits: "PlanLimits",
     db: AsyncSession,
-) -> None:
+    credit_balance: Optional[dict] = None,
+    reserve: bool = True,
+) -> Optional[str]:
     """
     Gate-check usage limits before serving a chat request.
 
     Checks:
     1. Trial expiry: Raises HTTP 403
-    2. Credit balance: Raises HTTP 402 if exhausted
+    2. Credit balance: Raises HTTP 402 if exhausted, otherwise holds the
+       request's estimated credits (`credit_balance` is used when the gate
+       already loaded it). With reserve=False only the balance is checked,
+       for requests that never reach charge_credits.
+
+    Returns the credit hold id to settle in charge_credits (None if no hold).
     """
 
     # 1. Trial expiry check
@@ -44,7 +55,16 @@ async def enforce_plan_limits(
 
     # 2. Credit check
     # Throttling is now done primarily via credits instead of daily/monthly budget caps.
-    sufficient = await has_sufficient_credits(db, tenant.id)
+    if reserve:
+        sufficient, hold_id = await reserve_credits(
+            db,
+            tenant.id,
+            estimate_request_credits(plan_limits.model_limits.max_tokens_per_request),
+            balance=credit_balance,
+        )
+    else:
+        sufficient = await has_sufficient_credits(db, tenant.id, balance=credit_balance)
+        hold_id = None
     if not sufficient:
         raise HTTPException(
             status_code=402,
@@ -53,6 +73,7 @@ async def enforce_plan_limits(
                 "message": "You have run out of credits. Please upgrade your plan to continue.",
             },
         )
+    return hold_id
 
 
 # ---------------------------------------------------------------------------
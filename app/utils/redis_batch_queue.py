@@ -0,0 +1,91 @@
+"""
+app/utils/redis_batch_queue.py
+
+A Redis list drained in batches by a periodic task, at least once.
+
+take() moves up to `limit` items from `<prefix>:pending` to
+`<prefix>:inflight` in one script and returns the in-flight batch. done()
+drops it after the batch is committed. A worker that dies in between
+leaves the batch in flight, and the next take() returns it again before
+touching new items. Consumers must therefore tolerate seeing a batch
+twice (idempotency keys, ON CONFLICT).
+
+Only one consumer drains a queue at a time: lock() takes `<prefix>:lock`
+(SET NX PX) and returns its token, which take() and done() check (and
+take() renews) inside their scripts. A flush that overlaps a running one
+gets no token and leaves the queue alone. A consumer whose lock expired
+can no longer drop a batch another consumer has taken since.
+
+Prefixes carry a hash tag (e.g. "credits:{charges}") so all three keys live
+in one Redis Cluster slot.
+"""
+
+import json
+import uuid
+from typing import List, Optional
+
+# Held across one batch at a time: take() extends it before every batch
+LOCK_TTL_MS = 120_000
+
+_LOCK_LUA = """
+return redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2])
+"""
+
+_TAKE_LUA = """
+if redis.call('GET', KEYS[3]) ~= ARGV[2] then
+    return false
+end
+redis.call('PEXPIRE', KEYS[3], ARGV[3])
+if redis.call('LLEN', KEYS[2]) == 0 then
+    local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+    if #items == 0 then
+        return {}
+    end
+    redis.call('RPUSH', KEYS[2], unpack(items))
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return redis.call('LRANGE', KEYS[2], 0, -1)
+"""
+
+# KEYS[1] is deleted only while KEYS[2] (the lock) still holds the token
+_DELETE_IF_OWNER_LUA = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBatchQueue:
+    def __init__(self, prefix: str):
+        self.pending_key = f"{prefix}:pending"
+        self.inflight_key = f"{prefix}:inflight"
+        self.lock_key = f"{prefix}:lock"
+
+    async def push(self, item: dict) -> bool:
+        """Append one item. False if Redis is unavailable."""
+        from app.utils.redis_client import redis_client
+        return await redis_client.rpush(self.pending_key, json.dumps(item)) is not None
+
+    async def lock(self) -> Optional[str]:
+        """Become the queue's only consumer. Returns the lock token, None if it is taken."""
+        from app.utils.redis_client import redis_client
+        token = uuid.uuid4().hex
+        acquired = await redis_client.eval(_LOCK_LUA, [self.lock_key], [token, LOCK_TTL_MS])
+        return token if acquired else None
+
+    async def unlock(self, token: str) -> None:
+        from app.utils.redis_client import redis_client
+        await redis_client.eval(_DELETE_IF_OWNER_LUA, [self.lock_key, self.lock_key], [token])
+
+    async def take(self, limit: int, token: str) -> List[dict]:
+        """The unfinished in-flight batch, else up to `limit` new items (nothing once the lock is lost)."""
+        from app.utils.redis_client import redis_client
+        items: Optional[list] = await redis_client.eval(
+            _TAKE_LUA, [self.pending_key, self.inflight_key, self.lock_key], [limit, token, LOCK_TTL_MS]
+        )
+        return [json.loads(item) for item in items or ()]
+
+    async def done(self, token: str) -> None:
+        from app.utils.redis_client import redis_client
+        await redis_client.eval(_DELETE_IF_OWNER_LUA, [self.inflight_key, self.lock_key], [token])
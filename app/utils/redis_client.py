@@ -88,6 +88,117 @@ class RedisClient:
                 logger.error(f"Error getting Redis string for key {key}: {e}")
         return None
 
+    async def mget(self, *keys: str) -> Optional[list]:
+        """
+        Read several string keys in one round trip (None if Redis is unavailable).
+        """
+        client = await self.get_client()
+        if client and keys:
+            try:
+                return await client.mget(keys)
+            except Exception as e:
+                logger.error(f"Error reading Redis keys {keys}: {e}")
+        return None
+
+    async def set_many(self, mapping: dict, ttl: Optional[int] = None):
+        """
+        Store several raw strings with an optional TTL in one pipelined round trip.
+        """
+        client = await self.get_client()
+        if client and mapping:
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    for key, value in mapping.items():
+                        pipe.set(key, value, ex=ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Error setting {len(mapping)} Redis strings: {e}")
+
+    async def delete(self, *keys: str):
+        """
+        Delete one or more keys.
+        """
+        client = await self.get_client()
+        if client and keys:
+            try:
+                await client.delete(*keys)
+            except Exception as e:
+                logger.error(f"Error deleting Redis keys {keys}: {e}")
+
+    async def incr(self, key: str) -> Optional[int]:
+        """
+        Atomically increment an integer key (created at 0 if missing).
+        """
+        client = await self.get_client()
+        if client:
+            try:
+                return await client.incr(key)
+            except Exception as e:
+                logger.error(f"Error incrementing Redis key {key}: {e}")
+        return None
+
+    async def rpush(self, key: str, *values: str) -> Optional[int]:
+        """
+        Append values to a list. Returns the new length, or None if Redis is unavailable.
+        """
+        client = await self.get_client()
+        if client and values:
+            try:
+                return await client.rpush(key, *values)
+            except Exception as e:
+                logger.error(f"Error appending to Redis list {key}: {e}")
+        return None
+
+    async def xadd(self, key: str, fields: dict, maxlen: Optional[int] = None) -> Optional[str]:
+        """
+        Append an entry to a stream (approximately capped at `maxlen`).
+        Returns the entry id, or None if Redis is unavailable.
+        """
+        client = await self.get_client()
+        if client:
+            try:
+                return await client.xadd(key, fields, maxlen=maxlen, approximate=True)
+            except Exception as e:
+                logger.error(f"Error appending to Redis stream {key}: {e}")
+        return None
+
+    async def hmget(self, key: str, *fields: str) -> Optional[list]:
+        """
+        Read several hash fields in one round trip (None if Redis is unavailable).
+        """
+        client = await self.get_client()
+        if client:
+            try:
+                return await client.hmget(key, fields)
+            except Exception as e:
+                logger.error(f"Error reading Redis hash {key}: {e}")
+        return None
+
+    async def hset_many(self, key: str, mapping: dict, ttl: Optional[int] = None):
+        """
+        Replace hash fields and (optionally) refresh the key's TTL.
+        """
+        client = await self.get_client()
+        if client:
+            try:
+                await client.hset(key, mapping=mapping)
+                if ttl:
+                    await client.expire(key, ttl)
+            except Exception as e:
+                logger.error(f"Error setting Redis hash {key}: {e}")
+
+    async def eval(self, script: str, keys: list, args: list):
+        """
+        Run a Lua script atomically. Returns None if Redis is unavailable or the script fails.
+        """
+        client = await self.get_client()
+        if client:
+            try:
+                return await client.eval(script, len(keys), *keys, *args)
+            except Exception as e:
+                logger.error(f"Error running Redis script on {keys}: {e}")
+        return None
+
     async def is_circuit_broken(self, key: str = "cb:openai:quota_exceeded") -> bool:
         """
         Check if the circuit breaker is set.
@@ -0,0 +1,11 @@
+-- Idempotency keys for credit charges, so a redelivered persistence task
+-- or a re-applied credit batch (INSERT ... ON CONFLICT (idempotency_key))
+-- never charges twice.
+-- Apply with: psql "$DATABASE_URL" -f migrations/0001_credit_charge_idempotency.sql
+
+BEGIN;
+
+-- credit_usage_log: one row per idempotency key (persistence task id / stream entry id)
+ALTER TABLE credit_usage_log ADD COLUMN IF NOT EXISTS idempotency_key varchar UNIQUE;
+
+COMMIT;
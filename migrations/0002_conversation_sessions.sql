@@ -0,0 +1,32 @@
+-- One conversation per (tenant, session), so the session lookup can
+-- upsert with INSERT ... ON CONFLICT ON CONSTRAINT uq_conversations_tenant_session.
+-- Duplicates left by the old check-then-insert are merged first.
+-- Apply with: psql "$DATABASE_URL" -f migrations/0002_conversation_sessions.sql
+
+BEGIN;
+
+-- conversations: merge duplicate (tenant_id, session_id) rows into the oldest one
+CREATE TEMP TABLE conversation_merges ON COMMIT DROP AS
+SELECT id, keep_id
+  FROM (
+        SELECT id,
+               first_value(id) OVER (
+                   PARTITION BY tenant_id, session_id ORDER BY started_at NULLS LAST, id
+               ) AS keep_id
+          FROM conversations
+         WHERE session_id IS NOT NULL
+       ) ranked
+ WHERE id <> keep_id;
+
+UPDATE messages m SET conversation_id = c.keep_id
+  FROM conversation_merges c WHERE m.conversation_id = c.id;
+UPDATE llm_usage u SET conversation_id = c.keep_id
+  FROM conversation_merges c WHERE u.conversation_id = c.id;
+UPDATE credit_usage_log l SET conversation_id = c.keep_id
+  FROM conversation_merges c WHERE l.conversation_id = c.id;
+DELETE FROM conversations WHERE id IN (SELECT id FROM conversation_merges);
+
+ALTER TABLE conversations ADD CONSTRAINT uq_conversations_tenant_session
+    UNIQUE (tenant_id, session_id);
+
+COMMIT;
@@ -0,0 +1,24 @@
+-- Hourly per-tenant, per-model chat counters, accumulated in Redis and
+-- upserted on uq_analytics_rollups_bucket by the flush_analytics_rollups task.
+-- Apply with: psql "$DATABASE_URL" -f migrations/0003_analytics_hourly_rollups.sql
+
+BEGIN;
+
+-- analytics_hourly_rollups: flushed from Redis by flush_analytics_rollups
+CREATE TABLE IF NOT EXISTS analytics_hourly_rollups (
+    id uuid PRIMARY KEY,
+    tenant_id uuid NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    model varchar NOT NULL,
+    hour timestamptz NOT NULL,
+    requests bigint NOT NULL DEFAULT 0,
+    prompt_tokens bigint NOT NULL DEFAULT 0,
+    completion_tokens bigint NOT NULL DEFAULT 0,
+    total_tokens bigint NOT NULL DEFAULT 0,
+    cost_usd numeric(14, 6) NOT NULL DEFAULT 0,
+    cache_hits bigint NOT NULL DEFAULT 0,
+    fallbacks bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz DEFAULT now(),
+    CONSTRAINT uq_analytics_rollups_bucket UNIQUE (tenant_id, model, hour)
+);
+
+COMMIT;
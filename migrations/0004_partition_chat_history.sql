@@ -0,0 +1,117 @@
+-- Monthly range partitioning (on created_at) of the append-only chat
+-- history tables: messages, llm_usage and analytics_events.
+--
+-- Existing rows are copied into partitions named <table>_pYYYY_MM (UTC
+-- months). Partitions for the next months are created ahead of time, then
+-- kept ahead, and dropped once past retention, by the daily
+-- maintain_history_partitions task (app/services/history_partitions.py).
+--
+-- On a partitioned table the primary key must include created_at, so:
+--   - the primary keys become (id, created_at)
+--   - llm_usage.message_id can no longer be a foreign key to messages
+--     (the column and its index stay)
+--
+-- credit_usage_log is not partitioned: it is the billing audit trail, and
+-- its unique idempotency_key could not be enforced across partitions.
+--
+-- The copy runs in one transaction and locks the tables for its duration;
+-- run it in a maintenance window with persistence paused (or
+-- CHAT_PERSIST_TRANSPORT=stream, whose consumers catch up afterwards).
+-- Apply with: psql "$DATABASE_URL" -f migrations/0004_partition_chat_history.sql
+
+BEGIN;
+
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+ALTER TABLE llm_usage RENAME TO llm_usage_unpartitioned;
+ALTER TABLE analytics_events RENAME TO analytics_events_unpartitioned;
+
+CREATE TABLE messages (
+    id uuid NOT NULL,
+    conversation_id uuid NOT NULL,
+    sender varchar NOT NULL,
+    text text,
+    metadata json,
+    created_at timestamptz NOT NULL DEFAULT now()
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE llm_usage (
+    id uuid NOT NULL,
+    tenant_id uuid,
+    conversation_id uuid,
+    message_id uuid,
+    model varchar NOT NULL,
+    prompt_tokens integer NOT NULL,
+    completion_tokens integer NOT NULL,
+    total_tokens integer NOT NULL,
+    cost_usd numeric(10, 6) NOT NULL,
+    latency_ms integer,
+    created_at timestamptz NOT NULL DEFAULT now()
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE analytics_events (
+    id uuid NOT NULL,
+    tenant_id uuid,
+    event_type varchar,
+    payload json,
+    created_at timestamptz NOT NULL DEFAULT now()
+) PARTITION BY RANGE (created_at);
+
+-- One partition per UTC month from the oldest row to three months ahead
+DO $$
+DECLARE
+    tbl text;
+    first_month timestamp;
+    month timestamp;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['messages', 'llm_usage', 'analytics_events'] LOOP
+        EXECUTE format(
+            'SELECT date_trunc(''month'', min(created_at) AT TIME ZONE ''UTC'') FROM %I',
+            tbl || '_unpartitioned'
+        ) INTO first_month;
+        month := coalesce(first_month, date_trunc('month', now() AT TIME ZONE 'UTC'));
+        WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months' LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                tbl || '_p' || to_char(month, 'YYYY_MM'),
+                tbl,
+                month AT TIME ZONE 'UTC',
+                (month + interval '1 month') AT TIME ZONE 'UTC'
+            );
+            month := month + interval '1 month';
+        END LOOP;
+    END LOOP;
+END $$;
+
+-- Rows without a timestamp are filed under the migration time
+INSERT INTO messages (id, conversation_id, sender, text, metadata, created_at)
+SELECT id, conversation_id, sender, text, metadata, coalesce(created_at, now())
+  FROM messages_unpartitioned;
+
+INSERT INTO llm_usage (id, tenant_id, conversation_id, message_id, model, prompt_tokens,
+                       completion_tokens, total_tokens, cost_usd, latency_ms, created_at)
+SELECT id, tenant_id, conversation_id, message_id, model, prompt_tokens,
+       completion_tokens, total_tokens, cost_usd, latency_ms, coalesce(created_at, now())
+  FROM llm_usage_unpartitioned;
+
+INSERT INTO analytics_events (id, tenant_id, event_type, payload, created_at)
+SELECT id, tenant_id, event_type, payload, coalesce(created_at, now())
+  FROM analytics_events_unpartitioned;
+
+-- Drops the old llm_usage -> messages foreign key and the old index names
+DROP TABLE llm_usage_unpartitioned, messages_unpartitioned, analytics_events_unpartitioned;
+
+ALTER TABLE messages ADD PRIMARY KEY (id, created_at);
+ALTER TABLE messages ADD FOREIGN KEY (conversation_id) REFERENCES conversations(id);
+CREATE INDEX ix_messages_conversation_id ON messages (conversation_id);
+
+ALTER TABLE llm_usage ADD PRIMARY KEY (id, created_at);
+ALTER TABLE llm_usage ADD FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE;
+ALTER TABLE llm_usage ADD FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE;
+CREATE INDEX ix_llm_usage_tenant_id ON llm_usage (tenant_id);
+CREATE INDEX ix_llm_usage_conversation_id ON llm_usage (conversation_id);
+CREATE INDEX ix_llm_usage_message_id ON llm_usage (message_id);
+
+ALTER TABLE analytics_events ADD PRIMARY KEY (id, created_at);
+ALTER TABLE analytics_events ADD FOREIGN KEY (tenant_id) REFERENCES tenants(id);
+
+COMMIT;
@@ -0,0 +1,31 @@
+-- TenantLimitsOverride limits are applied over the plan's limits, and NULL
+-- keeps the plan value. The columns used to default to fixed values
+-- (max_tokens_per_request 1500, ...), so every override row replaced all
+-- of the plan's limits. Drop the defaults and reset the values rows still
+-- carry from them; a limit deliberately set to one of those values must be
+-- set again afterwards.
+-- Apply with: psql "$DATABASE_URL" -f migrations/0005_tenant_limits_override_nulls.sql
+
+BEGIN;
+
+ALTER TABLE tenant_limits_overrides
+    ALTER COLUMN monthly_spend_limit_usd DROP DEFAULT,
+    ALTER COLUMN daily_spend_limit_usd DROP DEFAULT,
+    ALTER COLUMN max_requests_per_minute DROP DEFAULT,
+    ALTER COLUMN max_requests_per_day DROP DEFAULT,
+    ALTER COLUMN max_tokens_per_request DROP DEFAULT,
+    ALTER COLUMN max_chunks_per_query DROP DEFAULT,
+    ALTER COLUMN max_files DROP DEFAULT,
+    ALTER COLUMN max_total_storage_mb DROP DEFAULT;
+
+UPDATE tenant_limits_overrides SET
+    monthly_spend_limit_usd = NULLIF(monthly_spend_limit_usd, 50.00),
+    daily_spend_limit_usd   = NULLIF(daily_spend_limit_usd, 5.00),
+    max_requests_per_minute = NULLIF(max_requests_per_minute, 30),
+    max_requests_per_day    = NULLIF(max_requests_per_day, 2000),
+    max_tokens_per_request  = NULLIF(max_tokens_per_request, 1500),
+    max_chunks_per_query    = NULLIF(max_chunks_per_query, 5),
+    max_files               = NULLIF(max_files, 50),
+    max_total_storage_mb    = NULLIF(max_total_storage_mb, 500);
+
+COMMIT;
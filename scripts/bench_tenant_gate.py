@@ -0,0 +1,72 @@
+
+"""
+Compare the cold-path tenant gate loaders against a real database.
+
+    python -m scripts.bench_tenant_gate --prefix sk_live_abcd --iterations 50
+
+"sequential" replays the per-table queries (key, tenant, domains, plan,
+credit balance); "single" runs app.auth.gate_query.load_tenant_gate.
+Each iteration opens a fresh session, as a request does under NullPool.
+argon2 verification is excluded from both timings.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select
+
+from app.auth.gate_query import load_tenant_gate
+from app.db.models import ApiKey, Plan, Tenant, TenantConfig
+from app.db.session import AsyncSessionLocal
+from app.services.credit_service import get_credit_balance
+
+
+async def sequential(key_prefix: str):
+    async with AsyncSessionLocal() as db:
+        keys = (await db.execute(
+            select(ApiKey).where(ApiKey.key_prefix == key_prefix, ApiKey.is_active == True)
+        )).scalars().all()
+        if not keys:
+            return
+        tenant = (await db.execute(
+            select(Tenant).where(Tenant.id == keys[0].tenant_id)
+        )).scalars().first()
+        await db.execute(
+            select(TenantConfig).where(TenantConfig.tenant_id == tenant.id, TenantConfig.domain != None)
+        )
+        if tenant.plan_id:
+            await db.execute(select(Plan).where(Plan.id == tenant.plan_id))
+        await get_credit_balance(db, tenant.id)
+
+
+async def single(key_prefix: str):
+    async with AsyncSessionLocal() as db:
+        await load_tenant_gate(db, key_prefix=key_prefix)
+
+
+async def bench(name, fn, key_prefix, iterations):
+    await fn(key_prefix)  # warm-up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(key_prefix)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{name:<11} mean={statistics.mean(samples):8.2f}ms  p50={statistics.median(samples):8.2f}ms  p95={p95:8.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefix", required=True, help="key_prefix of an active API key")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    await bench("sequential", sequential, args.prefix, args.iterations)
+    await bench("single", single, args.prefix, args.iterations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
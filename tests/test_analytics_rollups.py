@@ -0,0 +1,98 @@
+import anyio
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.services.analytics_rollups import PREFIX, AnalyticsRollups, keep_raw_event, turn_counters
+
+TS = datetime(2026, 3, 1, 14, 30, tzinfo=timezone.utc).timestamp()
+
+
+def _data(**overrides):
+    data = {"model": "gpt-4o-mini", "prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "cost_usd": 0.0015}
+    return {**data, **overrides}
+
+
+def test_turn_counters_classify_cache_hits_and_fallbacks():
+    assert turn_counters(_data()) == {
+        "requests": 1, "prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+        "cost_micros": 1500, "cache_hits": 0, "fallbacks": 0,
+    }
+    assert turn_counters(_data(cached=True))["cache_hits"] == 1
+    assert turn_counters(_data(error="deadline_exceeded"))["fallbacks"] == 1
+    assert turn_counters(_data(no_context=True))["fallbacks"] == 1
+
+
+@patch.object(AnalyticsRollups, "_increment", new_callable=AsyncMock)
+def test_record_aggregates_turns_per_tenant_hour_and_model(mock_increment):
+    tenant_id = uuid.uuid4()
+    turns = [
+        (tenant_id, TS, _data()),
+        (tenant_id, TS + 60, _data(cached=True, prompt_tokens=0, completion_tokens=0, total_tokens=0, cost_usd=0)),
+        (tenant_id, TS, _data(model="gpt-4o")),
+        (tenant_id, TS + 3600, _data()),
+    ]
+
+    anyio.run(AnalyticsRollups().record, turns)
+
+    buckets = mock_increment.await_args.args[0]
+    this_hour = buckets[f"{PREFIX}:{tenant_id}:2026030114"]
+    assert this_hour["gpt-4o-mini|requests"] == 2
+    assert this_hour["gpt-4o-mini|total_tokens"] == 15
+    assert this_hour["gpt-4o-mini|cache_hits"] == 1
+    assert this_hour["gpt-4o|requests"] == 1
+    assert f"{PREFIX}:{tenant_id}:2026030115" in buckets
+
+
+def test_write_upserts_one_row_per_model_and_hour():
+    tenant_id = uuid.uuid4()
+    db = AsyncMock()
+    buckets = {
+        f"{PREFIX}:{tenant_id}:2026030114": {
+            "gpt-4o-mini|requests": 3, "gpt-4o-mini|cost_micros": 4500, "gpt-4o|requests": 1,
+        },
+    }
+
+    anyio.run(AnalyticsRollups().write, db, buckets)
+
+    stmt = db.execute.await_args.args[0]
+    assert "ON CONFLICT ON CONSTRAINT uq_analytics_rollups_bucket DO UPDATE" in str(stmt.compile())
+    params = stmt.compile().params
+    rows = {params[f"model_m{i}"]: i for i in range(2)}
+    mini = rows["gpt-4o-mini"]
+    assert params[f"requests_m{mini}"] == 3
+    assert params[f"cost_usd_m{mini}"] == Decimal("0.0045")
+    assert params[f"hour_m{mini}"] == datetime(2026, 3, 1, 14, tzinfo=timezone.utc)
+    assert params[f"fallbacks_m{rows['gpt-4o']}"] == 0
+    db.commit.assert_awaited_once()
+
+
+def test_failed_flush_puts_counters_back():
+    key = f"{PREFIX}:{uuid.uuid4()}:2026030114"
+    client = MagicMock()
+    client.srandmember = AsyncMock(return_value=[key])
+    rollups = AnalyticsRollups()
+    db = AsyncMock()
+
+    async def scenario():
+        with patch("app.utils.redis_client.redis_client.get_client", AsyncMock(return_value=client)), \
+             patch("app.utils.redis_client.redis_client.eval", AsyncMock(return_value=[key, ["gpt-4o-mini|requests", "2"]])), \
+             patch.object(AnalyticsRollups, "write", AsyncMock(side_effect=ConnectionError("db down"))), \
+             patch.object(AnalyticsRollups, "_increment", new_callable=AsyncMock) as mock_increment:
+            with pytest.raises(ConnectionError):
+                await rollups.flush(db)
+            mock_increment.assert_awaited_once_with({key: {"gpt-4o-mini|requests": 2}})
+
+    anyio.run(scenario)
+    db.rollback.assert_awaited_once()
+
+
+def test_raw_events_can_be_sampled_away():
+    with patch.object(settings, "ANALYTICS_EVENT_SAMPLE_RATE", 1.0):
+        assert keep_raw_event()
+    with patch.object(settings, "ANALYTICS_EVENT_SAMPLE_RATE", 0.0):
+        assert not keep_raw_event()
@@ -0,0 +1,56 @@
+from unittest.mock import MagicMock, patch
+
+from app.core.celery_app import _configure_concurrency, celery_app, publish_options
+from app.core.config import settings
+from app.tasks.background import persist_chat_response, reconcile_credit_counters
+from app.tasks.publisher import enqueue_task
+
+
+def _queue(task_name):
+    return celery_app.amqp.router.route({}, task_name)["queue"].name
+
+
+def test_tasks_are_routed_to_named_queues():
+    assert _queue("persist_chat_response") == "persistence"
+    assert _queue("flush_chat_turns") == "persistence"
+    assert _queue("flush_credit_charges") == "persistence"
+    assert _queue("flush_analytics_rollups") == "analytics"
+    assert _queue("reconcile_credit_counters") == "maintenance"
+    assert _queue("maintain_history_partitions") == "maintenance"
+    assert _queue("some_unrouted_task") == "celery"
+
+
+def test_write_only_tasks_ignore_results():
+    assert persist_chat_response.ignore_result
+    assert reconcile_credit_counters.ignore_result
+
+
+def test_only_large_payloads_are_compressed():
+    with patch.object(settings, "CELERY_COMPRESS_MIN_BYTES", 100):
+        assert publish_options({"data": {"query": "Hi"}}) == {}
+        assert publish_options({"data": {"query": "x" * 200}}) == {"compression": "gzip"}
+    with patch.object(settings, "CELERY_COMPRESS_MIN_BYTES", 0):
+        assert publish_options({"data": {"query": "x" * 200}}) == {}
+
+
+def test_direct_enqueue_compresses_large_payloads():
+    task = MagicMock()
+    with patch.object(settings, "CELERY_COMPRESS_MIN_BYTES", 100):
+        enqueue_task(task, data="small")
+        enqueue_task(task, data="x" * 200)
+
+    task.delay.assert_called_once_with(data="small")
+    task.apply_async.assert_called_once_with(kwargs={"data": "x" * 200}, compression="gzip")
+
+
+def test_worker_concurrency_follows_its_queues():
+    conf = MagicMock()
+    _configure_concurrency(conf=conf, options={"queues": ["persistence"], "concurrency": None})
+    assert conf.worker_concurrency == settings.CELERY_PERSISTENCE_CONCURRENCY
+
+    _configure_concurrency(conf=conf, options={"queues": ["analytics", "maintenance"], "concurrency": None})
+    assert conf.worker_concurrency == settings.CELERY_ANALYTICS_CONCURRENCY + settings.CELERY_MAINTENANCE_CONCURRENCY
+
+    conf = MagicMock(spec=[])
+    _configure_concurrency(conf=conf, options={"queues": ["persistence"], "concurrency": 4})
+    assert not hasattr(conf, "worker_concurrency")  # an explicit -c wins
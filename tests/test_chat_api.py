@@ -65,10 +65,10 @@ def test_trial_expired_returns_403(mock_dt, mock_get_limits, client: TestClient)
     # Cleanup
     app.dependency_overrides[require_tenant_api_key] = mock_auth_pro
 
-@patch("app.usage.throttler.has_sufficient_credits")
+@patch("app.usage.throttler.reserve_credits")
 def test_credit_limit_enforced(mock_has_credits, client: TestClient):
     # Mock credit check failure
-    mock_has_credits.return_value = False
+    mock_has_credits.return_value = (False, None)
     
     response = client.post(
         "/v1/chat/",
@@ -82,10 +82,10 @@ def test_credit_limit_enforced(mock_has_credits, client: TestClient):
 @patch("app.services.chat_service.get_chat_completion", new_callable=AsyncMock)
 @patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
 @patch("app.api.chat.get_plan_limits")
-@patch("app.usage.throttler.has_sufficient_credits")
+@patch("app.usage.throttler.reserve_credits")
 def test_plan_limits_applied_to_chat(mock_has_credits, mock_get_limits, mock_embedding, mock_completion, mock_redis, client: TestClient):
     # Mock credits pass
-    mock_has_credits.return_value = True
+    mock_has_credits.return_value = (True, None)
     # Mock plan limits
     from app.core.plan_limits import PlanLimits
     limits = PlanLimits.from_features({
@@ -122,7 +122,7 @@ def test_plan_limits_applied_to_chat(mock_has_credits, mock_get_limits, mock_emb
     mock_completion.return_value = mock_resp
     
     # Mock Celery delay to avoid actual task submission
-    with patch("app.api.chat.persist_chat_response.delay") as mock_delay:
+    with patch("app.tasks.background.persist_chat_response.delay") as mock_delay:
         response = client.post(
             "/v1/chat/",
             json={"query": "Hello"}
@@ -138,3 +138,77 @@ def test_plan_limits_applied_to_chat(mock_has_credits, mock_get_limits, mock_emb
     
     # Cleanup
     app.dependency_overrides.pop(get_db, None)
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
+@patch("app.api.chat.get_plan_limits")
+@patch("app.usage.throttler.reserve_credits")
+def test_embedding_prefetch_discarded_when_gate_rejects(mock_has_credits, mock_get_limits, mock_embedding, mock_redis, client: TestClient):
+    import asyncio
+    from app.core.plan_limits import PlanLimits
+    from app.services.chat_service import chat_service
+
+    mock_has_credits.return_value = (False, None)
+    mock_get_limits.return_value = PlanLimits()
+    mock_redis.get_cache.return_value = None
+
+    async def override_get_db():
+        yield AsyncMock()
+    app.dependency_overrides[get_db] = override_get_db
+
+    async def slow_embedding(*args, **kwargs):
+        await asyncio.sleep(10)
+        return [0.1] * 1536
+    mock_embedding.side_effect = slow_embedding
+
+    prefetches = []
+    original = chat_service.prefetch_embedding
+
+    def capture(query, deadline):
+        prefetch = original(query, deadline)
+        prefetches.append((query, prefetch))
+        return prefetch
+
+    verified = {"key_id": str(uuid.uuid4()), "tenant_id": str(mock_tenant_id), "is_active": True}
+    with patch.object(chat_service, "prefetch_embedding", side_effect=capture), \
+            patch("app.api.chat.verified_key_cache.get", AsyncMock(return_value=verified)):
+        response = client.post(
+            "/v1/chat/", json={"query": "  Hello  "}, headers={"ASST-API-KEY": "sk_live_123456789012"}
+        )
+
+    assert response.status_code == 402
+    # The embedding was started before the gate ran, then dropped with it
+    assert len(prefetches) == 1
+    query, prefetch = prefetches[0]
+    assert query == "Hello"
+    assert prefetch._task.cancelled() or prefetch._task.cancelling()
+
+    app.dependency_overrides.pop(get_db, None)
+
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
+@patch("app.api.chat.get_plan_limits")
+@patch("app.usage.throttler.reserve_credits")
+def test_no_embedding_prefetch_for_unverified_keys(mock_has_credits, mock_get_limits, mock_embedding, mock_redis, client: TestClient):
+    from app.core.plan_limits import PlanLimits
+    from app.services.chat_service import chat_service
+
+    mock_has_credits.return_value = (False, None)
+    mock_get_limits.return_value = PlanLimits()
+    mock_redis.get_cache.return_value = None
+
+    async def override_get_db():
+        yield AsyncMock()
+    app.dependency_overrides[get_db] = override_get_db
+
+    with patch.object(chat_service, "prefetch_embedding") as mock_prefetch, \
+            patch("app.api.chat.verified_key_cache.get", AsyncMock(return_value=None)):
+        # Missing header, then a key the gate has not verified yet
+        client.post("/v1/chat/", json={"query": "Hello"})
+        client.post("/v1/chat/", json={"query": "Hello"}, headers={"ASST-API-KEY": "sk_live_unknown0000"})
+
+    mock_prefetch.assert_not_called()
+    mock_embedding.assert_not_awaited()
+
+    app.dependency_overrides.pop(get_db, None)
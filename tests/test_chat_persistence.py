@@ -0,0 +1,167 @@
+import anyio
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.chat_persistence import _row_id, chat_turn_batcher
+from app.services.conversations import ConversationMap
+
+
+def _turn(key, tenant_id, session_id, ts):
+    return {
+        "key": key,
+        "tenant_id": str(tenant_id),
+        "session_id": session_id,
+        "ts": ts,
+        "data": {
+            "query": "Hi",
+            "answer": "Hello",
+            "model": "gpt-4o-mini",
+            "prompt_tokens": 10,
+            "completion_tokens": 5,
+            "total_tokens": 15,
+            "cost_usd": 0.001,
+            "credit_hold_id": f"hold-{key}",
+        },
+    }
+
+
+def _inserted_ids(*ids):
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = list(ids)
+    return result
+
+
+@patch("app.services.conversations.conversation_map", new_callable=ConversationMap)
+@patch("app.services.chat_persistence.conversation_map", new_callable=ConversationMap)
+@patch("app.services.credit_batcher.credit_batcher.submit", new_callable=AsyncMock)
+def test_batch_writes_all_turns_in_one_transaction(mock_submit, *_):
+    tenant_id, existing_id, new_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    turns = [
+        _turn("t1", tenant_id, "known", 1.0),
+        _turn("t2", tenant_id, "known", 2.0),
+        _turn("t3", tenant_id, "new", 3.0),
+        _turn("t3", tenant_id, "new", 3.0),  # redelivered in the same batch
+    ]
+    db = AsyncMock()
+    db.execute.side_effect = [
+        # Conversation upsert returns existing and created rows alike
+        [
+            SimpleNamespace(tenant_id=tenant_id, session_id="known", id=existing_id),
+            SimpleNamespace(tenant_id=tenant_id, session_id="new", id=new_id),
+        ],
+        _inserted_ids(),
+        None, None,
+    ]
+
+    conversation_of = anyio.run(chat_turn_batcher.persist_turns, db, turns)
+
+    # conversation upsert + messages + usage + analytics, one commit
+    assert db.execute.await_count == 4
+    db.commit.assert_awaited_once()
+    assert conversation_of["t1"] == conversation_of["t2"] == existing_id
+    assert conversation_of["t3"] == new_id
+
+    messages = db.execute.await_args_list[1].args[0].compile(dialect=postgresql.dialect()).params
+    assert sum(1 for k in messages if k.startswith("sender")) == 6
+
+    assert mock_submit.await_count == 3
+    assert mock_submit.await_args_list[0].kwargs["hold_id"] == "hold-t1"
+    assert mock_submit.await_args_list[0].args[1] == "t1"
+
+
+def test_overlapping_flush_leaves_the_queue_to_the_lock_holder():
+    from app.utils.redis_client import redis_client
+
+    scripts = []
+
+    async def fake_eval(script, keys, args):
+        scripts.append(keys)
+        return None  # SET NX failed: another flush holds the lock
+
+    db = AsyncMock()
+    with patch.object(redis_client, "eval", side_effect=fake_eval):
+        assert anyio.run(chat_turn_batcher.flush, db) == 0
+
+    # Only the lock was attempted: no batch was taken or dropped
+    assert scripts == [[chat_turn_batcher.queue.lock_key]]
+    db.execute.assert_not_awaited()
+
+
+@patch("app.services.conversations.conversation_map", new_callable=ConversationMap)
+@patch("app.services.chat_persistence.conversation_map", new_callable=ConversationMap)
+@patch("app.services.chat_persistence.analytics_rollups.record", new_callable=AsyncMock)
+@patch("app.services.credit_batcher.credit_batcher.submit", new_callable=AsyncMock)
+def test_rewritten_batch_adds_no_rows_or_counts(mock_submit, mock_record, *_):
+    tenant_id, conversation_id = uuid.uuid4(), uuid.uuid4()
+    turns = [_turn("t1", tenant_id, "s", 1.0), _turn("t2", tenant_id, "s", 2.0)]
+
+    def run(inserted):
+        db = AsyncMock()
+        db.execute.side_effect = [
+            [SimpleNamespace(tenant_id=tenant_id, session_id="s", id=conversation_id)],
+            inserted, None, None,
+        ]
+        anyio.run(chat_turn_batcher.persist_turns, db, turns)
+        return db.execute.await_args_list[1].args[0].compile(dialect=postgresql.dialect())
+
+    first = run(_inserted_ids(*(_row_id(key, "assistant") for key in ("t1", "t2"))))
+    # Taken again after the commit: every message row already exists
+    second = run(_inserted_ids())
+
+    assert "ON CONFLICT DO NOTHING" in str(first)
+    assert first.params == second.params
+    assert [len(list(call.args[0])) for call in mock_record.await_args_list] == [2, 0]
+    # Credits are still submitted: their idempotency key dedupes them
+    assert mock_submit.await_count == 4
+
+
+def test_queued_batch_is_kept_while_the_database_is_unreachable():
+    import fakeredis
+    from sqlalchemy import exc
+
+    from app.core.config import settings
+    from app.tasks.background import persist_chat_response
+    from app.utils.redis_client import redis_client
+
+    tenant_id = uuid.uuid4()
+    down = exc.OperationalError("INSERT", {}, ConnectionRefusedError("connection refused"))
+    bodies = []
+    with patch.object(settings, "CHAT_PERSIST_FLUSH_S", 5.0), \
+            patch("app.tasks.background.task_runtime.run", side_effect=bodies.append):
+        for key in ("t1", "t2"):
+            persist_chat_response.apply(args=[str(tenant_id), "s", _turn(key, tenant_id, "s", 1.0)["data"]], task_id=key)
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        db = AsyncMock()
+        db.execute.side_effect = down
+        with patch.object(redis_client, "get_client", AsyncMock(return_value=client)), \
+                patch.object(settings, "CHAT_PERSIST_FLUSH_S", 5.0), \
+                patch("app.services.chat_service.chat_service.persist_response", new_callable=AsyncMock) as persist:
+            for body in bodies:
+                await body(None)  # queued: never opens a session
+            assert await client.llen(chat_turn_batcher.queue.pending_key) == 2
+
+            # Every turn fails on the connection: the batch stays in flight
+            persist.side_effect = down
+            try:
+                await chat_turn_batcher.flush(db)
+            except exc.OperationalError:
+                pass
+            else:
+                raise AssertionError("flush should fail while the database is down")
+            kept = await client.llen(chat_turn_batcher.queue.inflight_key)
+
+            # Turns the database rejects are dropped, not retried forever
+            persist.side_effect = [ValueError("bad turn"), None]
+            processed = await chat_turn_batcher.flush(db)
+            left = await client.llen(chat_turn_batcher.queue.inflight_key)
+        return kept, processed, left, persist.await_count
+
+    kept, processed, left, attempts = anyio.run(scenario)
+    assert kept == 2
+    assert (processed, left) == (2, 0)
+    assert attempts == 4
@@ -0,0 +1,91 @@
+import anyio
+import asyncio
+import json
+import uuid
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.config import settings
+from app.services.chat_stream import ChatTurnStream, schedule_chat_persistence
+
+
+def test_consumer_writes_and_acks_a_batch():
+    stream = ChatTurnStream()
+    tenant_id = uuid.uuid4()
+    stop = asyncio.Event()
+    entries = [
+        ("1-0", {"t": str(tenant_id), "s": "s1", "d": json.dumps({"query": "Hi"}), "ts": "1.5"}),
+        ("1-1", {"t": str(tenant_id), "s": "s1", "d": json.dumps({"query": "Again"}), "ts": "2.5"}),
+    ]
+
+    async def read_batch(consumer):
+        stop.set()
+        return entries
+
+    written = []
+    sessions = MagicMock()
+    sessions.return_value.__aenter__ = AsyncMock()
+    sessions.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    with patch.object(stream, "ensure_group", AsyncMock()), \
+         patch.object(stream, "read_batch", side_effect=read_batch), \
+         patch.object(stream, "ack", AsyncMock()) as mock_ack, \
+         patch("app.services.chat_persistence.chat_turn_batcher.write",
+               AsyncMock(side_effect=lambda db, turns: written.extend(turns))):
+        anyio.run(stream.consume, "c1", sessions, stop)
+
+    assert [t["key"] for t in written] == ["stream:1-0", "stream:1-1"]
+    assert written[0]["data"] == {"query": "Hi"} and written[0]["ts"] == 1.5
+    mock_ack.assert_awaited_once_with(["1-0", "1-1"])
+
+
+@patch("app.tasks.background.persist_chat_response.delay")
+@patch("app.utils.redis_client.redis_client.xadd", new_callable=AsyncMock, return_value=None)
+def test_stream_append_falls_back_to_celery(mock_xadd, mock_delay):
+    from app.services.chat_stream import chat_turn_stream
+    tenant_id = uuid.uuid4()
+
+    async def scenario():
+        schedule_chat_persistence(tenant_id, "s1", {"query": "Hi"})
+        mock_delay.assert_not_called()  # the request did not wait for the append
+        await chat_turn_stream.drain()
+
+    with patch.object(settings, "CHAT_PERSIST_TRANSPORT", "stream"):
+        anyio.run(scenario)
+
+    mock_xadd.assert_awaited_once()
+    mock_delay.assert_called_once_with(tenant_id_str=str(tenant_id), session_id="s1", data={"query": "Hi"})
+
+
+def _client(**overrides):
+    client = MagicMock()
+    client.xinfo_groups = AsyncMock(return_value=[{"name": "persisters", "last-delivered-id": "9-0"}])
+    client.xpending = AsyncMock(return_value={"pending": 2, "min": "5-0", "max": "8-0"})
+    client.xtrim = AsyncMock(return_value=4)
+    client.xlen = AsyncMock(return_value=6)
+    client.xack = AsyncMock()
+    for name, value in overrides.items():
+        setattr(client, name, value)
+    return client
+
+
+def test_trim_never_passes_the_oldest_pending_entry():
+    stream = ChatTurnStream()
+    client = _client()
+    with patch("app.utils.redis_client.redis_client.get_client", AsyncMock(return_value=client)):
+        assert anyio.run(stream.trim) == 4
+    client.xtrim.assert_awaited_once_with("chat:turns", minid="5-0", approximate=True)
+
+    # Nothing pending: everything up to the last delivered entry is acked
+    client = _client(xpending=AsyncMock(return_value={"pending": 0, "min": None, "max": None}))
+    with patch("app.utils.redis_client.redis_client.get_client", AsyncMock(return_value=client)):
+        anyio.run(stream.trim)
+    client.xtrim.assert_awaited_once_with("chat:turns", minid="9-0", approximate=True)
+
+
+def test_reclaimed_deleted_entries_are_acked():
+    stream = ChatTurnStream()
+    live = ("3-0", {"t": "t", "s": "s", "d": "{}", "ts": "1"})
+    client = _client(xautoclaim=AsyncMock(return_value=["0-0", [live, ("2-0", None)], ["1-0"]]))
+    with patch("app.utils.redis_client.redis_client.get_client", AsyncMock(return_value=client)):
+        assert anyio.run(stream.read_batch, "c1") == [live]
+    client.xack.assert_awaited_once_with("chat:turns", "persisters", "1-0", "2-0")
@@ -101,3 +101,157 @@ def test_chat_streaming(mock_enforce, mock_get_limits, mock_embedding, mock_stre
     
     # Cleanup
     app.dependency_overrides.pop(get_db, None)
+
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_chat_completion_stream", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
+def test_chat_streaming_client_disconnect(mock_embedding, mock_stream, mock_redis):
+    import anyio
+    from app.services.chat_service import chat_service
+
+    mock_redis.is_circuit_broken.return_value = False
+    mock_redis.get_cache.return_value = None
+    mock_embedding.return_value = [0.1] * 1536
+
+    mock_session = AsyncMock()
+    mock_result = MagicMock()
+    mock_chunk = MagicMock()
+    mock_chunk.content = "Some context"
+    mock_result.scalars.return_value.all.return_value = [mock_chunk]
+    mock_session.execute.return_value = mock_result
+
+    # Upstream stream that would keep generating if not closed
+    upstream = MagicMock()
+    upstream.close = AsyncMock()
+    produced = []
+
+    async def token_iter():
+        for c in ["Hello", " world", "!"]:
+            produced.append(c)
+            chunk = MagicMock()
+            chunk.choices = [MagicMock(delta=MagicMock(content=c))]
+            chunk.usage = None
+            yield chunk
+
+    upstream.__aiter__ = lambda self: token_iter()
+    mock_stream.return_value = upstream
+
+    # Client goes away after the first token
+    async def is_disconnected():
+        return True
+
+    async def run():
+        return [
+            token
+            async for token in chat_service.get_streaming_response(
+                db=mock_session,
+                tenant=create_mock_tenant(),
+                query="Hi",
+                is_disconnected=is_disconnected,
+            )
+        ]
+
+    with patch("app.tasks.background.persist_chat_response.delay") as mock_delay:
+        tokens = anyio.run(run)
+
+    assert tokens == ["Hello"]
+    assert produced == ["Hello"]
+    upstream.close.assert_awaited_once()
+
+    # Partial answer is still persisted, marked as truncated, with estimated usage
+    mock_delay.assert_called_once()
+    data = mock_delay.call_args.kwargs["data"]
+    assert data["answer"] == "Hello"
+    assert data["truncated"] is True
+    assert data["completion_tokens"] == 1
+    assert data["prompt_tokens"] > 0
+
+    # Truncated answers must not be cached as full responses
+    assert all(
+        not call.args[0].startswith("cache:chat:")
+        for call in mock_redis.set_cache.call_args_list
+    )
+
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_chat_completion_stream", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
+@patch("app.api.chat.get_plan_limits")
+@patch("app.api.chat.enforce_plan_limits", new_callable=AsyncMock)
+def test_chat_streaming_event_stream(mock_enforce, mock_get_limits, mock_embedding, mock_stream, mock_redis, client):
+    from app.core.plan_limits import PlanLimits
+    mock_get_limits.return_value = PlanLimits()
+    mock_redis.is_circuit_broken.return_value = False
+    mock_redis.get_cache.return_value = None
+    mock_embedding.return_value = [0.1] * 1536
+
+    mock_session = AsyncMock()
+    mock_result = MagicMock()
+    mock_chunk = MagicMock()
+    mock_chunk.content = "Some context"
+    mock_chunk.page_no = 2
+    mock_result.scalars.return_value.all.return_value = [mock_chunk]
+    mock_session.execute.return_value = mock_result
+
+    async def override_get_db():
+        yield mock_session
+    app.dependency_overrides[get_db] = override_get_db
+
+    async def mock_stream_generator():
+        for c in ["Hello", " world"]:
+            chunk = MagicMock()
+            chunk.choices = [MagicMock(delta=MagicMock(content=c))]
+            chunk.usage = None
+            yield chunk
+
+    mock_stream.return_value = mock_stream_generator()
+
+    with patch("app.tasks.background.persist_chat_response.delay"):
+        response = client.post(
+            "/v1/chat/",
+            json={"query": "Hi", "stream": True},
+            headers={"Accept": "text/event-stream"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+
+    names = [name for name, _ in events]
+    assert names == ["status", "sources", "status", "token", "token", "done"]
+    assert events[1][1]["sources"][0]["page_no"] == 2
+    assert "".join(d["text"] for n, d in events if n == "token") == "Hello world"
+    timings = events[-1][1]["timings"]
+    assert {"embedding_ms", "retrieval_ms", "llm_connect_ms", "first_token_ms"} <= set(timings)
+
+    app.dependency_overrides.pop(get_db, None)
+
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+def test_chat_streaming_early_exit_releases_credit_hold(mock_redis):
+    import anyio
+    from app.services.chat_service import chat_service
+
+    mock_redis.is_circuit_broken.return_value = True
+    tenant = create_mock_tenant()
+
+    async def run():
+        return [
+            token
+            async for token in chat_service.get_streaming_response(
+                db=AsyncMock(), tenant=tenant, query="Hi", credit_hold_id="hold-1",
+            )
+        ]
+
+    with patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock) as mock_settle, \
+            patch("app.tasks.background.persist_chat_response.delay") as mock_delay:
+        tokens = anyio.run(run)
+
+    assert tokens
+    mock_delay.assert_not_called()
+    mock_settle.assert_awaited_once_with(tenant.id, 0, "hold-1")
@@ -0,0 +1,27 @@
+import anyio
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.services.conversations import ConversationMap, upsert_conversation
+
+
+@patch("app.services.conversations.conversation_map", new_callable=ConversationMap)
+def test_follow_up_turns_skip_the_upsert(conversation_map):
+    tenant_id, conversation_id = uuid.uuid4(), uuid.uuid4()
+    db = AsyncMock()
+    db.execute.return_value = [SimpleNamespace(tenant_id=tenant_id, session_id="s1", id=conversation_id)]
+
+    assert anyio.run(upsert_conversation, db, tenant_id, "s1") == conversation_id
+    stmt = str(db.execute.await_args.args[0].compile(compile_kwargs={}))
+    assert "ON CONFLICT ON CONSTRAINT uq_conversations_tenant_session DO UPDATE" in stmt
+    assert "RETURNING" in stmt
+
+    # Remembered once the turn is committed
+    anyio.run(conversation_map.put_many, {(tenant_id, "s1"): conversation_id})
+    assert anyio.run(upsert_conversation, db, tenant_id, "s1") == conversation_id
+    assert db.execute.await_count == 1
+
+    anyio.run(conversation_map.forget, [(tenant_id, "s1")])
+    anyio.run(upsert_conversation, db, tenant_id, "s1")
+    assert db.execute.await_count == 2
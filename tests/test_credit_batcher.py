@@ -0,0 +1,99 @@
+import anyio
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.credit_batcher import credit_batcher
+
+
+def _charge(key, tenant_id, tokens, hold_id=None):
+    return {
+        "key": key,
+        "tenant_id": str(tenant_id),
+        "prompt_tokens": tokens,
+        "completion_tokens": 0,
+        "conversation_id": None,
+        "request_type": "chat",
+        "model": "gpt-4o-mini",
+        "hold_id": hold_id,
+    }
+
+
+def _db(ledgers, inserted, accepted, provision=False):
+    insert_result = MagicMock()
+    insert_result.all.return_value = inserted
+    db = AsyncMock()
+    db.execute.side_effect = [
+        [SimpleNamespace(tenant_id=t, id=l) for t, l in ledgers],
+        *([MagicMock()] if provision else []),
+        insert_result,
+        [SimpleNamespace(key=k) for k in accepted],
+        MagicMock(),
+    ]
+    return db
+
+
+@patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock)
+def test_batch_charges_each_ledger_once_and_skips_redeliveries(mock_settle):
+    tenant_id, ledger_id = uuid.uuid4(), uuid.uuid4()
+    charges = [
+        _charge("a", tenant_id, 1500, hold_id="h1"),
+        _charge("a", tenant_id, 1500, hold_id="h1"),  # redelivered in the same batch
+        _charge("b", tenant_id, 800),                  # already applied by an earlier flush
+    ]
+    # Only "a" is new: the insert skips "b" on its idempotency key
+    db = _db([(tenant_id, ledger_id)], [("a", ledger_id)], ["a"])
+
+    charged = anyio.run(credit_batcher.apply, db, charges)
+
+    assert charged == {"a": 2, "b": 0}
+    assert db.execute.await_count == 3
+    params = db.execute.await_args_list[2].args[1]
+    assert params == {"keys": ["a"], "ledger_ids": [ledger_id], "deltas": [2]}
+    db.commit.assert_awaited_once()
+    mock_settle.assert_any_await(tenant_id, 2, "h1")
+    mock_settle.assert_any_await(tenant_id, 0, None)
+
+
+@patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock)
+def test_batch_marks_charges_failed_when_ledger_would_overflow(mock_settle):
+    tenant_id, ledger_id = uuid.uuid4(), uuid.uuid4()
+    db = _db([(tenant_id, ledger_id)], [("a", ledger_id)], [])
+
+    charged = anyio.run(credit_batcher.apply, db, [_charge("a", tenant_id, 1000, hold_id="h1")])
+
+    assert charged == {"a": 0}
+    assert db.execute.await_args_list[3].args[1] == {"keys": ["a"]}
+    mock_settle.assert_awaited_once_with(tenant_id, 0, "h1")
+
+
+@patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock)
+def test_batch_refuses_only_the_charges_past_the_limit(mock_settle):
+    tenant_id, ledger_id = uuid.uuid4(), uuid.uuid4()
+    charges = [_charge(k, tenant_id, 1000) for k in ("a", "b", "c")]
+    # RETURNING comes back out of order; the ledger only fits "a" and "b"
+    db = _db([(tenant_id, ledger_id)], [("c", ledger_id), ("a", ledger_id), ("b", ledger_id)], ["a", "b"])
+
+    charged = anyio.run(credit_batcher.apply, db, charges)
+
+    assert charged == {"a": 1, "b": 1, "c": 0}
+    assert db.execute.await_args_list[2].args[1]["keys"] == ["a", "b", "c"]
+    assert db.execute.await_args_list[3].args[1] == {"keys": ["c"]}
+
+
+@patch("app.services.credit_counter.credit_counter.invalidate", new_callable=AsyncMock)
+@patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock)
+def test_batch_provisions_missing_ledgers_in_the_same_transaction(mock_settle, mock_invalidate):
+    tenant_id = uuid.uuid4()
+    db = _db([], [("a", uuid.uuid4())], ["a"], provision=True)
+    events = []
+    db.commit.side_effect = lambda: events.append("commit")
+    mock_invalidate.side_effect = lambda t: events.append("invalidate")
+
+    charged = anyio.run(credit_batcher.apply, db, [_charge("a", tenant_id, 1000)])
+
+    assert charged == {"a": 1}
+    assert db.execute.await_count == 4
+    assert events == ["commit", "invalidate"]
+    assert "credit_ledger" in str(db.execute.await_args_list[1].args[0])
+    mock_invalidate.assert_awaited_once_with(tenant_id)
@@ -0,0 +1,86 @@
+import anyio
+import uuid
+from unittest.mock import AsyncMock, patch
+from app.services.credit_counter import RESERVE_INSUFFICIENT, RESERVE_MISS
+from app.services.credit_service import charge_credits, has_sufficient_credits, reserve_credits
+
+
+@patch("app.services.credit_service.get_credit_balance", new_callable=AsyncMock)
+@patch("app.services.credit_counter.credit_counter.get", new_callable=AsyncMock)
+def test_gate_reads_counter_without_touching_ledger(mock_get, mock_balance):
+    mock_get.return_value = {"remaining": 0, "total": 500}
+    assert anyio.run(has_sufficient_credits, AsyncMock(), uuid.uuid4()) is False
+
+    mock_get.return_value = {"remaining": 12, "total": 500}
+    assert anyio.run(has_sufficient_credits, AsyncMock(), uuid.uuid4()) is True
+    mock_balance.assert_not_called()
+
+
+@patch("app.services.credit_counter.credit_counter.seed", new_callable=AsyncMock)
+@patch("app.services.credit_service.get_credit_balance", new_callable=AsyncMock)
+@patch("app.services.credit_counter.credit_counter.get", new_callable=AsyncMock, return_value=None)
+def test_counter_miss_is_rebuilt_from_ledger(mock_get, mock_balance, mock_seed):
+    tenant_id = uuid.uuid4()
+    mock_balance.return_value = {"credits_total": 100, "credits_used": 100, "credits_remaining": 0}
+
+    assert anyio.run(has_sufficient_credits, AsyncMock(), tenant_id) is False
+    mock_seed.assert_awaited_once_with(tenant_id, 100, 100)
+
+
+@patch("app.services.credit_counter.credit_counter.seed", new_callable=AsyncMock)
+@patch("app.services.credit_counter.credit_counter.reserve", new_callable=AsyncMock)
+def test_reservation_seeds_on_miss_then_holds(mock_reserve, mock_seed):
+    tenant_id = uuid.uuid4()
+    balance = {"credits_total": 100, "credits_used": 40, "credits_remaining": 60}
+    mock_reserve.side_effect = [RESERVE_MISS, 3]
+
+    ok, hold_id = anyio.run(reserve_credits, AsyncMock(), tenant_id, 3, 1, balance)
+    assert ok is True and hold_id
+    mock_seed.assert_awaited_once_with(tenant_id, 100, 40)
+    # Both attempts use the same hold id
+    assert mock_reserve.await_args_list[0].args[1] == mock_reserve.await_args_list[1].args[1] == hold_id
+
+
+@patch("app.services.credit_counter.credit_counter.reserve", new_callable=AsyncMock)
+def test_reservation_denied_when_credits_are_held(mock_reserve):
+    mock_reserve.return_value = RESERVE_INSUFFICIENT
+    assert anyio.run(reserve_credits, AsyncMock(), uuid.uuid4(), 3) == (False, None)
+
+
+@patch("app.services.credit_counter.credit_counter.settle", new_callable=AsyncMock)
+def test_zero_token_charge_releases_hold(mock_settle):
+    tenant_id = uuid.uuid4()
+    result = anyio.run(
+        lambda: charge_credits(AsyncMock(), tenant_id, 0, 0, hold_id="abc")
+    )
+    assert result == (0, True)
+    mock_settle.assert_awaited_once_with(tenant_id, 0, "abc")
+
+
+def test_holds_survive_counter_invalidation_without_negative_held():
+    import fakeredis
+    from app.services.credit_counter import _key, credit_counter
+    from app.utils.redis_client import redis_client
+
+    tenant_id = uuid.uuid4()
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        with patch.object(redis_client, "get_client", AsyncMock(return_value=client)):
+            await credit_counter.seed(tenant_id, 100, 0)
+            assert await credit_counter.reserve(tenant_id, "h1", 30, 1) == 30
+            # Top-up: the counter is dropped and rebuilt while h1 is outstanding
+            await credit_counter.invalidate(tenant_id)
+            await credit_counter.seed(tenant_id, 200, 0)
+            assert int(await client.hget(_key(tenant_id), "held")) == 30
+            # Only 170 are unreserved while h1 is held
+            assert await credit_counter.reserve(tenant_id, "h2", 500, 171) == RESERVE_INSUFFICIENT
+
+            await credit_counter.settle(tenant_id, 10, "h1")
+            held = int(await client.hget(_key(tenant_id), "held"))
+            remaining = int(await client.hget(_key(tenant_id), "remaining"))
+        return held, remaining
+
+    held, remaining = anyio.run(scenario)
+    assert held == 0
+    assert remaining == 190
@@ -0,0 +1,54 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.session import MeteredQueuePool, create_pooled_engine, create_unpooled_engine, pool_stats
+
+
+def test_pooled_engine_is_sized_and_metered():
+    engine = create_pooled_engine(pool_size=3, max_overflow=2, pool_recycle=600, pool_timeout=1.5)
+
+    assert isinstance(engine.pool, MeteredQueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._pre_ping
+    assert engine.pool._recycle == 600
+    assert engine.pool._timeout == 1.5
+    stats = pool_stats(engine)
+    assert stats["mode"] == "pooled"
+    assert stats["checked_out"] == 0
+    assert stats["max_overflow"] == 2
+
+
+def test_unpooled_engine_reports_null_mode():
+    assert pool_stats(create_unpooled_engine())["mode"] == "null"
+
+
+def test_checkout_waits_and_timeouts_are_recorded():
+    engine = create_pooled_engine(pool_size=1, max_overflow=0, pool_recycle=600)
+    pool = engine.pool
+    connection = MagicMock()
+
+    with patch.object(AsyncAdaptedQueuePool, "_do_get", return_value=connection):
+        assert pool._do_get() is connection
+    with patch.object(AsyncAdaptedQueuePool, "_do_get", side_effect=exc.TimeoutError("pool exhausted")):
+        with pytest.raises(exc.TimeoutError):
+            pool._do_get()
+
+    stats = pool_stats(engine)
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_ms"] >= stats["avg_wait_ms"] >= 0
+
+
+def test_external_pooler_disables_prepared_statement_caching():
+    with patch.object(settings, "DB_EXTERNAL_POOLER", False):
+        assert db_session._connect_args() == {"ssl": "require"}
+    with patch.object(settings, "DB_EXTERNAL_POOLER", True):
+        args = db_session._connect_args()
+    assert args["statement_cache_size"] == 0
+    assert args["prepared_statement_cache_size"] == 0
+    assert args["prepared_statement_name_func"]() != args["prepared_statement_name_func"]()
@@ -0,0 +1,63 @@
+import anyio
+import time
+import uuid
+from unittest.mock import patch, AsyncMock, MagicMock
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.db.models import Tenant
+import pytest
+
+
+def test_deadline_sub_budgets():
+    deadline = Deadline(10.0)
+    assert 9.0 < deadline.remaining() <= 10.0
+    # share of what's left, capped
+    assert deadline.timeout(cap=30.0, share=0.3) == pytest.approx(3.0, abs=0.1)
+    assert deadline.timeout(cap=2.0) == 2.0
+    # reserve is kept back for later stages
+    assert deadline.timeout(cap=30.0, reserve=4.0) == pytest.approx(6.0, abs=0.1)
+
+
+def test_deadline_expired_check():
+    deadline = Deadline(0.0)
+    assert deadline.expired
+    assert deadline.timeout(cap=30.0) == 0.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("embedding")
+
+
+def test_deadline_retry_helpers():
+    deadline = Deadline(2.0)
+    stop = deadline.retry_stop(reserve=1.0)
+    assert stop(None) is False
+    wait = deadline.retry_wait(lambda state: 5.0, reserve=1.0)
+    # back-off is clipped so the next attempt still has `reserve` seconds
+    assert wait(None) <= 1.0
+    assert Deadline(0.5).retry_stop(reserve=1.0)(None) is True
+
+
+@patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_chat_completion", new_callable=AsyncMock)
+@patch("app.services.chat_service.get_embedding", new_callable=AsyncMock)
+def test_get_response_degrades_when_budget_is_spent(mock_embedding, mock_completion, mock_redis):
+    from app.services.chat_service import chat_service
+
+    mock_redis.is_circuit_broken.return_value = False
+    mock_redis.get_cache.return_value = None
+    tenant = Tenant(id=uuid.uuid4(), name="Test Tenant")
+
+    async def run():
+        return await chat_service.get_response(
+            db=AsyncMock(),
+            tenant=tenant,
+            query="Hello",
+            deadline=Deadline(0.0),
+        )
+
+    started = time.monotonic()
+    answer, _, data = anyio.run(run)
+
+    assert time.monotonic() - started < 1.0
+    assert data["error"] == "deadline_exceeded"
+    assert "try again" in answer
+    mock_embedding.assert_not_called()
+    mock_completion.assert_not_called()
@@ -0,0 +1,30 @@
+from app.auth.domain_matcher import DomainMatcher
+
+
+def test_exact_and_wildcard_domains():
+    matcher = DomainMatcher.compile(["https://www.Example.com/path", "*.shop.io", "app.test:8080"])
+
+    assert matcher.patterns == ("example.com", "*.shop.io", "app.test")
+    assert matcher.matches("example.com")
+    assert matcher.matches("www.example.com")
+    assert not matcher.matches("blog.example.com")  # exact entries stay exact
+    assert matcher.matches("eu.shop.io")
+    assert matcher.matches("a.b.shop.io")
+    assert not matcher.matches("shop.io")  # wildcard does not admit the apex
+    assert not matcher.matches("evilshop.io")
+    assert matcher.matches("app.test")
+    assert not matcher.matches(None)
+
+
+def test_legacy_whitelist_admits_subdomains():
+    matcher = DomainMatcher.compile(["example.com"], include_subdomains=True)
+    assert matcher.matches("example.com")
+    assert matcher.matches("blog.example.com")
+    assert not matcher.matches("notexample.com")
+
+
+def test_many_domains():
+    matcher = DomainMatcher.compile([f"site{i}.example.org" for i in range(500)] + ["*.tenant.dev"])
+    assert matcher.matches("site499.example.org")
+    assert matcher.matches("x.tenant.dev")
+    assert not matcher.matches("site500.example.org")
@@ -0,0 +1,59 @@
+import anyio
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import Request
+from app.auth.api_key import require_tenant_api_key
+from app.core.plan_limits import PlanLimits
+
+
+def test_single_query_gate_loads_everything_in_one_round_trip(mocker):
+    tenant_id = uuid.uuid4()
+    key_id = uuid.uuid4()
+    row = {
+        "key_id": key_id,
+        "api_key_hash": "hashed_key",
+        "tenant_id": tenant_id,
+        "tenant_name": "Test Tenant",
+        "plan_id": uuid.uuid4(),
+        "is_trial": False,
+        "trial_ends_at": None,
+        "is_installed": True,
+        "domains": ["WWW.Example.com"],
+        "plan_features": {"model_limits": {"max_chunks_per_query": 7}},
+        "plan_updated_at": None,
+        "override_updated_at": datetime.now(timezone.utc),
+        "limits_override": {"max_tokens_per_request": 900, "max_chunks_per_query": None},
+        "credits_total": 100,
+        "credits_used": 40,
+    }
+
+    mocker.patch("app.auth.api_key.settings.TENANT_GATE_LOADER", "single")
+    mocker.patch("app.auth.api_key.settings.API_KEY_CACHE_SECRET", "test-secret")
+    mocker.patch("app.auth.api_key.verify_api_key", return_value=True)
+    mocker.patch("app.auth.api_key.func.now", return_value=None)
+
+    mock_db = AsyncMock()
+    mock_db.add = MagicMock()
+    gate_result = MagicMock()
+    gate_result.mappings.return_value.all.return_value = [row]
+    mock_db.execute.side_effect = [gate_result]
+
+    request = MagicMock(spec=Request)
+    request.headers = {"origin": "https://example.com"}
+
+    async def run():
+        return await require_tenant_api_key(request=request, asst_api_key="sk_live_123456789012", db=mock_db)
+
+    tenant, api_key = anyio.run(run)
+
+    assert mock_db.execute.call_count == 1
+    assert tenant.id == tenant_id
+    assert api_key.id == key_id
+    assert request.state.credit_balance["credits_remaining"] == 60
+    context = request.state.tenant_context
+    assert context.domains == ("example.com",)
+    assert isinstance(context.plan_limits, PlanLimits)
+    assert context.plan_limits.model_limits.max_chunks_per_query == 7
+    # Tenant override merged on top of the plan
+    assert context.plan_limits.model_limits.max_tokens_per_request == 900
@@ -0,0 +1,83 @@
+import anyio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.config import settings
+from app.services import history_partitions
+from app.services.history_partitions import add_months, partition_month, partition_name
+
+NOW = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+
+def _rows(*names):
+    return [SimpleNamespace(relname=name) for name in names]
+
+
+def _statements(db):
+    return [str(call.args[0]) for call in db.execute.await_args_list]
+
+
+def test_month_arithmetic_and_names():
+    month = datetime(2026, 11, 1, tzinfo=timezone.utc)
+    assert add_months(month, 2) == datetime(2027, 1, 1, tzinfo=timezone.utc)
+    assert add_months(month, -11) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert partition_name("llm_usage", month) == "llm_usage_p2026_11"
+    assert partition_month("llm_usage_p2026_11") == month
+    assert partition_month("llm_usage_unpartitioned") is None
+
+
+def test_missing_upcoming_partitions_are_created():
+    db = AsyncMock()
+    db.execute.side_effect = [_rows("messages_p2026_10", "messages_p2026_11"), None, None]
+
+    with patch.object(settings, "HISTORY_PARTITIONS_AHEAD", 2):
+        created = anyio.run(history_partitions.ensure_partitions, db, ["messages"], NOW)
+
+    assert created == ["messages_p2026_12"]
+    ddl = _statements(db)[1]
+    assert 'PARTITION OF "messages"' in ddl
+    assert "FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')" in ddl
+    db.commit.assert_awaited_once()
+
+
+def test_only_months_wholly_past_retention_are_dropped():
+    db = AsyncMock()
+    db.execute.side_effect = [
+        _rows("analytics_events_p2026_08", "analytics_events_p2026_06", "analytics_events_p2026_07"),
+        None, None,
+    ]
+
+    # 90 days before NOW is 2026-07-21: June has fully expired, July has not
+    dropped = anyio.run(history_partitions.drop_expired_partitions, db, ["analytics_events"], NOW, 90)
+
+    assert dropped == ["analytics_events_p2026_06"]
+    assert _statements(db)[1] == 'DROP TABLE IF EXISTS "analytics_events_p2026_06"'
+
+
+def test_cutoff_follows_the_longest_plan_retention():
+    db = AsyncMock()
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = [
+        {"analytics": {"retention_days": 30}},
+        {"analytics": {"retention_days": 365}},
+        None,
+    ]
+    db.execute.return_value = result
+
+    with patch.object(settings, "HISTORY_RETENTION_MIN_DAYS", 90):
+        assert anyio.run(history_partitions.longest_retention_days, db) == 365
+
+    result.scalars.return_value.all.return_value = [{"analytics": {"retention_days": 7}}]
+    with patch.object(settings, "HISTORY_RETENTION_MIN_DAYS", 30):
+        assert anyio.run(history_partitions.longest_retention_days, db) == 30
+
+
+def test_unmigrated_tables_are_left_alone():
+    db = AsyncMock()
+    db.execute.return_value = []
+
+    report = anyio.run(history_partitions.maintain_history_partitions, db, NOW)
+
+    assert report["tables"] == []
+    assert db.execute.await_count == 1
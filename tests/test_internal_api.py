@@ -4,6 +4,8 @@ from app.main import app
 from app.core.config import settings
 from unittest.mock import patch, AsyncMock
 
+TENANT_ID = "6f1c2a8e-3b4d-4e5f-9a0b-1c2d3e4f5a6b"
+
 @pytest.mark.asyncio
 async def test_invalidate_cache_success():
     """Test successful cache invalidation with correct header."""
@@ -12,20 +14,20 @@ async def test_invalidate_cache_success():
         with patch("app.services.widget_service.widget_service.invalidate_cache", new_callable=AsyncMock) as mock_invalidate:
             async with AsyncClient(app=app, base_url="http://test") as ac:
                 response = await ac.post(
-                    "/v1/internal/cache-invalidate?tenant_id=test-tenant",
+                    f"/v1/internal/cache-invalidate?tenant_id={TENANT_ID}",
                     headers={"INTERNAL_CACHE_HEADER": "test-secret"}
                 )
             
             assert response.status_code == 200
             assert response.json()["status"] == "success"
-            mock_invalidate.assert_called_once_with("test-tenant")
+            mock_invalidate.assert_called_once_with(TENANT_ID)
 
 @pytest.mark.asyncio
 async def test_invalidate_cache_unauthorized_missing_header():
     """Test 401 when header is missing."""
     with patch.object(settings, "INTERNAL_CACHE_HEADER", "test-secret"):
         async with AsyncClient(app=app, base_url="http://test") as ac:
-            response = await ac.post("/v1/internal/cache-invalidate?tenant_id=test-tenant")
+            response = await ac.post(f"/v1/internal/cache-invalidate?tenant_id={TENANT_ID}")
         
         assert response.status_code == 401
         assert response.json()["detail"] == "Unauthorized"
@@ -36,7 +38,7 @@ async def test_invalidate_cache_unauthorized_wrong_header():
     with patch.object(settings, "INTERNAL_CACHE_HEADER", "test-secret"):
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.post(
-                "/v1/internal/cache-invalidate?tenant_id=test-tenant",
+                f"/v1/internal/cache-invalidate?tenant_id={TENANT_ID}",
                 headers={"INTERNAL_CACHE_HEADER": "wrong-secret"}
             )
         
@@ -49,9 +51,25 @@ async def test_invalidate_cache_unauthorized_no_env_configured():
     with patch.object(settings, "INTERNAL_CACHE_HEADER", None):
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.post(
-                "/v1/internal/cache-invalidate?tenant_id=test-tenant",
+                f"/v1/internal/cache-invalidate?tenant_id={TENANT_ID}",
                 headers={"INTERNAL_CACHE_HEADER": "any-value"}
             )
         
         assert response.status_code == 401
         assert response.json()["detail"] == "Unauthorized"
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", [
+    "/v1/internal/cache-invalidate?tenant_id=*",
+    "/v1/internal/tenant-context-invalidate?tenant_id=test-tenant",
+    "/v1/internal/plan-limits-invalidate?plan_id=test-plan",
+])
+async def test_invalidation_rejects_ids_that_are_not_uuids(path):
+    """Test 422 before anything is invalidated when the id is not a UUID."""
+    with patch.object(settings, "INTERNAL_CACHE_HEADER", "test-secret"):
+        with patch("app.services.widget_service.widget_service.invalidate_cache", new_callable=AsyncMock) as mock_invalidate:
+            async with AsyncClient(app=app, base_url="http://test") as ac:
+                response = await ac.post(path, headers={"INTERNAL_CACHE_HEADER": "test-secret"})
+
+        assert response.status_code == 422
+        mock_invalidate.assert_not_called()
@@ -0,0 +1,51 @@
+import anyio
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.auth.key_usage import KeyUsageBuffer
+
+
+def _session_factory(session):
+    factory = MagicMock()
+    factory.return_value.__aenter__ = AsyncMock(return_value=session)
+    factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    return factory
+
+
+def test_key_usage_buffer_batches_latest_timestamp_per_key():
+    buffer = KeyUsageBuffer()
+    hot_key, other_key = uuid.uuid4(), uuid.uuid4()
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=5)
+
+    buffer.touch(hot_key)
+    latest = buffer.touch(hot_key)
+    buffer.touch(hot_key, earlier)  # out-of-order touch never moves it back
+    buffer.touch(other_key)
+
+    session = AsyncMock()
+    with patch("app.db.session.AsyncSessionLocal", _session_factory(session)):
+        written = anyio.run(buffer.flush)
+
+    assert written == 2
+    session.execute.assert_called_once()
+    params = session.execute.call_args.args[1]
+    used_at = dict(zip(params["key_ids"], params["used_at"]))
+    assert used_at[hot_key] == latest
+    session.commit.assert_called_once()
+    # Nothing left to write
+    assert anyio.run(buffer.flush) == 0
+
+
+def test_key_usage_buffer_keeps_timestamps_when_flush_fails():
+    buffer = KeyUsageBuffer()
+    key_id = uuid.uuid4()
+    buffer.touch(key_id)
+
+    session = AsyncMock()
+    session.execute.side_effect = RuntimeError("db down")
+    with patch("app.db.session.AsyncSessionLocal", _session_factory(session)):
+        assert anyio.run(buffer.flush) == 0
+
+    ok_session = AsyncMock()
+    with patch("app.db.session.AsyncSessionLocal", _session_factory(ok_session)):
+        assert anyio.run(buffer.flush) == 1
@@ -0,0 +1,72 @@
+import random
+import pytest
+from app.prompt.builder import PromptBuilder
+
+builder = PromptBuilder()
+URL = PromptBuilder.BOOKING_URL
+
+
+def stream_through_guard(text, chunk_sizes):
+    guard = builder.output_guard()
+    out = []
+    pos = 0
+    for size in chunk_sizes:
+        out.append(guard.feed(text[pos:pos + size]))
+        pos += size
+    out.append(guard.feed(text[pos:]))
+    out.append(guard.flush())
+    return "".join(out)
+
+
+@pytest.mark.parametrize("raw", [
+    "Hello! How can I help you today?",
+    f"You can book a call at {URL} any time.",
+    f"Book here: {URL}\nOr here: {URL}",
+    f"👉 Book here: {URL}",
+    f"<a href='{URL}'>Book</a>",
+    f"<a href='{URL}' class='booking-link'>Book</a> or <a href='/faq'>read the FAQ</a>",
+    f"Book at {URL} or see <a href='/faq'>the FAQ</a>",
+    f"<a href='{URL}' class='booking-link'>Book</a> now 👉",
+    f"Book at {URL} 👉 today",
+    "<abbr>FAQ</abbr> then class='booking-link'",
+    "Use the <b>pricing</b> page, a < b, and 5 <3",
+    URL[:20] + " is not the full link",
+])
+def test_streamed_output_matches_non_streamed(raw):
+    expected = builder.enforce_output_rules(raw)
+
+    # One token at a time, and random chunkings
+    assert stream_through_guard(raw, [1] * len(raw)) == expected
+    rng = random.Random(raw)
+    for _ in range(20):
+        sizes = [rng.randint(1, 12) for _ in range(len(raw) // 3)]
+        assert stream_through_guard(raw, sizes) == expected
+
+
+def test_plain_text_is_not_held_back():
+    guard = builder.output_guard()
+    assert guard.feed("Hello") == "Hello"
+    assert guard.feed(" world") == " world"
+
+
+def test_holds_back_only_possible_pattern_prefix():
+    guard = builder.output_guard()
+    assert guard.feed("Visit https://rakri") == "Visit "
+    assert guard.feed("site.com") == "https://rakrisite.com"
+    assert guard.feed(" a <") == " a "
+    assert guard.flush() == "<"
+
+
+def test_holds_back_from_an_undecided_link_until_the_rules_are_known():
+    guard = builder.output_guard()
+    assert guard.feed(f"Book at {URL}") == "Book at "
+    # A later anchor would still cancel the rewrite
+    assert guard.feed(" today.") == ""
+    assert guard.flush() == builder.enforce_output_rules(f"Book at {URL} today.")[len("Book at "):]
+
+    guard = builder.output_guard()
+    assert guard.feed("<a href='/faq'>FAQ</a> ") == ""
+    # Once the emoji is present anchors stay as they are
+    assert guard.feed("👉 more") == "<a href='/faq'>FAQ</a> 👉 more"
+    assert guard.feed(f" {URL}") == f" {URL}"
+    assert guard.flush() == ""
@@ -0,0 +1,70 @@
+import anyio
+import dataclasses
+import uuid
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from app.core.plan_limits import PlanLimits, get_plan_limits, plan_limits_cache
+from app.db.models import Tenant, TenantLimitsOverride
+
+
+def test_plan_limits_are_frozen():
+    limits = PlanLimits.from_features({"model_limits": {"allowed_models": ["gpt-4o"]}})
+    assert limits.model_limits.allowed_models == ("gpt-4o",)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        limits.model_limits.max_chunks_per_query = 50
+
+
+@patch("app.utils.redis_client.redis_client.get_str", new_callable=AsyncMock, return_value=None)
+def test_get_plan_limits_parses_once_per_version_and_applies_overrides(mock_get_str):
+    plan_id = uuid.uuid4()
+    tenant = Tenant(id=uuid.uuid4(), name="T", plan_id=plan_id)
+
+    features_result = MagicMock()
+    features_result.scalar_one_or_none.return_value = {"model_limits": {"max_chunks_per_query": 8}}
+    override_result = MagicMock()
+    override_result.scalars.return_value.first.return_value = TenantLimitsOverride(
+        tenant_id=tenant.id, max_chunks_per_query=3
+    )
+
+    db = AsyncMock()
+    db.execute.side_effect = [features_result, override_result]
+    first = anyio.run(get_plan_limits, tenant, db, 7)
+    assert first.model_limits.max_chunks_per_query == 3
+    assert first.model_limits.max_tokens_per_request == 500
+
+    # Same tenant context version: no query at all, the parsed object is shared
+    db = AsyncMock()
+    assert anyio.run(get_plan_limits, tenant, db, 7) is first
+    db.execute.assert_not_awaited()
+
+    # An override change bumps the version
+    db = AsyncMock()
+    db.execute.side_effect = [features_result, override_result]
+    assert anyio.run(get_plan_limits, tenant, db, 8) is not first
+    assert db.execute.await_count == 2
+
+
+@patch("app.auth.tenant_context.tenant_context_cache.current_version", new_callable=AsyncMock, return_value=None)
+def test_get_plan_limits_is_not_cached_without_redis(mock_version):
+    tenant = Tenant(id=uuid.uuid4(), name="T", plan_id=None)
+    override_result = MagicMock()
+    override_result.scalars.return_value.first.return_value = None
+
+    for _ in range(2):
+        db = AsyncMock()
+        db.execute.side_effect = [override_result]
+        assert anyio.run(get_plan_limits, tenant, db) == PlanLimits()
+        db.execute.assert_awaited_once()
+
+
+def test_unset_override_columns_keep_the_plan_values():
+    from app.core.plan_limits import OVERRIDE_FIELDS
+
+    columns = TenantLimitsOverride.__table__.c
+    for name in OVERRIDE_FIELDS:
+        assert columns[name].nullable and columns[name].default is None, name
+
+    plan = PlanLimits.from_features({"model_limits": {"max_tokens_per_request": 3000}})
+    limits = plan.with_overrides({"max_files": 10, "max_tokens_per_request": None})
+    assert limits.model_limits.max_tokens_per_request == 3000
+    assert limits.knowledge_base.max_files == 10
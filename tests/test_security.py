@@ -0,0 +1,62 @@
+import anyio
+import threading
+import pytest
+from app.core.security import BoundedVerifier, VerifierSaturated
+
+
+def test_bounded_verifier_rejects_when_saturated():
+    verifier = BoundedVerifier(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    def slow_verify(api_key, hashed):
+        release.wait(timeout=5)
+        return True
+
+    async def run():
+        results = {}
+
+        async def first():
+            results["first"] = await verifier.run(slow_verify, "k", "h")
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(first)
+            await anyio.sleep(0.05)
+            # Pool is busy and has no queue slots: rejected immediately
+            with pytest.raises(VerifierSaturated):
+                await verifier.run(slow_verify, "k", "h")
+            release.set()
+        return results
+
+    results = anyio.run(run)
+    assert results["first"] is True
+    stats = verifier.stats()
+    assert stats["verified"] == 1
+    assert stats["rejected"] == 1
+    assert stats["pending"] == 0
+    verifier.shutdown()
+
+
+def test_cancelled_caller_keeps_its_slot_until_the_job_ends():
+    verifier = BoundedVerifier(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    def slow_verify(api_key, hashed):
+        release.wait(timeout=5)
+        return True
+
+    async def run():
+        with anyio.move_on_after(0.05):
+            await verifier.run(slow_verify, "k", "h")
+        # The caller gave up, but argon2 is still running on the pool
+        assert verifier.stats()["pending"] == 1
+        with pytest.raises(VerifierSaturated):
+            await verifier.run(slow_verify, "k", "h")
+        release.set()
+        for _ in range(100):
+            if verifier.stats()["pending"] == 0:
+                break
+            await anyio.sleep(0.01)
+
+    anyio.run(run)
+    assert verifier.stats()["pending"] == 0
+    verifier.shutdown()
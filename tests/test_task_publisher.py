@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import time
+
+import anyio
+from unittest.mock import MagicMock, patch
+
+from app.core.config import settings
+from app.tasks.publisher import TaskPublisher
+
+
+def test_queued_calls_are_published_in_batches(tmp_path):
+    publisher = TaskPublisher()
+    batches = []
+
+    async def scenario():
+        with patch.object(TaskPublisher, "_publish", side_effect=lambda batch: batches.append(list(batch))):
+            publisher.start()
+            for i in range(5):
+                publisher.submit("persist_chat_response", {"n": i})
+            await anyio.sleep(0.05)
+            await publisher.stop()
+
+    with patch.object(settings, "TASK_SPILL_DIR", str(tmp_path)):
+        anyio.run(scenario)
+
+    assert [kwargs["n"] for batch in batches for _, kwargs, _ in batch] == [0, 1, 2, 3, 4]
+    assert len({task_id for batch in batches for _, _, task_id in batch}) == 5
+    assert len(batches) < 5
+    assert publisher.stats()["published"] == 5
+
+
+def test_broker_outage_spills_to_disk_and_replays(tmp_path):
+    publisher = TaskPublisher()
+    failing = MagicMock(side_effect=ConnectionError("broker down"))
+    published = []
+
+    async def scenario():
+        with patch.object(TaskPublisher, "_publish", failing):
+            assert await publisher._publish_or_spill([("persist_chat_response", {"n": 1}, "id-1")]) is False
+            # Broker marked down: later calls go straight to disk
+            assert await publisher._publish_or_spill([("persist_chat_response", {"n": 2}, "id-2")]) is False
+        assert failing.call_count == 1
+        assert len(list(tmp_path.glob("spill-*.jsonl"))) == 2
+
+        with patch.object(TaskPublisher, "_publish", side_effect=lambda batch: published.extend(batch)):
+            assert await publisher.replay() == 2
+
+    with patch.object(settings, "TASK_SPILL_DIR", str(tmp_path)):
+        anyio.run(scenario)
+
+    # Replayed calls keep their task ids (the tasks' idempotency keys)
+    assert sorted((kwargs["n"], task_id) for _, kwargs, task_id in published) == [(1, "id-1"), (2, "id-2")]
+    assert not list(tmp_path.iterdir())
+    stats = publisher.stats()
+    assert stats["spilled"] == 2 and stats["replayed"] == 2 and stats["publish_errors"] == 1
+
+
+def test_overflow_is_spilled_off_the_event_loop(tmp_path):
+    publisher = TaskPublisher()
+
+    async def scenario():
+        with patch.object(settings, "TASK_PUBLISH_QUEUE_SIZE", 1), \
+                patch.object(TaskPublisher, "_publish", side_effect=ConnectionError("broker down")), \
+                patch("app.tasks.publisher.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            publisher.start()
+            assert publisher.submit("persist_chat_response", {"n": 1}) is True
+            assert publisher.submit("persist_chat_response", {"n": 2}) is False
+            await publisher.stop()
+        assert any(call.args[0] == publisher._write_spill for call in to_thread.call_args_list)
+
+    with patch.object(settings, "TASK_SPILL_DIR", str(tmp_path)):
+        anyio.run(scenario)
+
+    spilled = [json.loads(line) for path in tmp_path.glob("spill-*.jsonl") for line in path.read_text().splitlines()]
+    assert sorted(entry["kwargs"]["n"] for entry in spilled) == [1, 2]
+    assert all(entry["task_id"] for entry in spilled)
+
+
+def test_abandoned_replay_claims_are_recovered(tmp_path):
+    publisher = TaskPublisher()
+    abandoned = tmp_path / "spill-1-abc.jsonl.replaying-999"
+    abandoned.write_text(json.dumps({"task": "persist_chat_response", "kwargs": {"n": 1}, "task_id": "id-1"}) + "\n")
+    os.utime(abandoned, (time.time() - 3600, time.time() - 3600))
+    fresh = tmp_path / "spill-2-def.jsonl.replaying-998"
+    fresh.write_text(json.dumps({"task": "persist_chat_response", "kwargs": {"n": 2}, "task_id": "id-2"}) + "\n")
+    published = []
+
+    async def scenario():
+        with patch.object(TaskPublisher, "_publish", side_effect=lambda batch: published.extend(batch)):
+            assert await publisher.replay() == 1
+
+    with patch.object(settings, "TASK_SPILL_DIR", str(tmp_path)):
+        anyio.run(scenario)
+
+    assert published == [("persist_chat_response", {"n": 1}, "id-1")]
+    # A claim still within TASK_SPILL_CLAIM_TIMEOUT_S belongs to a live replay
+    assert [p.name for p in tmp_path.iterdir()] == [fresh.name]
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.config import settings
+from app.tasks.runtime import TaskRuntime
+
+
+def test_persistent_mode_reuses_one_loop_and_session_factory():
+    engine = MagicMock()
+    engine.dispose = AsyncMock()
+    runtime = TaskRuntime()
+
+    async def body(sessions):
+        return asyncio.get_running_loop(), sessions, threading.current_thread()
+
+    with patch.object(settings, "CELERY_TASK_LOOP", "persistent"), \
+         patch("app.db.session.create_pooled_engine", return_value=engine) as mock_create:
+        first = runtime.run(body)
+        second = runtime.run(body)
+        runtime.shutdown()
+
+    assert first[0] is second[0]
+    assert first[1] is second[1]
+    assert first[2] is not threading.current_thread()
+    mock_create.assert_called_once()
+    engine.dispose.assert_awaited_once()
+    assert first[0].is_closed()
+
+
+def test_per_task_mode_uses_a_fresh_loop_each_time():
+    runtime = TaskRuntime()
+
+    async def body(sessions):
+        return asyncio.get_running_loop()
+
+    with patch.object(settings, "CELERY_TASK_LOOP", "per_task"):
+        assert runtime.run(body) is not runtime.run(body)
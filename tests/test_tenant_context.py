@@ -0,0 +1,155 @@
+import anyio
+import dataclasses
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi import Request
+from app.auth.api_key import require_tenant_api_key
+from app.auth.tenant_context import TenantContext, tenant_context_cache
+from app.core.plan_limits import PlanLimits
+from app.db.models import Tenant, ApiKey, TenantConfig
+from app.utils.redis_client import redis_client
+from app.core.config import settings
+
+
+def _db_for(tenant, api_key, domain):
+    mock_db = AsyncMock()
+    mock_result_api = MagicMock()
+    mock_result_api.scalars.return_value.all.return_value = [api_key]
+    mock_result_tenant = MagicMock()
+    mock_result_tenant.scalars.return_value.first.return_value = tenant
+    mock_result_config = MagicMock()
+    mock_result_config.scalars.return_value.all.return_value = [
+        TenantConfig(id=uuid.uuid4(), tenant_id=tenant.id, domain=domain)
+    ]
+    mock_db.execute.side_effect = [mock_result_api, mock_result_tenant, mock_result_config]
+    return mock_db
+
+
+def test_tenant_context_roundtrip():
+    context = TenantContext(
+        key_digest="d",
+        key_id=uuid.uuid4(),
+        tenant_id=uuid.uuid4(),
+        version=2,
+        tenant_name="Acme",
+        plan_id=None,
+        is_trial=True,
+        trial_ends_at=datetime(2030, 1, 1, tzinfo=timezone.utc),
+        is_installed=True,
+        domains=("example.com",),
+        plan_limits=PlanLimits.from_features({"model_limits": {"max_chunks_per_query": 9}}),
+    )
+    restored = TenantContext.from_dict(context.to_dict())
+    assert restored == context
+    assert restored.plan_limits.model_limits.max_chunks_per_query == 9
+
+
+def test_warm_auth_needs_no_queries_until_invalidated(mocker):
+    tenant_id = uuid.uuid4()
+    tenant = Tenant(id=tenant_id, name="Test Tenant", is_trial=False, is_installed=True)
+    api_key = ApiKey(id=uuid.uuid4(), tenant_id=tenant_id, is_active=True,
+                     api_key_hash="hashed_key", key_prefix="sk_live_1234")
+
+    mocker.patch.object(settings, "API_KEY_CACHE_SECRET", "test-secret")
+    mocker.patch("app.auth.api_key.verify_api_key", return_value=True)
+    mocker.patch("app.auth.api_key.func.now", return_value=None)
+    version = {"value": "3"}
+    client = MagicMock()
+    client.get = AsyncMock(side_effect=lambda key: version["value"])
+    mocker.patch.object(redis_client, "get_client", AsyncMock(return_value=client))
+    mocker.patch.object(redis_client, "get_str", AsyncMock(return_value=None))
+    mocker.patch.object(redis_client, "get_cache", AsyncMock(return_value=None))
+    mocker.patch.object(redis_client, "set_cache", AsyncMock())
+    mocker.patch.object(redis_client, "set_str", AsyncMock())
+    mocker.patch.object(redis_client, "incr", AsyncMock(return_value=4))
+
+    request = MagicMock(spec=Request)
+    request.headers = {"origin": "https://example.com"}
+
+    async def call(db):
+        return await require_tenant_api_key(request=request, asst_api_key="sk_live_123456789012", db=db)
+
+    try:
+        cold_db = _db_for(tenant, api_key, "example.com")
+        anyio.run(call, cold_db)
+        assert cold_db.execute.call_count == 3
+
+        warm_db = AsyncMock()
+        warm_tenant, warm_key = anyio.run(call, warm_db)
+        assert warm_db.execute.call_count == 0
+        assert warm_tenant.id == tenant_id
+        assert warm_key.id == api_key.id
+
+        version["value"] = "4"
+        anyio.run(tenant_context_cache.invalidate, str(tenant_id))
+        after_db = _db_for(tenant, api_key, "example.com")
+        anyio.run(call, after_db)
+        assert after_db.execute.call_count == 3
+    finally:
+        tenant_context_cache.clear_local()
+
+
+def _context(version=1):
+    return TenantContext(
+        key_digest="d", key_id=uuid.uuid4(), tenant_id=uuid.uuid4(), version=version,
+        tenant_name="Acme", plan_id=None, is_trial=False, trial_ends_at=None, is_installed=True,
+    )
+
+
+def test_failed_version_read_is_not_version_zero(mocker):
+    client = MagicMock()
+    client.get = AsyncMock(side_effect=ConnectionError("down"))
+    mocker.patch.object(redis_client, "get_client", AsyncMock(return_value=client))
+    assert anyio.run(tenant_context_cache.current_version, uuid.uuid4()) is None
+
+    context = _context(version=0)
+    mocker.patch.object(redis_client, "get_cache", AsyncMock(return_value=context.to_dict()))
+    try:
+        assert anyio.run(tenant_context_cache.get, "d") is None
+    finally:
+        tenant_context_cache.clear_local()
+
+
+def test_local_copy_needs_redis_snapshot_after_max_age(mocker):
+    context = _context()
+    client = MagicMock()
+    client.get = AsyncMock(return_value="1")
+    mocker.patch.object(redis_client, "get_client", AsyncMock(return_value=client))
+    mocker.patch.object(redis_client, "set_cache", AsyncMock())
+    get_cache = mocker.patch.object(redis_client, "get_cache", AsyncMock(return_value=None))
+    clock = mocker.patch("app.auth.tenant_context.time.monotonic", return_value=1000.0)
+    try:
+        anyio.run(tenant_context_cache.put, context)
+        # Revalidated against the version stamp without touching the snapshot
+        clock.return_value = 1000.0 + settings.TENANT_CONTEXT_LOCAL_TTL_S + 1
+        assert anyio.run(tenant_context_cache.get, "d") == context
+        get_cache.assert_not_awaited()
+
+        # Past the max age the snapshot must still exist in Redis
+        clock.return_value = 1000.0 + settings.TENANT_CONTEXT_LOCAL_MAX_AGE_S + 1
+        assert anyio.run(tenant_context_cache.get, "d") is None
+        get_cache.assert_awaited_once()
+    finally:
+        tenant_context_cache.clear_local()
+
+
+def test_local_copies_are_bounded_least_recently_used_first(mocker):
+    mocker.patch.object(settings, "TENANT_CONTEXT_LOCAL_SIZE", 2)
+    mocker.patch.object(redis_client, "set_cache", AsyncMock())
+    get_cache = mocker.patch.object(redis_client, "get_cache", AsyncMock(return_value=None))
+    contexts = {d: dataclasses.replace(_context(), key_digest=d) for d in ("a", "b", "c")}
+    try:
+        anyio.run(tenant_context_cache.put, contexts["a"])
+        anyio.run(tenant_context_cache.put, contexts["b"])
+        assert anyio.run(tenant_context_cache.get, "a") == contexts["a"]
+        anyio.run(tenant_context_cache.put, contexts["c"])
+
+        # "b" was the least recently used: only it falls back to Redis
+        assert anyio.run(tenant_context_cache.get, "a") == contexts["a"]
+        assert anyio.run(tenant_context_cache.get, "c") == contexts["c"]
+        get_cache.assert_not_awaited()
+        assert anyio.run(tenant_context_cache.get, "b") is None
+        get_cache.assert_awaited_once()
+    finally:
+        tenant_context_cache.clear_local()
@@ -31,13 +31,13 @@ async def mock_auth():
 # Override auth for all tests in this file
 app.dependency_overrides[require_tenant_api_key] = mock_auth
 
-@patch("app.api.widget.check_usage")
+@patch("app.api.widget.check_access")
 @patch("app.utils.redis_client.redis_client", new_callable=AsyncMock)
-def test_get_widget_config_success(mock_redis, mock_check_usage, client: TestClient):
+def test_get_widget_config_success(mock_redis, mock_check_access, client: TestClient):
     # Mock plan limits
     from app.core.plan_limits import PlanLimits
     limits = PlanLimits.from_features({})
-    mock_check_usage.return_value = (create_mock_tenant(), create_mock_api_key(), limits)
+    mock_check_access.return_value = (create_mock_tenant(), create_mock_api_key(), limits)
     
     # Mock redis (cache miss)
     mock_redis.get_cache.return_value = None
@@ -61,11 +61,11 @@ def test_get_widget_config_success(mock_redis, mock_check_usage, client: TestCli
     async def override_get_db():
         yield mock_session
     
-    from app.api.chat import check_usage
-    async def override_check_usage():
+    from app.api.chat import check_access
+    async def override_check_access():
         return create_mock_tenant(), create_mock_api_key(), limits
     
-    app.dependency_overrides[check_usage] = override_check_usage
+    app.dependency_overrides[check_access] = override_check_access
     app.dependency_overrides[get_db] = override_get_db
     
     response = client.get(